@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Compare serial and thread pool evaluation of independent props
+# Run with: python benchmarks/bench_executor.py [width] [size] [threads]
+import numpy as np
+from context import gradcache
+from harness import int_args, timed, report
+
+store = gradcache.store
+
+
+def build_store(threads, width, size):
+    """width independent array props feeding a single sum"""
+    the_store = store(default_cache_size=1, threads=threads)
+    x = np.linspace(0.0, 1.0, size)
+
+    def component(p):
+        return np.sum(np.exp(-x * p) * np.sin(x * p) ** 2)
+
+    def total(*args):
+        res = 0.0
+        for a in args:
+            res = res + a
+        return res
+
+    names = ["c" + str(j) for j in range(width)]
+    for name in names:
+        the_store.add_prop(name, ["p"], component)
+    the_store.add_prop("total", names, total)
+    the_store.initialize()
+    return the_store
+
+
+def main(width=16, size=2000000, threads=8):
+    results = dict()
+    for t in [None, threads]:
+        the_store = build_store(t, width, size)
+        the_store.get_prop("total", {"p": 0.5})
+        # Every call misses every prop
+        results[t] = timed(lambda k: the_store.get_prop("total", {"p": 1.0 + k}), 5)[0]
+        the_store.set_threads(None)
+    report(
+        "%d props of %d elements" % (width, size),
+        ("serial", results[None]),
+        ("%d threads" % threads, results[threads]),
+    )
+
+
+if __name__ == "__main__":
+    main(*int_args())
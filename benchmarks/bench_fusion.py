@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Compare fused and unfused evaluation of a per event weight expression
+# Run with: python benchmarks/bench_fusion.py [events] [gradients] [iterations]
+import numpy as np
+from context import gradcache
+from harness import int_args, timed, report
+
+parameter_wrapper = gradcache.parameter_wrapper
+trace = gradcache.trace
+
+
+def main(nevents=1000000, ngrads=4, iterations=5):
+    rng = np.random.default_rng(1)
+    flux = rng.uniform(0.5, 1.5, nevents)
+    xs = rng.uniform(1.0, 2.0, nevents)
+
+    def weight(norm, gamma, sys):
+        return norm * flux ** gamma * xs / (1.0 + sys)
+
+    names = ["g" + str(i) for i in range(ngrads)]
+    args = [
+        parameter_wrapper("norm", 2.0, grads=names, grad_values=np.eye(ngrads)[0]),
+        parameter_wrapper("gamma", -1.5, grads=names, grad_values=np.eye(ngrads)[1]),
+        parameter_wrapper(
+            "sys",
+            rng.uniform(0.0, 0.1, nevents),
+            grads=names,
+            grad_values=rng.uniform(0.0, 1.0, (nevents, ngrads)),
+        ),
+    ]
+    results = dict()
+    for fuse_chains in [False, True]:
+        t = trace.trace_function("weight", ["norm", "gamma", "sys"], weight, fuse_chains=fuse_chains)
+        t(*args)
+        results[fuse_chains] = timed(lambda k: t(*args), iterations)
+    assert np.allclose(results[False][1].grad_values, results[True][1].grad_values)
+    report(
+        "%d events, %d gradients" % (nevents, ngrads),
+        ("unfused", results[False][0]),
+        ("fused", results[True][0]),
+    )
+
+
+if __name__ == "__main__":
+    main(*int_args())
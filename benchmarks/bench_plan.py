@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Compare the compiled evaluation plans with the recursive evaluation of props
+# Run with: python benchmarks/bench_plan.py [layers] [width]
+from context import gradcache
+from harness import int_args, timed, report
+
+store = gradcache.store
+
+
+def build_store(compile_plans, layers, width, nparams=8):
+    """A layered graph of small props, each depending on two props of the
+    previous layer and on one physical parameter"""
+    the_store = store(default_cache_size=2, compile_plans=compile_plans)
+
+    def leaf(p):
+        return 1.0 * p
+
+    def node(x, y, p):
+        return x * 0.5 + y * 0.5 + p
+
+    def root(*args):
+        res = 0.0
+        for a in args:
+            res = res + a
+        return res
+
+    params = ["p" + str(i) for i in range(nparams)]
+    for j in range(width):
+        the_store.add_prop("l0_" + str(j), [params[j % nparams]], leaf)
+    for i in range(1, layers):
+        for j in range(width):
+            deps = [
+                "l" + str(i - 1) + "_" + str(j),
+                "l" + str(i - 1) + "_" + str((j + 1) % width),
+                params[(i + j) % nparams],
+            ]
+            the_store.add_prop("l" + str(i) + "_" + str(j), deps, node)
+    the_store.add_prop("root", ["l" + str(layers - 1) + "_" + str(j) for j in range(width)], root)
+    the_store.initialize()
+    return the_store, params
+
+
+def time_calls(the_store, param_sets, repeat):
+    """Mean time of one call, cycling through the parameter sets"""
+    n = len(param_sets)
+    return timed(lambda k: the_store.get_prop("root", param_sets[k % n]), repeat * n)[0]
+
+
+def main(layers=10, width=20):
+    print("props:", layers * width + 1)
+    # With a cache size of 2, cycling through 3 values of one parameter makes
+    # every prop depending on it miss
+    for label, nsets in [("all hits", 1), ("one parameter changes", 3)]:
+        results = dict()
+        for compile_plans in [False, True]:
+            the_store, params = build_store(compile_plans, layers, width)
+            param_sets = []
+            for k in range(nsets):
+                p = dict([(name, 1.0) for name in params])
+                p[params[0]] = 1.0 + k
+                param_sets.append(p)
+            time_calls(the_store, param_sets, 5)
+            results[compile_plans] = time_calls(the_store, param_sets, 200)
+        report("%-24s" % label, ("recursive", results[False]), ("compiled", results[True]), unit="us")
+
+
+if __name__ == "__main__":
+    main(*int_args())
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Count the arrays allocated per evaluation with and without the buffer pool
+# Run with: python benchmarks/bench_pool.py [events] [parameters] [iterations]
+import tracemalloc
+import numpy as np
+from context import gradcache
+from harness import int_args, timed
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+def build_store(nevents, nparams, buffer_pool):
+    rng = np.random.default_rng(1)
+    columns = [rng.uniform(0.5, 1.5, nevents) for _ in range(nparams)]
+    data = rng.uniform(0.5, 1.5, nevents)
+    names = ["p" + str(i) for i in range(nparams)]
+
+    def weight(*params):
+        res = 1.0
+        for p, c in zip(params, columns):
+            res = res + p * c
+        return res
+
+    def llh(weight):
+        r = weight - data
+        return r * r
+
+    the_store = store(default_cache_size=1, buffer_pool=buffer_pool)
+    the_store.add_prop("weight", names, weight)
+    the_store.add_prop("llh", ["weight"], llh)
+    the_store.initialize()
+    return the_store, names
+
+
+def seeds(names, x):
+    n = len(names)
+    return dict(
+        [(name, parameter_wrapper(name, x, grads=names, grad_values=np.eye(n)[i])) for i, name in enumerate(names)]
+    )
+
+
+def main(nevents=20000, nparams=10, iterations=20):
+    for buffer_pool in [False, True]:
+        the_store, names = build_store(nevents, nparams, buffer_pool)
+        # Warm up, the first iteration fills the pool
+        the_store.get_prop("llh", seeds(names, 0.0))
+        elapsed, _ = timed(lambda k: the_store.get_prop("llh", seeds(names, 0.1 * (k + 1))), iterations)
+        # Tracing slows the evaluation down, the peak is measured separately
+        tracemalloc.start()
+        the_store.get_prop("llh", seeds(names, -1.0))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line = "buffer_pool=%-5s  %8.2f ms/iteration   traced peak: %8.1f MB" % (
+            buffer_pool,
+            elapsed * 1e3,
+            peak / 1e6,
+        )
+        if buffer_pool:
+            p = the_store.buffer_pool
+            line += "   pool allocations/iteration: %.1f   reuses/iteration: %.1f" % (
+                p.allocations / (iterations + 2),
+                p.reuses / (iterations + 2),
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main(*int_args())
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Compare forward and reverse mode gradients of a scalar likelihood
+# Run with: python benchmarks/bench_reverse.py [events] [parameters]
+import numpy as np
+from context import gradcache
+from harness import int_args, timed, report
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+def build_store(nevents, nparams):
+    rng = np.random.default_rng(1)
+    columns = [rng.uniform(0.5, 1.5, nevents) for _ in range(nparams)]
+    data = rng.uniform(0.5, 1.5, nevents)
+    names = ["p" + str(i) for i in range(nparams)]
+
+    def weight(*params):
+        res = 1.0
+        for p, c in zip(params, columns):
+            res = res + p * c
+        return res
+
+    def llh(weight):
+        r = weight - data
+        return (r * r).sum()
+
+    the_store = store(default_cache_size=1)
+    the_store.add_prop("weight", names, weight)
+    the_store.add_prop("llh", ["weight"], llh)
+    the_store.initialize()
+    return the_store, names
+
+
+def main(nevents=100000, nparams=50):
+    results = dict()
+    for mode in ["forward", "reverse"]:
+        the_store, names = build_store(nevents, nparams)
+
+        def call(k):
+            params = dict(
+                [(n, parameter_wrapper(n, 0.1 * (k + 1), grads=[n], grad_values=[1.0])) for n in names]
+            )
+            return the_store.get_prop("llh", params, mode=mode)
+
+        results[mode] = timed(call, 3)
+    assert np.allclose(results["forward"][1].grad_values, results["reverse"][1].grad_values)
+    report(
+        "%d events, %d parameters" % (nevents, nparams),
+        ("forward", results["forward"][0]),
+        ("reverse", results["reverse"][0]),
+    )
+
+
+if __name__ == "__main__":
+    main(*int_args())
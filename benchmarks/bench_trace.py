@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Compare eager and traced gradient evaluation of a prop with many small operators
+# Run with: python benchmarks/bench_trace.py [events] [terms] [iterations]
+import numpy as np
+from context import gradcache
+from harness import int_args, timed, report
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+def build_store(nevents, nterms, trace_functions):
+    rng = np.random.default_rng(1)
+    columns = [rng.uniform(0.5, 1.5, nevents) for _ in range(nterms)]
+
+    def weight(a, b):
+        res = 1.0
+        for c in columns:
+            res = res + a * c / (b + c)
+        return res.sum()
+
+    the_store = store(default_cache_size=1, trace_functions=trace_functions)
+    the_store.add_prop("weight", ["a", "b"], weight)
+    the_store.initialize()
+    return the_store
+
+
+def main(nevents=100, nterms=50, iterations=200):
+    results = dict()
+    for trace_functions in [False, True]:
+        the_store = build_store(nevents, nterms, trace_functions)
+
+        def call(k):
+            params = {
+                "a": parameter_wrapper("a", 0.1 * k, grads=["a"], grad_values=[1.0]),
+                "b": parameter_wrapper("b", 1.0, grads=["b"], grad_values=[1.0]),
+            }
+            return the_store.get_prop("weight", params)
+
+        results[trace_functions] = timed(call, iterations)
+    assert np.allclose(results[False][1].grad_values, results[True][1].grad_values)
+    report(
+        "%d events, %d terms" % (nevents, nterms),
+        ("eager", results[False][0]),
+        ("traced", results[True][0]),
+    )
+
+
+if __name__ == "__main__":
+    main(*int_args())
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Timing helpers shared by the benchmarks, run each benchmark as a script
+import sys
+import time
+
+units = {"s": 1.0, "ms": 1e3, "us": 1e6}
+
+
+def int_args():
+    """The integer arguments given on the command line"""
+    return [int(a) for a in sys.argv[1:]]
+
+
+def timed(f, repeat=1):
+    """Mean wall time of f(k) for k in range(repeat), and the last result"""
+    res = None
+    tic = time.perf_counter()
+    for k in range(repeat):
+        res = f(k)
+    toc = time.perf_counter()
+    return (toc - tic) / repeat, res
+
+
+def report(title, baseline, candidate, unit="ms"):
+    """Print the times of a baseline and a candidate, given as (label, seconds),
+    and the speedup of the candidate"""
+    scale = units[unit]
+    print(
+        "%s   %s: %9.3f %s   %s: %9.3f %s   speedup: %5.2fx"
+        % (
+            title,
+            baseline[0],
+            baseline[1] * scale,
+            unit,
+            candidate[0],
+            candidate[1] * scale,
+            unit,
+            baseline[1] / candidate[1],
+        )
+    )
@@ -5,3 +5,7 @@ from .node import Parameter
 from .prop_store import store
 from .parameter_wrapper import parameter_wrapper
 from .wrapper import function_wrapper
+from .keys import key_builder
+from .sharding import sharded_store
+from .stream import streamed_store
+from .columns import column
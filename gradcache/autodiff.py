@@ -1,6 +1,11 @@
 import numpy as np
 import scipy as sp
 
+try:
+    from .pool import active_pool
+except:
+    from pool import active_pool
+
 # This file defines the functions used to calculate the values and gradients of
 # various arithmetic operations
 # The inputs and outputs of these functions come in two varieties:
@@ -13,7 +18,7 @@ import scipy as sp
 # Adds an extra dimension to a quantity so it may represent a gradient
 def up(x):
     x = np.atleast_1d(x)
-    res = np.reshape(x, newshape=(x.shape + (1,)))
+    res = np.reshape(x, x.shape + (1,))
     return res
 
 
@@ -27,6 +32,72 @@ def resgrad_shape(x, n):
     return m + (n,)
 
 
+# Turn gradient column indices into a slice when they are contiguous
+# Assigning to a slice avoids the copies of fancy indexing
+def column_index(resdim):
+    n = len(resdim)
+    if n and resdim[-1] - resdim[0] == n - 1 and (n < 3 or np.all(np.diff(resdim) == 1)):
+        return np.s_[int(resdim[0]) : int(resdim[-1]) + 1]
+    return resdim
+
+
+# A new array for a result, drawn from the active buffer pool if there is one
+def new(shape, dtype=np.float64):
+    pool = active_pool()
+    if pool is None:
+        return np.empty(shape, dtype=dtype)
+    return pool.take(shape, dtype)
+
+
+# Apply a ufunc, writing the result into a buffer of the active pool
+# Scalars, non floating results and evaluations without a pool use the ufunc as is
+def apply(ufunc, *args):
+    pool = active_pool()
+    if pool is None:
+        return ufunc(*args)
+    args = [np.asarray(a) if isinstance(a, (tuple, list)) else a for a in args]
+    shape = np.broadcast_shapes(*[np.shape(a) for a in args])
+    if shape == ():
+        return ufunc(*args)
+    dtype = np.result_type(*args)
+    if dtype.kind != "f":
+        return ufunc(*args)
+    return ufunc(*args, out=pool.take(shape, dtype))
+
+
+# Place the gradient terms of two operands in the gradient of the result
+# Only the result columns that both operands contribute to need a sum:
+# - aligned operands (the same columns in the same order) are added directly
+# - disjoint operands are written side by side without zero filling the result
+# - other layouts are scattered into a result zero filled where needed
+def combine_grad(val, nres, resdim0, term0, resdim1, term1):
+    shape = resgrad_shape(val, nres)
+    term0 = np.asarray(term0)
+    term1 = np.asarray(term1)
+    n0 = len(resdim0)
+    n1 = len(resdim1)
+    if n0 == nres and n1 == nres and np.array_equal(resdim0, resdim1) and np.all(np.diff(resdim0) == 1):
+        if np.broadcast_shapes(term0.shape, term1.shape) == shape:
+            return apply(np.add, term0, term1)
+        res = new(shape)
+        res[...] = term0
+        res += term1
+        return res
+    if n0 + n1 == nres:
+        res = new(shape)
+        res[..., column_index(resdim0)] = term0
+        res[..., column_index(resdim1)] = term1
+        return res
+    res = new(shape)
+    res[..., column_index(resdim0)] = term0
+    # Only the columns the first operand does not write need zero filling
+    rest = np.ones(nres, dtype=bool)
+    rest[resdim0] = False
+    res[..., rest] = 0.0
+    res[..., resdim1] += term1
+    return res
+
+
 # Apply a slice to a value gradient tuple
 def slice(xg, bin_slice):
     x, g = xg
@@ -43,30 +114,27 @@ def assign_mask(xg0, xg1, mask):
 
 # Add two values
 def plus(x0, x1):
-    return x0 + x1
+    return apply(np.add, x0, x1)
 
 
 # Add a value gradient tuple and a value
 def plus_10(xg0, x1):
     x0, grad0 = xg0
-    return x0 + x1, grad0
+    return apply(np.add, x0, x1), grad0
 
 
 # Add a value and a value gradient tuple
 def plus_01(x0, xg1):
     x1, grad1 = xg1
-    return x1 + x0, grad1
+    return apply(np.add, x1, x0), grad1
 
 
 # Add two value gradient tuples
 def plus_grad(xg0, xg1, resdim0, resdim1, nres):
     x0, grad0 = xg0
     x1, grad1 = xg1
-    x0 = np.atleast_1d(x0)
-    resgrad = np.zeros(resgrad_shape(x0, nres))
-    resgrad[..., resdim0] = grad0
-    resgrad[..., resdim1] += grad1
-    return x0 + x1, resgrad
+    val = apply(np.add, x0, x1)
+    return val, combine_grad(val, nres, resdim0, grad0, resdim1, grad1)
 
 
 # Compute the sum
@@ -82,77 +150,74 @@ def sum_grad(xg, axis=(0,)):
 
 # Subtract two values
 def minus(x0, x1):
-    return x0 - x1
+    return apply(np.subtract, x0, x1)
 
 
 # Subtract a value gradient tuple and a value
 def minus_10(xg0, x1):
     x0, grad0 = xg0
-    return x0 - x1, grad0
+    return apply(np.subtract, x0, x1), grad0
 
 
 # Subtract a value and a value gradient tuple
 def minus_01(x0, xg1):
     x1, grad1 = xg1
-    return -x1 + x0, -grad1
+    return apply(np.subtract, x0, x1), apply(np.negative, grad1)
 
 
 # Subtract two value gradient tuples
 def minus_grad(xg0, xg1, resdim0, resdim1, nres):
     x0, grad0 = xg0
     x1, grad1 = xg1
-    x0 = np.atleast_1d(x0)
-    resgrad = np.zeros(resgrad_shape(x0, nres))
-    resgrad[..., resdim0] = grad0
-    resgrad[..., resdim1] -= grad1
-    return x0 - x1, resgrad
+    val = apply(np.subtract, x0, x1)
+    return val, combine_grad(val, nres, resdim0, grad0, resdim1, apply(np.negative, grad1))
 
 
 # Multiply two values
 def mul(x0, x1):
-    print(type(x0), type(x1))
-    return x0 * x1
+    return apply(np.multiply, x0, x1)
 
 
 # Multiply a value gradient tuple and a value
 def mul_10(xg0, x1):
     x0, grad0 = xg0
-    return x0 * x1, grad0 * up(x1)
+    return apply(np.multiply, x0, x1), apply(np.multiply, grad0, up(x1))
 
 
 # Multiply a value and a value gradient tuple
 def mul_01(x0, xg1):
     x1, grad1 = xg1
-    return x0 * x1, grad1 * up(x0)
+    return apply(np.multiply, x0, x1), apply(np.multiply, grad1, up(x0))
 
 
 # Multiply two value gradient tuples
 def mul_grad(xg0, xg1, resdim0, resdim1, nres):
     x0, grad0 = xg0
     x1, grad1 = xg1
-    resgrad = np.zeros(resgrad_shape(x0, nres))
-    resgrad[..., resdim0] = up(x1) * grad0
-    resgrad[..., resdim1] += up(x0) * grad1
-    return x0 * x1, resgrad
+    val = apply(np.multiply, x0, x1)
+    term0 = apply(np.multiply, up(x1), grad0)
+    term1 = apply(np.multiply, up(x0), grad1)
+    return val, combine_grad(val, nres, resdim0, term0, resdim1, term1)
 
 
 # Divide two values
 def div(x0, x1):
-    return x0 / x1
+    return apply(np.divide, x0, x1)
 
 
 # Divide a value gradient tuple and a value
 def div_10(xg0, x1):
     x0, grad0 = xg0
-    return x0 / x1, grad0 / up(x1)
+    return apply(np.divide, x0, x1), apply(np.divide, grad0, up(x1))
 
 
 # Divide a value and a value gradient tuple
 def div_01(x0, xg1):
     x1, grad1 = xg1
-    val = x0 / x1
+    val = apply(np.divide, x0, x1)
     x0, x1 = up(x0), up(x1)
-    grad = -up(val) / x1 * grad1
+    grad = apply(np.multiply, apply(np.divide, up(val), x1), grad1)
+    np.negative(grad, out=grad)
     return val, grad
 
 
@@ -160,48 +225,54 @@ def div_01(x0, xg1):
 def div_grad(xg0, xg1, resdim0, resdim1, nres):
     x0, grad0 = xg0
     x1, grad1 = xg1
-    val = x0 / x1
-    x0 = np.atleast_1d(x0)
-    resgrad = np.zeros(resgrad_shape(x0, nres))
+    val = apply(np.divide, x0, x1)
     x0, x1 = up(x0), up(x1)
-    resgrad[..., resdim0] = grad0 / x1
-    resgrad[..., resdim1] -= up(val) / x1 * grad1
-    return val, resgrad
+    term0 = apply(np.divide, grad0, x1)
+    term1 = apply(np.multiply, apply(np.divide, up(val), x1), grad1)
+    np.negative(term1, out=term1)
+    return val, combine_grad(val, nres, resdim0, term0, resdim1, term1)
 
 
 # Take the power of one value to another
 def pow(x0, x1):
-    return x0 ** x1
+    return apply(np.power, x0, x1)
+
+
+# The derivative of x0 ** x1 with respect to x0 times a gradient
+def _pow_term0(x0, x1, grad0):
+    d = apply(np.multiply, apply(np.power, x0, x1 - 1), x1)
+    return apply(np.multiply, d, grad0)
+
+
+# The derivative of x0 ** x1 with respect to x1 times a gradient
+def _pow_term1(val, x0, grad1):
+    return apply(np.multiply, apply(np.multiply, up(val), np.log(x0)), grad1)
 
 
 # Take the power of a value gradient tuple to a value
 def pow_10(xg0, x1):
     x0, grad0 = xg0
-    val = x0 ** x1
+    val = apply(np.power, x0, x1)
     x0, x1 = up(x0), up(x1)
-    grad = x1 * x0 ** (x1 - 1) * grad0
-    return val, grad
+    return val, _pow_term0(x0, x1, grad0)
 
 
 # Take the power of a value to a value gradient tuple
 def pow_01(x0, xg1):
     x1, grad1 = xg1
-    val = x0 ** x1
-    grad = up(val) * np.log(up(x0)) * grad1
-    return val, grad
+    val = apply(np.power, x0, x1)
+    return val, _pow_term1(val, up(x0), grad1)
 
 
 # Take the power of a value gradient tuple to another value gradient tuple
 def pow_grad(xg0, xg1, resdim0, resdim1, nres):
     x0, grad0 = xg0
     x1, grad1 = xg1
-    val = x0 ** x1
-    x0 = np.atleast_1d(x0)
-    resgrad = np.zeros(resgrad_shape(x0, nres))
+    val = apply(np.power, x0, x1)
     x0, x1 = up(x0), up(x1)
-    resgrad[..., resdim0] = x1 * x0 ** (x1 - 1) * grad0
-    resgrad[..., resdim1] += up(val) * np.log(x0) * grad1
-    return val, resgrad
+    term0 = _pow_term0(x0, x1, grad0)
+    term1 = _pow_term1(val, x0, grad1)
+    return val, combine_grad(val, nres, resdim0, term0, resdim1, term1)
 
 
 # Invert a value
@@ -223,7 +294,7 @@ def log(x0):
 # Take the natural log of a value gradient tuple
 def log_grad(xg0):
     x0, grad0 = xg0
-    return np.log(x0), grad0 / up(x0)
+    return apply(np.log, x0), apply(np.divide, grad0, up(x0))
 
 
 # Take the base 10 log of a value
@@ -256,8 +327,9 @@ def sqrt(x0):
 # Take the square root of a value gradient tuple
 def sqrt_grad(xg0):
     x0, grad0 = xg0
-    val = (np.sqrt(x0),)
-    grad = grad0 / (2.0 * up(val))
+    val = apply(np.sqrt, x0)
+    grad = apply(np.divide, grad0, up(val))
+    grad *= 0.5
     return val, grad
 
 
@@ -280,9 +352,9 @@ def log1p(x0):
 
 
 # Compute the log of one plus a value gradient tuple
-def log1p(xg0):
+def log1p_grad(xg0):
     x0, grad0 = xg0
-    return np.log1p(x0), grad0 / up(x0 + 1.0)
+    return apply(np.log1p, x0), apply(np.divide, grad0, up(apply(np.add, x0, 1.0)))
 
 
 # Compute the log of the pdf of a normal distribution evaluated at a value
@@ -0,0 +1,98 @@
+import collections
+
+try:
+    from .policy import make_policy
+except:
+    from policy import make_policy
+
+
+class memory_budget:
+    """A byte budget shared by several function caches
+    Every entry stored in an attached cache is charged against the budget.
+    When the budget is exceeded entries are evicted across all attached caches
+    in the order given by a single global eviction policy.
+    """
+
+    def __init__(self, nbytes, policy="cost"):
+        self.limit = nbytes
+        self.policy = make_policy(policy)
+        self.caches = dict()
+        self.sizes = dict()
+        self.resident = collections.defaultdict(int)
+        self.total = 0
+
+    def attach(self, name, cache):
+        """Charge the entries of a cache against this budget"""
+        if cache.budget is self:
+            return
+        if cache.budget is not None:
+            cache.budget.detach(cache.name)
+        self.caches[name] = cache
+        cache.name = name
+        cache.budget = self
+        for key in cache.keys():
+            self.charge(name, key, cache.sizes.get(key, 0))
+        self.make_room()
+
+    def detach(self, name):
+        cache = self.caches.pop(name)
+        for key in list(cache.keys()):
+            self.release(name, key)
+        cache.budget = None
+
+    def set_limit(self, nbytes):
+        self.limit = nbytes
+        self.make_room()
+
+    def set_policy(self, policy):
+        """Replace the eviction policy, the resident entries are kept
+        Asking for the kind of policy already in use keeps its history
+        """
+        new_policy = make_policy(policy)
+        if isinstance(policy, (str, type)) and type(new_policy) is type(self.policy):
+            return
+        self.policy = new_policy
+        for entry, nbytes in self.sizes.items():
+            self.policy.insert(entry, None, nbytes)
+        self.make_room()
+
+    def fits(self, nbytes):
+        return self.limit is None or nbytes <= self.limit
+
+    def charge(self, name, key, nbytes, cost=None):
+        entry = (name, key)
+        self.sizes[entry] = nbytes
+        self.resident[name] += nbytes
+        self.total += nbytes
+        self.policy.insert(entry, cost, nbytes)
+
+    def admit(self, name, key, nbytes, cost=None):
+        """Charge a new entry, evicting other entries if needed
+        Returns False if the entry can never fit in the budget
+        """
+        if not self.fits(nbytes):
+            return False
+        self.charge(name, key, nbytes, cost)
+        self.make_room()
+        return True
+
+    def hit(self, name, key):
+        self.policy.hit((name, key))
+
+    def release(self, name, key, evicted=False):
+        """Stop charging an entry that has left its cache"""
+        entry = (name, key)
+        if entry not in self.sizes:
+            return
+        nbytes = self.sizes.pop(entry)
+        self.resident[name] -= nbytes
+        self.total -= nbytes
+        self.policy.remove(entry, evicted=evicted)
+
+    def make_room(self):
+        if self.limit is None:
+            return
+        while self.total > self.limit and len(self.sizes):
+            name, key = self.policy.victim()
+            # The cache calls release() for the evicted entry
+            self.caches[name].evict(key, evicted=True)
@@ -1,10 +1,26 @@
 import numpy as np
 import collections
+import threading
 import time
 
+try:
+    from .policy import make_policy
+    from .memory import make_memory_backend, result_nbytes
+    from .keys import is_gradient_key
+    from .stats import cache_stats
+    from .reuse import gradient_reuse, derive_result
+except:
+    from policy import make_policy
+    from memory import make_memory_backend, result_nbytes
+    from keys import is_gradient_key
+    from stats import cache_stats
+    from reuse import gradient_reuse, derive_result
+
+
 class function_cache(collections.OrderedDict):
     """Keep a size limited cache of function results
     Also optionally tracks time and memory usage for the function calls
+    The entry to evict is chosen by a pluggable eviction policy (see policy.py)
     """
 
     def __init__(
@@ -16,14 +32,35 @@ class function_cache(collections.OrderedDict):
         sample_mem=True,
         track_time=False,
         track_mem=False,
+        policy=None,
+        memory_backend=None,
+        reuse=True,
     ):
         collections.OrderedDict.__init__(self)
         self.f = f
-        self.maxsize = maxsize
-        self.enabled = True
+        self.name = None
+        self.maxsize = float("inf") if maxsize is None else maxsize
+        self.enabled = enabled
+        self.policy = make_policy(policy)
+
+        # Bytes held by each entry, optionally charged against a shared budget
+        self.sizes = dict()
+        self.nbytes = 0
+        self.budget = None
+
+        # Results computed once and kept out of reach of the policy and the budget
+        self.pinned = dict()
+
+        # Answers value-only and gradient subset requests from gradient entries
+        self.reuse = gradient_reuse() if reuse else None
 
         self.accesses = 0
         self.accesses_weighted = 0
+        self.stats = cache_stats()
+
+        # The thread pool executor computes misses outside of its lock, the
+        # sampling decisions and the samples are guarded by this one
+        self.samples_lock = threading.Lock()
 
         self.sample_time = sample_time
         self.track_time = track_time
@@ -32,6 +69,7 @@ class function_cache(collections.OrderedDict):
         self.sample_mem = sample_mem
         self.track_mem = track_mem
         self.mem_samples = []
+        self.memory_backend = make_memory_backend(memory_backend)
 
     def enable(self):
         self.enabled = True
@@ -40,82 +78,193 @@ class function_cache(collections.OrderedDict):
         self.enabled = False
 
     def clear(self):
-        super().clear()
+        self.drop_entries()
+        self.pinned.clear()
         self.accesses = 0
         self.accesses_weighted = 0
 
+    def drop_entries(self):
+        if self.budget is not None:
+            for key in self.keys():
+                self.budget.release(self.name, key)
+        super().clear()
+        self.policy.clear()
+        if self.reuse is not None:
+            self.reuse.clear()
+        self.sizes.clear()
+        self.nbytes = 0
+
+    def evict(self, key=None, evicted=None):
+        """Remove an entry from the cache, by default the policy's victim"""
+        if key is None:
+            key = self.policy.victim()
+            if evicted is None:
+                evicted = True
+        evicted = bool(evicted)
+        super().__delitem__(key)
+        self.policy.remove(key, evicted=evicted)
+        if evicted:
+            self.stats.record_eviction()
+        self.nbytes -= self.sizes.pop(key, 0)
+        if self.reuse is not None:
+            self.reuse.remove(key)
+        if self.budget is not None:
+            self.budget.release(self.name, key, evicted=evicted)
+        return key
+
+    def pin(self, key, ret):
+        """Keep a result until it is unpinned, it is never evicted"""
+        if super().__contains__(key):
+            self.evict(key, evicted=False)
+        self.pinned[key] = ret
+
+    def unpin(self, key=None):
+        """Drop a pinned result, or all of them"""
+        if key is None:
+            self.pinned.clear()
+        else:
+            self.pinned.pop(key, None)
+
+    def make_room(self, n=0):
+        """Evict entries until at most n more entries fit in the cache"""
+        while len(self) and len(self) > self.maxsize - n:
+            self.evict()
+
     def set_size(self, size):
-        self.maxsize = size
-        while len(self) >= max(self.maxsize, 1):
-            self.popitem(last=False)
+        self.maxsize = float("inf") if size is None else size
+        self.make_room()
+
+    def set_policy(self, policy):
+        """Replace the eviction policy, existing entries are kept in insertion order"""
+        self.policy = make_policy(policy)
+        for key in self.keys():
+            self.policy.insert(key)
+        self.make_room()
 
     def get_state(self):
         return (
             self.accesses,
             self.accesses_weighted,
-            np.sum(self.time_samples) / len(self.time_samples),
-            np.sum(self.mem_samples) / len(self.mem_samples),
+            np.mean(self.time_samples) if len(self.time_samples) else np.nan,
+            np.mean(self.mem_samples) if len(self.mem_samples) else np.nan,
         )
 
+    def set_memory_backend(self, backend, every=None):
+        """Choose how the memory cost of a miss is measured (see memory.py)
+        If every is given every Nth miss is measured instead of only the first
+        """
+        self.memory_backend = make_memory_backend(backend, every)
+        if every is not None:
+            self.track_mem = True
+        self.mem_samples = []
+
     def set_function(self, f):
         self.f = f
-        while len(self) >= max(self.maxsize, 1):
-            self.popitem(last=False)
+        self.drop_entries()
         self.time_samples = []
         self.mem_samples = []
 
     def add_time(self, t):
-        self.time_samples.append(t)
+        with self.samples_lock:
+            self.time_samples.append(t)
 
     def add_mem(self, m):
-        self.mem_samples.append(m)
+        with self.samples_lock:
+            self.mem_samples.append(m)
 
-    def __getitem__(self, key, extra=None):
+    def compute(self, key, extra=None):
+        """Evaluate the function and return the result and its measured cost
+        Safe to call from several threads at once
+        """
+        with self.samples_lock:
+            mem_sample = (not len(self.mem_samples) and self.sample_mem) or self.track_mem
+            time_sample = (
+                not len(self.time_samples) and self.sample_time
+            ) or self.track_time
+        if mem_sample:
+            token = self.memory_backend.start()
+        # Every miss is timed, the cost feeds the statistics and the cost
+        # aware eviction policies
+        tic = time.perf_counter()
+        try:
+            ret = self.f(key, extra)
+        except:
+            if mem_sample:
+                self.memory_backend.stop(token, None)
+            raise
+        toc = time.perf_counter()
+        cost = toc - tic
+        if time_sample:
+            self.add_time(cost)
+        if mem_sample:
+            mem = self.memory_backend.stop(token, ret)
+            if mem is not None:
+                self.add_mem(mem)
+        return ret, cost
+
+    def lookup(self, key, parameters=None):
+        """Try to answer a request from the cache
+        Returns (True, result) on a hit and (False, None) on a miss
+        """
         self.accesses += 1
         self.accesses_weighted += 1.0 / max(self.maxsize, 1)
+        self.stats.record_call(is_gradient_key(key))
+        if self.pinned and key in self.pinned:
+            self.stats.record_hit()
+            return True, self.pinned[key]
         if super().__contains__(key):
-            return super().__getitem__(key)
-        while len(self) >= max(self.maxsize, 1):
-            self.popitem(last=False)
-        mem_sample = (not len(self.mem_samples) and self.sample_mem) or self.track_mem
-        time_sample = (
-            not len(self.time_samples) and self.sample_time
-        ) or self.track_time
-        default = (not mem_sample) and (not time_sample)
-        if default:
-            ret = self.f(key, extra)
-        elif time_sample and mem_sample:
-            import os
-            import psutil
+            self.stats.record_hit()
+            return True, self.peek(key)
+        if self.reuse is not None:
+            found = self.reuse.lookup(key, parameters)
+            if found is not None:
+                self.stats.record_hit()
+                full_key, names = found
+                return True, derive_result(self.peek(full_key), names)
+        return False, None
 
-            process = psutil.Process(os.getpid())
-            mem0 = process.memory_info().rss
-            tic = time.perf_counter()
-            ret = self.f(key, extra)
-            toc = time.perf_counter()
-            mem1 = process.memory_info().rss
-            self.add_time(toc - tic)
-            self.add_mem(mem1 - mem0)
-        elif time_sample:
-            tic = time.perf_counter()
-            ret = self.f(key, extra)
-            toc = time.perf_counter()
-            self.add_time(toc - tic)
-        elif mem_sample:
-            import os
-            import psutil
-
-            process = psutil.Process(os.getpid())
-            mem0 = process.memory_info().rss
-            ret = self.f(key, extra)
-            process = psutil.Process(os.getpid())
-            mem1 = process.memory_info().rss
-            self.add_mem(mem1 - mem0)
+    def fill(self, key, extra=None):
+        """Compute a request that missed the cache and store the result"""
+        store = self.enabled and self.maxsize > 0
+        if store:
+            self.make_room(1)
+        ret, cost = self.compute(key, extra)
+        return self.commit(key, ret, cost, getattr(extra, "parameters", None))
 
-        if self.enabled and len(self) < self.maxsize:
-            super().__setitem__(key, ret)
+    def commit(self, key, ret, cost, parameters=None):
+        """Record a miss that was computed outside the cache and store the result"""
+        self.stats.record_miss(cost)
+        if self.enabled and self.maxsize > 0:
+            self.make_room(1)
+            self.insert(key, ret, cost, parameters)
         return ret
 
+    def __getitem__(self, key, extra=None):
+        found, ret = self.lookup(key, getattr(extra, "parameters", None))
+        if found:
+            return ret
+        return self.fill(key, extra)
+
+    def peek(self, key):
+        """Access an entry that is known to be in the cache"""
+        self.policy.hit(key)
+        if self.budget is not None:
+            self.budget.hit(self.name, key)
+        return super().__getitem__(key)
+
+    def insert(self, key, ret, cost=None, parameters=None):
+        """Store a computed result, charging it against the budget if there is one"""
+        nbytes = result_nbytes(ret)
+        if self.budget is not None and not self.budget.fits(nbytes):
+            return
+        super().__setitem__(key, ret)
+        if self.reuse is not None and parameters is not None:
+            self.reuse.insert(key, parameters)
+        self.policy.insert(key, cost, nbytes)
+        self.sizes[key] = nbytes
+        self.nbytes += nbytes
+        if self.budget is not None:
+            self.budget.admit(self.name, key, nbytes, cost)
+
     def __call__(self, key, extra):
         return self.__getitem__(key, extra)
-
@@ -0,0 +1,105 @@
+import numpy as np
+import os.path
+import struct
+import zipfile
+
+# This file defines references to event columns stored on disk.
+# A column is either a .npy file or a member of an uncompressed .npz archive
+# (as written by np.savez). Opening a column maps the file read-only with
+# np.memmap, nothing is read until the operators touch the data, and the pages
+# are shared with the page cache instead of being copied into the process.
+#
+# Columns are registered with store.add_column and supplied to the props as
+# physical parameters. At store.initialize() only the columns reachable from the
+# requested props are opened (column projection).
+
+# Size of the fixed part of a zip local file header
+_local_header_size = 30
+
+
+def _npz_member_offset(path, member):
+    """The byte offset of the .npy data of an uncompressed .npz member"""
+    with zipfile.ZipFile(path) as archive:
+        name = member if member.endswith(".npy") else member + ".npy"
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            raise KeyError("No column " + str(member) + " in " + str(path))
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(
+                "Column " + str(member) + " in " + str(path)
+                + " is compressed and can not be memory mapped, save it with np.savez"
+            )
+    with open(path, "rb") as f:
+        f.seek(info.header_offset)
+        header = f.read(_local_header_size)
+        if header[:4] != b"PK\x03\x04":
+            raise ValueError("Corrupt zip header for " + str(member) + " in " + str(path))
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        return info.header_offset + _local_header_size + name_length + extra_length
+
+
+def _memmap_npy(path, offset=0):
+    """Map the array of a .npy file (or of a .npy stream starting at offset)"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if dtype.hasobject:
+            raise ValueError("Columns of Python objects can not be memory mapped")
+        data_offset = f.tell()
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=data_offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+class column:
+    """A reference to an event column in a .npy file or an .npz archive member"""
+
+    def __init__(self, path, member=None):
+        self.path = path
+        self.member = member
+        if member is None and path.endswith(".npz"):
+            raise ValueError("A column in an .npz archive needs a member name")
+        self.array = None
+
+    def open(self):
+        """Map the column, repeated calls return the same array"""
+        if self.array is None:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(self.path)
+            if self.member is None:
+                self.array = _memmap_npy(self.path)
+            else:
+                self.array = _memmap_npy(self.path, _npz_member_offset(self.path, self.member))
+        return self.array
+
+    def close(self):
+        self.array = None
+
+    @property
+    def is_open(self):
+        return self.array is not None
+
+    def __repr__(self):
+        if self.member is None:
+            return "column(" + repr(self.path) + ")"
+        return "column(" + repr(self.path) + ", " + repr(self.member) + ")"
+
+
+def npz_columns(path, names=None):
+    """A column for every member (or the given members) of an .npz archive"""
+    if names is None:
+        with zipfile.ZipFile(path) as archive:
+            names = [n[: -len(".npy")] for n in archive.namelist() if n.endswith(".npy")]
+    return dict([(name, column(path, name)) for name in names])
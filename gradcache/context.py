@@ -1,5 +1,10 @@
 import numpy as np
 
+try:
+    from .keys import default_key_builder
+except:
+    from keys import default_key_builder
+
 class function_context:
     """The context of a function within the larger computation/dependency graph"""
 
@@ -33,10 +38,14 @@ class function_context:
 
         self.implicit_physical_props = []
         self.callback = None
+        self.key_builder = default_key_builder
 
     def set_store(self, the_store):
         self.the_store = the_store
 
+    def set_key_builder(self, key_builder):
+        self.key_builder = key_builder
+
     def set_callback(self, callback):
         self.callback = callback
 
@@ -115,13 +124,32 @@ class function_context:
             values[i] = self.the_store.get_prop(prop, physical_parameters)
         return tuple(values)
 
-    def compute(self, parameters, physical_parameters, *args, **kwargs):
-        values_getter = lambda : self.extract_values(parameters, physical_parameters)
-        return self.callback(parameters, values_getter)
+    def extract_key(self, parameters):
+        return self.key_builder(parameters)
+
+    def compute(self, key, parameters, physical_parameters, *args, **kwargs):
+        values_getter = value_getter(self, parameters, physical_parameters)
+        return self.callback(key, values_getter)
 
     def __call__(self, physical_parameters, *args, **kwargs):
         these_params = self.extract_params(physical_parameters)
-        return self.compute(these_params, physical_parameters, *args, **kwargs)
+        key = self.extract_key(these_params)
+        return self.compute(key, these_params, physical_parameters, *args, **kwargs)
+
+class value_getter:
+    """Lazily extract the argument values of a function
+    Also exposes the parameters the cache key was built from
+    """
+
+    __slots__ = ["context", "parameters", "physical_parameters"]
+
+    def __init__(self, context, parameters, physical_parameters):
+        self.context = context
+        self.parameters = parameters
+        self.physical_parameters = physical_parameters
+
+    def __call__(self):
+        return self.context.extract_values(self.parameters, self.physical_parameters)
 
 class unpacker:
     def __init__(self, callback):
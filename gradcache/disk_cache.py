@@ -0,0 +1,170 @@
+import numpy as np
+import hashlib
+import json
+import os
+import os.path
+import types
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+    from .keys import stable_digest, key_builder
+except:
+    from parameter_wrapper import parameter_wrapper
+    from keys import stable_digest, key_builder
+
+# This file defines the optional on-disk tier that sits behind a function_cache
+# Results are stored as .npy files under
+#   <directory>/<prop name>/<version>/<key digest>.npy
+# where the version is a hash of the function's code and the versions of all the
+# props it depends on (see code_hash and combine_versions). Arrays are reloaded with np.load(mmap_mode='r') so a warm
+# start does not copy the data into memory.
+
+_closure_keys = key_builder(small_array_size=0, array_mode="digest")
+
+
+def _feed_code(h, code):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _feed_code(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+def code_hash(function, version=None):
+    """A hash of the code of a function and the simple values it closes over"""
+    h = hashlib.blake2b(digest_size=16)
+    if version is not None:
+        h.update(repr(version).encode())
+    code = getattr(function, "__code__", None)
+    if code is None:
+        # Callable objects and builtins are identified by their qualified name
+        h.update(repr(getattr(function, "__qualname__", type(function).__qualname__)).encode())
+        return h.hexdigest()
+    _feed_code(h, code)
+    for cell in function.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            continue
+        digest = stable_digest(_closure_keys((value,)))
+        h.update((digest or type(value).__qualname__).encode())
+    return h.hexdigest()
+
+
+def disk_keys(keys):
+    """A key builder like keys that digests the contents of large arrays
+    Arrays keyed by identity can not be found again by another process
+    """
+    if isinstance(keys, key_builder):
+        return key_builder(keys.float_bits, keys.small_array_size, array_mode="digest")
+    return key_builder(array_mode="digest")
+
+
+def combine_versions(version, dependency_versions):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(version.encode())
+    for v in dependency_versions:
+        h.update(b";" + v.encode())
+    return h.hexdigest()
+
+
+def _save(path, value):
+    """Write an array atomically"""
+    tmp = path + ".tmp" + str(os.getpid())
+    with open(tmp, "wb") as f:
+        np.save(f, value)
+    os.replace(tmp, path)
+
+
+def _load(path):
+    value = np.load(path, mmap_mode="r")
+    if value.ndim == 0:
+        return value[()]
+    return value
+
+
+class disk_cache:
+    """Persist the results of a function as .npy files
+    Sits between a function_cache and the function it caches
+    """
+
+    def __init__(self, directory, name, version, f=None, keys=None):
+        self.directory = directory
+        self.name = name
+        self.version = version
+        self.f = f
+        # Builds stable keys from the parameters when the in-memory key of a
+        # request holds identity tokens (see disk_keys)
+        self.keys = keys
+        self.loads = 0
+        self.saves = 0
+
+    def set_function(self, f):
+        self.f = f
+
+    def path(self, key, parameters=None):
+        digest = stable_digest(key)
+        if digest is None and parameters is not None and self.keys is not None:
+            digest = stable_digest(self.keys(parameters))
+        if digest is None:
+            return None
+        return os.path.join(self.directory, str(self.name), self.version, digest)
+
+    def load(self, path):
+        """Returns (True, result) if the result is on disk"""
+        if os.path.exists(path + ".json"):
+            with open(path + ".json") as f:
+                meta = json.load(f)
+            value = _load(path + ".npy")
+            grad_values = _load(path + ".grad.npy")
+            hessian_values = None
+            if meta.get("hessian"):
+                hessian_values = _load(path + ".hess.npy")
+            return True, parameter_wrapper(
+                None, value, grads=meta["grads"], grad_values=grad_values, hessian_values=hessian_values
+            )
+        elif os.path.exists(path + ".npy"):
+            return True, _load(path + ".npy")
+        return False, None
+
+    def save(self, path, res):
+        """Write a result to disk, results that are not arrays are not persisted"""
+        directory = os.path.dirname(path)
+        if isinstance(res, parameter_wrapper):
+            if res.grad_values is None:
+                res = res.value
+            else:
+                if not os.path.isdir(directory):
+                    os.makedirs(directory, exist_ok=True)
+                _save(path + ".npy", np.asarray(res.value))
+                _save(path + ".grad.npy", np.asarray(res.grad_values))
+                meta = {"grads": list(res.grads)}
+                if res.hessian_values is not None:
+                    _save(path + ".hess.npy", np.asarray(res.hessian_values))
+                    meta["hessian"] = True
+                # The metadata is written last and marks the entry as complete
+                tmp = path + ".json.tmp" + str(os.getpid())
+                with open(tmp, "w") as f:
+                    json.dump(meta, f)
+                os.replace(tmp, path + ".json")
+                self.saves += 1
+                return
+        if isinstance(res, (np.ndarray, np.generic, float, int)):
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            _save(path + ".npy", np.asarray(res))
+            self.saves += 1
+
+    def __call__(self, key, extra=None):
+        path = self.path(key, getattr(extra, "parameters", None))
+        if path is None:
+            return self.f(key, extra)
+        found, res = self.load(path)
+        if found:
+            self.loads += 1
+            return res
+        res = self.f(key, extra)
+        self.save(path, res)
+        return res
@@ -0,0 +1,178 @@
+import heapq
+import os
+import threading
+import concurrent.futures
+
+try:
+    from .plan import slot_getter
+except:
+    from plan import slot_getter
+
+# This file evaluates compiled evaluation plans (see plan.py) on a thread pool.
+# The cache lookups of a request are made as usual, then every prop that missed
+# is scheduled as soon as the props it depends on are available, so independent
+# props (separate flux components, detector systematics, ...) are computed
+# concurrently. NumPy releases the GIL for large array operations.
+#
+# A prop that is already being computed for another request with the same key
+# is not computed twice, the request waits for the result in flight instead.
+#
+# The cache bookkeeping (lookups, insertions, evictions and the shared memory
+# budget) is guarded by a single lock held by the executor. Only the prop
+# functions themselves run outside of it.
+#
+# The tracemalloc memory backend (see memory.py) measures the allocations of
+# every thread, so it serializes the computes it measures behind a global lock.
+# Measuring every miss with it (memory_sample_every=1) leaves no concurrency,
+# the size backend does not lock.
+
+
+class _request:
+    """The state of one request being evaluated by a parallel_executor"""
+
+    __slots__ = ["slots", "futures", "remaining", "dependents", "owned"]
+
+    def __init__(self, slots):
+        self.slots = slots
+        # Future of every step that missed, by slot
+        self.futures = dict()
+        # Number of missed dependencies each owned step still waits for
+        self.remaining = dict()
+        # Owned steps waiting for each missed step
+        self.dependents = dict()
+        # Steps computed by this request, by slot
+        self.owned = dict()
+
+
+class parallel_executor:
+    """Evaluate the props that miss the cache on a pool of threads"""
+
+    def __init__(self, threads=None):
+        if threads is None:
+            threads = os.cpu_count() or 1
+        self.threads = threads
+        self.pool = None
+        self.lock = threading.Lock()
+        # Futures of the results being computed, by (prop name, key)
+        self.inflight = dict()
+
+    def start(self):
+        if self.pool is None:
+            self.pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="gradcache"
+            )
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
+            self.pool = None
+
+    def lookup(self, plan, request):
+        """Look up the needed steps of a plan, must be called with the lock held
+        Returns the steps to compute and the steps in flight for other requests
+        """
+        steps = plan.steps
+        slots = request.slots
+        # Steps are visited from the root down, as in evaluation_plan.lookup
+        heap = [-(len(steps) - 1)]
+        queued = set(heap)
+        owned = []
+        waiting = []
+        while heap:
+            step = steps[-heapq.heappop(heap)]
+            parameters = step.params(slots)
+            key = step.key_builder(parameters)
+            found, res = step.cache.lookup(key, parameters)
+            if found:
+                slots[step.slot] = res
+                continue
+            inflight_key = (step.name, key)
+            future = self.inflight.get(inflight_key)
+            if future is not None:
+                request.futures[step.slot] = future
+                waiting.append(step)
+                continue
+            future = concurrent.futures.Future()
+            self.inflight[inflight_key] = future
+            request.futures[step.slot] = future
+            owned.append((step, key, parameters))
+            for j in step.deps:
+                if -j not in queued:
+                    queued.add(-j)
+                    heapq.heappush(heap, -j)
+        return owned, waiting
+
+    def run(self, request, step, key, parameters):
+        """Compute one step whose dependencies are all available"""
+        future = request.futures[step.slot]
+        try:
+            getter = slot_getter(step.values, request.slots, parameters)
+            ret, cost = step.cache.compute(key, getter)
+            with self.lock:
+                step.cache.commit(key, ret, cost, parameters)
+                del self.inflight[(step.name, key)]
+        except BaseException as e:
+            with self.lock:
+                self.inflight.pop((step.name, key), None)
+            future.set_exception(e)
+            return
+        future.set_result(ret)
+
+    def dependency_done(self, request, slot, future):
+        """Called when a missed step of a request is available"""
+        exc = future.exception()
+        if exc is None:
+            request.slots[slot] = future.result()
+        ready = []
+        failed = []
+        with self.lock:
+            for dependent in request.dependents.get(slot, ()):
+                if dependent not in request.remaining:
+                    continue
+                if exc is not None:
+                    del request.remaining[dependent]
+                    step, key, parameters = request.owned[dependent]
+                    self.inflight.pop((step.name, key), None)
+                    failed.append(dependent)
+                    continue
+                request.remaining[dependent] -= 1
+                if request.remaining[dependent] == 0:
+                    del request.remaining[dependent]
+                    ready.append(dependent)
+        for dependent in failed:
+            request.futures[dependent].set_exception(exc)
+        for dependent in ready:
+            self.pool.submit(self.run, request, *request.owned[dependent])
+
+    def __call__(self, plan, physical_parameters):
+        request = _request(plan.extract_slots(physical_parameters))
+        with self.lock:
+            owned, waiting = self.lookup(plan, request)
+        root = plan.steps[-1]
+        if not owned and not waiting:
+            return request.slots[root.slot]
+        if len(owned) == 1 and not waiting:
+            # A single miss is computed by the calling thread
+            self.run(request, *owned[0])
+            return request.futures[root.slot].result()
+
+        self.start()
+        ready = []
+        for step, key, parameters in owned:
+            request.owned[step.slot] = (step, key, parameters)
+            deps = [plan.steps[j].slot for j in step.deps]
+            deps = [d for d in deps if d in request.futures]
+            for d in deps:
+                request.dependents.setdefault(d, []).append(step.slot)
+            if deps:
+                request.remaining[step.slot] = len(deps)
+            else:
+                ready.append(step.slot)
+        # Callbacks of steps that are already done run immediately
+        for slot in list(request.dependents.keys()):
+            request.futures[slot].add_done_callback(
+                lambda future, slot=slot: self.dependency_done(request, slot, future)
+            )
+        for slot in ready:
+            self.pool.submit(self.run, request, *request.owned[slot])
+        return request.futures[root.slot].result()
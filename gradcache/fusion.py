@@ -0,0 +1,178 @@
+import numpy as np
+
+try:
+    import gradcache.autodiff as ad
+    from .operators import operators as ops, operator_site
+    from .parameter_wrapper import parameter_wrapper
+except:
+    import autodiff as ad
+    from operators import operators as ops, operator_site
+    from parameter_wrapper import parameter_wrapper
+
+# This file fuses chains of elementwise operators of a traced prop function.
+#
+# Evaluated one operator at a time, every step of an expression such as
+# norm * flux ** gamma * xs / (1 + sys) writes a full length value and an
+# nres wide gradient, and the next step reads them back from memory. A fused
+# chain evaluates all its steps on one tile of events at a time instead. The
+# tiles are sized so the intermediate values and gradients of a tile stay in
+# the cache, and only the inputs and the output of the chain go to memory.
+#
+# A chain is a tree of elementwise steps whose intermediate values are only
+# used by the next step of the chain. The operators are the same as in eager
+# mode, so the results are identical element by element.
+
+# Operators that act on every event independently
+elementwise = set(
+    ["plus", "minus", "mul", "div", "pow", "inv", "log", "log10", "log2", "sqrt", "lgamma", "log1p"]
+)
+
+# Bytes of values and gradients per tile
+tile_bytes = 1 << 20
+
+
+def split_input(x):
+    """The value and the gradient of an input of a chain"""
+    if isinstance(x, parameter_wrapper):
+        return x.value, x.grad_values
+    return x, None
+
+
+class fused_chain:
+    """Elementwise steps evaluated together, one tile of events at a time"""
+
+    def __init__(self, steps, inputs, tile_bytes=None):
+        self.steps = steps
+        self.inputs = inputs
+        self.tile_bytes = tile_bytes
+        slots = dict([(name, i) for i, name in enumerate(inputs)])
+        for name, op, operands in steps:
+            slots[name] = len(slots)
+        self.program = [(operator_site(ops[op]), slots[name], tuple([slots[o] for o in operands])) for name, op, operands in steps]
+        self.nslots = len(slots)
+
+    def run(self, args):
+        values = list(args) + [None] * (self.nslots - len(args))
+        for f, out, operands in self.program:
+            values[out] = f(*[values[i] for i in operands])
+        return values[-1]
+
+    def tiling(self, args):
+        """The number of events and the rows of a tile, None if the inputs can
+        not be split along their first axis
+        """
+        n = None
+        width = 1
+        for x in args:
+            # Second order operands are evaluated operator by operator
+            if isinstance(x, parameter_wrapper) and x.hessian_values is not None:
+                return None
+            value, grad = split_input(x)
+            if np.size(value) == 1:
+                continue
+            if np.ndim(value) != 1:
+                return None
+            if n is None:
+                n = len(value)
+            elif len(value) != n:
+                return None
+            if grad is not None:
+                if not isinstance(grad, np.ndarray) or grad.ndim != 2 or grad.shape[0] != n:
+                    return None
+                width = max(width, 1 + grad.shape[1])
+        if n is None:
+            return None
+        nbytes = tile_bytes if self.tile_bytes is None else self.tile_bytes
+        rows = max(1, nbytes // (8 * width))
+        if rows >= n:
+            return None
+        return n, rows
+
+    def __call__(self, *args):
+        tiling = self.tiling(args)
+        if tiling is None:
+            return self.run(args)
+        n, rows = tiling
+        tiled = [np.size(split_input(x)[0]) != 1 for x in args]
+        value = grad = grads = None
+        for start in range(0, n, rows):
+            stop = min(start + rows, n)
+            tile_args = [self.tile(x, start, stop) if t else x for x, t in zip(args, tiled)]
+            res = self.run(tile_args)
+            res_value, res_grad = split_input(res)
+            if start == 0:
+                # The first tile fixes the layout of the output
+                if np.ndim(res_value) != 1 or len(res_value) != stop:
+                    return self.run(args)
+                value = ad.new((n,), np.result_type(res_value))
+                if res_grad is not None:
+                    grads = res.grads
+                    res_grad = np.asarray(res_grad)
+                    if res_grad.shape[0] != stop:
+                        return self.run(args)
+                    grad = ad.new((n,) + res_grad.shape[1:], res_grad.dtype)
+            value[start:stop] = res_value
+            if grad is not None:
+                grad[start:stop] = res_grad
+        if grad is None:
+            return parameter_wrapper(None, value)
+        return parameter_wrapper(None, value, grads=grads, grad_values=grad)
+
+    @staticmethod
+    def tile(x, start, stop):
+        if isinstance(x, parameter_wrapper):
+            if x.grad_values is None:
+                return parameter_wrapper(x.name, x.value[start:stop])
+            return parameter_wrapper(x.name, x.value[start:stop], grads=x.grads, grad_values=x.grad_values[start:stop])
+        return x[start:stop]
+
+
+def fuse(steps, result, min_length=2):
+    """Replace the chains of elementwise steps by fused steps
+    Returns the new steps and the fused_chain of every fused step
+    """
+    consumers = dict()
+    step_ops = dict()
+    for name, op, operands in steps:
+        step_ops[name] = op
+        for o in operands:
+            consumers.setdefault(o, set()).add(name)
+
+    # Visit the consumers first so every step can join the chain of its consumer
+    chain_of = dict()
+    for name, op, operands in reversed(steps):
+        if op not in elementwise:
+            continue
+        users = consumers.get(name, ())
+        if name != result and len(users) == 1:
+            user = next(iter(users))
+            if user in chain_of:
+                chain_of[name] = chain_of[user]
+                continue
+        chain_of[name] = name
+
+    members = dict()
+    new_steps = []
+    chains = dict()
+    for step in steps:
+        name, op, operands = step
+        output = chain_of.get(name)
+        if output is None:
+            new_steps.append(step)
+            continue
+        members.setdefault(output, []).append(step)
+        if name != output:
+            continue
+        chain = members.pop(output)
+        if len(chain) < min_length:
+            new_steps.extend(chain)
+            continue
+        produced = set([s[0] for s in chain])
+        inputs = []
+        for s in chain:
+            for o in s[2]:
+                if o not in produced and o not in inputs:
+                    inputs.append(o)
+        chains[name] = fused_chain(chain, inputs)
+        new_steps.append((name, "fused", inputs))
+    return new_steps, chains
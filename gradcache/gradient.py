@@ -1,10 +1,12 @@
 
 try:
     from .parameter_wrapper import parameter_wrapper, sift_parameters
-    from .node import Node
+    from .node import Node, name_nodes
+    from .trace import trace_function
 except:
     from parameter_wrapper import parameter_wrapper, sift_parameters
-    from node import Node
+    from node import Node, name_nodes
+    from trace import trace_function
 
 class function_gradient:
     def __init__(self, fbase, callback=None):
@@ -16,9 +18,45 @@ class function_gradient:
         self.constants = dict()
         self.precomputed_information = None
         self.callback = callback
+        # Buffer pool for the autodiff kernels (see pool.py), None allocates
+        self.pool = None
+        # Replay a trace of the callback instead of running it (see trace.py)
+        self.tracing = False
+        self.trace = None
+        # A trace with some arguments fixed, and the (index, value) of each
+        self.specialized = None
+        self.fixed = None
 
     def set_callback(self, callback):
         self.callback = callback
+        self.set_tracing(self.tracing)
+
+    def set_tracing(self, tracing):
+        self.tracing = tracing
+        self.explored = False
+        self.trace = None
+        self.specialize(None)
+
+    def specialize(self, values):
+        """Precompute the parts of the trace that only depend on the given
+        argument values, used while the arguments keep the same values
+        """
+        self.specialized = None
+        self.fixed = None
+        if not values or not self.tracing:
+            return
+        if not self.explored:
+            self.explore()
+        if self.trace is None:
+            return
+        arg_names = self.fbase.arg_names
+        self.fixed = [(arg_names.index(k), v) for k, v in values.items() if k in arg_names]
+        self.specialized = self.trace.specialize(values)
+
+    def explore(self):
+        """Trace the callback once, functions that can not be traced stay eager"""
+        self.trace = trace_function(self.fbase.name, self.fbase.arg_names, self.callback)
+        self.explored = True
 
     # Basic numerical evaluation
     # Requires parameters to be ordered
@@ -29,35 +67,46 @@ class function_gradient:
     # Accepts only parameter_wrappers
     # Requires parameter wrappers to be ordered
     def eval_normal_grad(self, parameter_wrappers):
+        if self.tracing and not self.explored:
+            self.explore()
+        if self.trace is not None:
+            t = self.trace
+            if self.specialized is not None:
+                for i, v in self.fixed:
+                    p = parameter_wrappers[i]
+                    if p.value is not v or p.grads is not None:
+                        break
+                else:
+                    t = self.specialized
+            if self.pool is None:
+                return t(*parameter_wrappers)
+            with self.pool.scope():
+                return t(*parameter_wrappers)
         arg_names = self.fbase.arg_names
         nodes = [
             Node(name, [], value=pwrap)
             for name, pwrap in zip(arg_names, parameter_wrappers)
         ]
-        res_node = self.callback(*nodes)
-        return res_node.value
+        if self.pool is None:
+            return self.callback(*nodes).value
+        with self.pool.scope():
+            return self.callback(*nodes).value
 
     def __call__(self, *args):
+        for arg in args:
+            if isinstance(arg, parameter_wrapper):
+                break
+        else:
+            # Plain values do not need to be wrapped
+            return self.eval_normal(args)
         new_args = []
-        have_grad = False
         arg_names = self.fbase.arg_names
         for name, arg in zip(arg_names, args):
-            if isinstance(arg, parameter_wrapper):
-                have_grad = True
-            else:
+            if not isinstance(arg, parameter_wrapper):
                 arg = parameter_wrapper(name, arg)
             new_args.append(arg)
-        if have_grad:
-            return self.eval_normal_grad(new_args)
-        else:
-            return self.eval_normal(args)
+        return self.eval_normal_grad(new_args)
 
 def obtain_constants(root_name, dependents, f):
-    args = [Parameter(str(d)) for d in dependents]
-    root_node = entry.atomic_operation(*args)
-    constants = dict()
-    for node in toposort(root_node):
-        if type(node) is Constant:
-            constants[name] = node.value
+    root_node, constants = name_nodes(root_name, dependents, f)
     return constants
-
@@ -0,0 +1,223 @@
+import math
+import numpy as np
+import scipy as sp
+
+try:
+    from .parameter_wrapper import parameter_wrapper, sift_parameters
+except:
+    from parameter_wrapper import parameter_wrapper, sift_parameters
+
+# This file propagates second derivatives through the operators.
+#
+# In second order mode every parameter_wrapper with gradients also carries the
+# Hessian of its value with respect to every pair of its grads, an array with
+# the shape of the value plus two dimensions of len(grads). For an operator
+# f(u, v) the chain rule gives
+#   grad f = fu grad u + fv grad v
+#   hess f = fu hess u + fv hess v
+#          + fuu grad u grad u^T + fvv grad v grad v^T
+#          + fuv (grad u grad v^T + grad v grad u^T)
+# so every operator only needs its first and second partial derivatives, which
+# are defined below. A partial that is identically zero is None, and the
+# partials of a binary operator know whether its second operand varies.
+#
+# The seeds of the physical parameters have zero Hessians (see second_order).
+
+
+def plus_partials(u, v, y, varying):
+    return 1.0, 1.0, None, None, None
+
+
+def minus_partials(u, v, y, varying):
+    return 1.0, -1.0, None, None, None
+
+
+def mul_partials(u, v, y, varying):
+    return v, u, None, None, 1.0
+
+
+def div_partials(u, v, y, varying):
+    inv = 1.0 / v
+    return inv, -y * inv, None, 2.0 * y * inv * inv, -inv * inv
+
+
+def pow_partials(u, v, y, varying):
+    fu = v * u ** (v - 1)
+    fuu = v * (v - 1) * u ** (v - 2)
+    if not varying:
+        # The log of the base is only needed for the derivatives in the exponent
+        return fu, None, fuu, None, None
+    log_u = np.log(u)
+    return fu, y * log_u, fuu, y * log_u * log_u, u ** (v - 1) * (1.0 + v * log_u)
+
+
+def inv_partials(u, y):
+    return -1.0, None
+
+
+def log_partials(u, y):
+    return 1.0 / u, -1.0 / (u * u)
+
+
+def log10_partials(u, y):
+    return 1.0 / (u * np.log(10.0)), -1.0 / (u * u * np.log(10.0))
+
+
+def log2_partials(u, y):
+    return 1.0 / (u * np.log(2.0)), -1.0 / (u * u * np.log(2.0))
+
+
+def sqrt_partials(u, y):
+    return 0.5 / y, -0.25 / (y * u)
+
+
+def lgamma_partials(u, y):
+    return sp.special.digamma(u), sp.special.polygamma(1, u)
+
+
+def log1p_partials(u, y):
+    inv = 1.0 / (1.0 + u)
+    return inv, -inv * inv
+
+
+binary_partials = {
+    "plus": plus_partials,
+    "minus": minus_partials,
+    "mul": mul_partials,
+    "div": div_partials,
+    "pow": pow_partials,
+}
+
+unary_partials = {
+    "inv": inv_partials,
+    "log": log_partials,
+    "log10": log10_partials,
+    "log2": log2_partials,
+    "sqrt": sqrt_partials,
+    "lgamma": lgamma_partials,
+    "log1p": log1p_partials,
+}
+
+
+def gradient_block(values, shape, n):
+    """Lay out derivatives as an array of the given shape plus n columns
+    A seed shared by every element of an array parameter is broadcast
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == math.prod(shape) * n:
+        return values.reshape(shape + (n,))
+    return np.broadcast_to(values, shape + (n,))
+
+
+def second_order(p):
+    """Give a seeded physical parameter a zero Hessian"""
+    if not isinstance(p, parameter_wrapper) or p.grads is None or p.hessian_values is not None:
+        return p
+    n = len(p.grads)
+    shape = np.shape(p.value)
+    grad_values = gradient_block(p.grad_values, shape, n)
+    return parameter_wrapper(p.name, p.value, grads=p.grads, grad_values=grad_values, hessian_values=np.zeros(shape + (n, n)))
+
+
+def split(p, n, indices):
+    """The value, gradient and Hessian of an operand over n aligned columns
+    Operands without gradients have a None gradient and Hessian
+    """
+    if not isinstance(p, parameter_wrapper):
+        return p, None, None
+    if p.grads is None:
+        return p.value, None, None
+    shape = np.shape(p.value)
+    k = len(p.grads)
+    grad = gradient_block(p.grad_values, shape, k)
+    hess = p.hessian_values
+    hess = np.zeros(shape + (k, k)) if hess is None else np.asarray(hess).reshape(shape + (k, k))
+    if k == n and np.array_equal(indices, np.arange(n)):
+        return p.value, grad, hess
+    g = np.zeros(shape + (n,))
+    g[..., indices] = grad
+    h = np.zeros(shape + (n, n))
+    h[..., indices[:, None], indices[None, :]] = hess
+    return p.value, g, h
+
+
+def up(x, n):
+    """Add n trailing dimensions to a partial derivative"""
+    if np.ndim(x) == 0:
+        return x
+    return np.reshape(x, np.shape(x) + (1,) * n)
+
+
+def outer(g0, g1):
+    return g0[..., :, None] * g1[..., None, :]
+
+
+def accumulate(total, term):
+    return term if total is None else total + term
+
+
+def unary(op, p):
+    """Evaluate a unary operator in second order mode"""
+    n = len(p.grads)
+    u, gu, hu = split(p, n, np.arange(n))
+    if op == "sum":
+        # Sum over the first axis like autodiff.sum
+        return parameter_wrapper(None, u.sum(axis=0), grads=p.grads, grad_values=gu.sum(axis=0), hessian_values=hu.sum(axis=0))
+    y = unary_forward[op](u)
+    fu, fuu = unary_partials[op](u, y)
+    grad = up(fu, 1) * gu
+    hess = up(fu, 2) * hu
+    if fuu is not None:
+        hess = hess + up(fuu, 2) * outer(gu, gu)
+    return parameter_wrapper(None, y, grads=p.grads, grad_values=grad, hessian_values=hess)
+
+
+def binary(op, p0, p1):
+    """Evaluate a binary operator in second order mode"""
+    params = [x if isinstance(x, parameter_wrapper) else parameter_wrapper(None, x) for x in (p0, p1)]
+    n, names, indices = sift_parameters(params)
+    u, gu, hu = split(p0, n, indices[0])
+    v, gv, hv = split(p1, n, indices[1])
+    y = binary_forward[op](u, v)
+    fu, fv, fuu, fvv, fuv = binary_partials[op](u, v, y, gv is not None)
+    grad = hess = None
+    if gu is not None:
+        grad = accumulate(grad, up(fu, 1) * gu)
+        hess = accumulate(hess, up(fu, 2) * hu)
+        if fuu is not None:
+            hess = hess + up(fuu, 2) * outer(gu, gu)
+    if gv is not None:
+        grad = accumulate(grad, up(fv, 1) * gv)
+        hess = accumulate(hess, up(fv, 2) * hv)
+        if fvv is not None:
+            hess = hess + up(fvv, 2) * outer(gv, gv)
+    if gu is not None and gv is not None and fuv is not None:
+        hess = hess + up(fuv, 2) * (outer(gu, gv) + outer(gv, gu))
+    # Broadcast the derivatives to the shape of the result
+    shape = np.shape(y)
+    grad = np.broadcast_to(grad, shape + (n,))
+    hess = np.broadcast_to(hess, shape + (n, n))
+    return parameter_wrapper(None, y, grads=names, grad_values=grad, hessian_values=hess)
+
+
+binary_forward = {
+    "plus": np.add,
+    "minus": np.subtract,
+    "mul": np.multiply,
+    "div": np.divide,
+    "pow": np.power,
+}
+
+unary_forward = {
+    "inv": np.negative,
+    "log": np.log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "sqrt": np.sqrt,
+    "lgamma": sp.special.loggamma,
+    "log1p": np.log1p,
+}
+
+
+def is_second_order(p):
+    return isinstance(p, parameter_wrapper) and p.hessian_values is not None
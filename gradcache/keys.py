@@ -0,0 +1,200 @@
+import numpy as np
+import hashlib
+import itertools
+import math
+import struct
+import weakref
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file defines how cache keys are built from the physical parameters of a
+# function. Plain floats are used as they are (optionally quantized), while
+# arrays are replaced by a cheap fingerprint so that building a key costs
+# O(number of parameters) rather than O(array size).
+#
+# Large arrays are identified by a token that is unique to the array object.
+# The token changes when the array is garbage collected (so a new array reusing
+# the same id() can never alias an old key) or when mark_modified() is called
+# after modifying the array in place.
+
+_serial = itertools.count()
+_tokens = dict()
+
+
+def _forget(ident):
+    _tokens.pop(ident, None)
+
+
+def array_token(x):
+    """A token unique to the array object and its current version"""
+    ident = id(x)
+    entry = _tokens.get(ident)
+    if entry is None or entry[0]() is not x:
+        entry = (weakref.ref(x), next(_serial), None)
+        _tokens[ident] = entry
+        weakref.finalize(x, _forget, ident)
+    return entry[1]
+
+
+def mark_modified(x):
+    """Invalidate keys built from an array that was modified in place"""
+    ident = id(x)
+    entry = _tokens.get(ident)
+    if entry is not None and entry[0]() is x:
+        _tokens[ident] = (entry[0], next(_serial), None)
+
+
+def array_digest(x):
+    """A content digest of an array
+    The digest of a read-only array is memoized with its token
+    """
+    if x.flags.writeable:
+        return hashlib.blake2b(np.ascontiguousarray(x).view(np.uint8), digest_size=16).digest()
+    token = array_token(x)
+    ident = id(x)
+    entry = _tokens[ident]
+    if entry[2] is None:
+        digest = hashlib.blake2b(np.ascontiguousarray(x).view(np.uint8), digest_size=16).digest()
+        entry = (entry[0], token, digest)
+        _tokens[ident] = entry
+    return entry[2]
+
+
+def quantize(x, float_bits):
+    """Round a float to a number of significant mantissa bits"""
+    if x == 0.0 or not math.isfinite(x):
+        return x + 0.0
+    m, e = math.frexp(x)
+    return math.ldexp(round(m * (1 << float_bits)), e - float_bits)
+
+
+def quantize_array(x, float_bits):
+    m, e = np.frexp(x)
+    return np.ldexp(np.round(m * (1 << float_bits)), e - float_bits)
+
+
+class key_builder:
+    """Build hashable cache keys from the physical parameters of a function
+
+    float_bits: if not None floats are rounded to this many significant
+        mantissa bits so that numerically identical points share a key
+    small_array_size: arrays with at most this many elements are keyed by
+        their contents
+    array_mode: how larger arrays are keyed,
+        'identity' -- by the array object and its version token, O(1)
+        'digest' -- by a hash of the contents, memoized for read-only arrays
+    """
+
+    def __init__(self, float_bits=None, small_array_size=64, array_mode="identity"):
+        if array_mode not in ("identity", "digest"):
+            raise ValueError("Unknown array_mode: " + str(array_mode))
+        self.float_bits = float_bits
+        self.small_array_size = small_array_size
+        self.array_mode = array_mode
+
+    def __call__(self, params):
+        return tuple([self.fingerprint(p) for p in params])
+
+    def fingerprint(self, x):
+        t = type(x)
+        if t is float:
+            if self.float_bits is None:
+                return x
+            return quantize(x, self.float_bits)
+        elif t is int or t is bool or t is str or x is None:
+            return x
+        elif t is parameter_wrapper:
+            # A wrapper without gradients is equivalent to its value
+            if x.grads is None:
+                return self.fingerprint(x.value)
+            if x.hessian_values is not None:
+                # Second order requests do not share entries with first order ones
+                return (
+                    parameter_wrapper,
+                    self.fingerprint(x.value),
+                    x.grads,
+                    self.fingerprint_gradient(x.grad_values),
+                    self.fingerprint_gradient(x.hessian_values),
+                )
+            return (
+                parameter_wrapper,
+                self.fingerprint(x.value),
+                x.grads,
+                self.fingerprint_gradient(x.grad_values),
+            )
+        elif isinstance(x, np.ndarray):
+            return self.fingerprint_array(x)
+        elif isinstance(x, np.generic):
+            return self.fingerprint(x.item())
+        elif isinstance(x, tuple):
+            return tuple([self.fingerprint(v) for v in x])
+        else:
+            return x
+
+    def fingerprint_gradient(self, grad_values):
+        if isinstance(grad_values, tuple):
+            return tuple([self.fingerprint(v) for v in grad_values])
+        return self.fingerprint(grad_values)
+
+    def fingerprint_array(self, x):
+        if x.size <= self.small_array_size:
+            if self.float_bits is not None and x.dtype.kind == "f":
+                x = quantize_array(x, self.float_bits)
+            return (np.ndarray, x.shape, x.dtype.str, np.ascontiguousarray(x).tobytes())
+        if self.array_mode == "digest":
+            return (np.ndarray, x.shape, x.dtype.str, array_digest(x))
+        return (np.ndarray, x.shape, x.dtype.str, array_token(x))
+
+
+default_key_builder = key_builder()
+
+
+def is_gradient_key(key):
+    """Whether a key was built from parameters that carry gradients"""
+    for k in key:
+        if type(k) is tuple and len(k) in (4, 5) and k[0] is parameter_wrapper:
+            return True
+    return False
+
+
+def _feed(h, x):
+    """Feed a cache key into a hash, returns False if the key is not stable
+    across processes (it contains identity tokens)
+    """
+    t = type(x)
+    if t is tuple:
+        if len(x) == 4 and x[0] is np.ndarray:
+            if not isinstance(x[3], bytes):
+                return False
+            h.update(b"a" + repr((x[1], x[2])).encode() + x[3])
+            return True
+        h.update(b"(")
+        for v in x:
+            if not _feed(h, v):
+                return False
+        h.update(b")")
+        return True
+    elif t is float:
+        h.update(b"f" + struct.pack("<d", x))
+    elif t is bytes:
+        h.update(b"b" + struct.pack("<q", len(x)) + x)
+    elif x is parameter_wrapper:
+        h.update(b"w")
+    elif t is int or t is bool or t is str or x is None:
+        h.update(b"r" + repr(x).encode() + b";")
+    else:
+        return False
+    return True
+
+
+def stable_digest(key):
+    """A digest of a cache key that is the same in every process
+    Returns None for keys that contain identity tokens
+    """
+    h = hashlib.blake2b(digest_size=20)
+    if not _feed(h, key):
+        return None
+    return h.hexdigest()
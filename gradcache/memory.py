@@ -0,0 +1,169 @@
+import threading
+import tracemalloc
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file defines the backends used to measure the memory cost of a cache miss
+# Every backend implements
+#   start()              -- called before the function is evaluated, returns a token
+#   stop(token, result)  -- called after the function is evaluated, returns the
+#                           number of bytes attributed to the call or None if the
+#                           call was not measured
+
+# Measurements in progress across all tracemalloc backends, the tracemalloc peak
+# is global so nested measurements need to share it. The peak also counts the
+# allocations of every thread, so measurements from different threads (the
+# thread pool executor) are serialized by the lock, which is held from start to
+# stop. Each thread has its own stack of nested measurements.
+_tracemalloc_lock = threading.RLock()
+_tracemalloc_local = threading.local()
+
+
+def _tracemalloc_stack():
+    stack = getattr(_tracemalloc_local, "stack", None)
+    if stack is None:
+        stack = _tracemalloc_local.stack = []
+    return stack
+
+
+def result_nbytes(res):
+    """Number of bytes held by a cached result"""
+    if isinstance(res, parameter_wrapper):
+        return result_nbytes(res.value) + result_nbytes(res.grad_values)
+    elif isinstance(res, (tuple, list)):
+        return sum([result_nbytes(r) for r in res])
+    elif res is None:
+        return 0
+    elif hasattr(res, "nbytes"):
+        return int(res.nbytes)
+    else:
+        return 8
+
+
+class size_memory:
+    """Size the returned value and gradient arrays directly
+    This costs nothing beyond summing the nbytes of the result
+    """
+
+    name = "size"
+
+    def start(self):
+        return None
+
+    def stop(self, token, res):
+        return result_nbytes(res)
+
+
+class tracemalloc_memory:
+    """Track the peak memory allocated during the call with tracemalloc
+    Tracing is started by the outermost measurement if it is not already running,
+    and then stopped when that measurement ends.
+    Nested measurements (a prop computing its dependencies) are supported,
+    the peak of an inner call is folded into the peak of the outer call.
+    Measured calls hold a global lock, so with a thread pool executor the props
+    measured with this backend are computed one at a time.
+    """
+
+    name = "tracemalloc"
+
+    def start(self):
+        _tracemalloc_lock.acquire()
+        stack = _tracemalloc_stack()
+        # Whether this measurement started tracing and has to stop it
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        stack.append([current, current, started])
+        return len(stack)
+
+    def stop(self, token, res):
+        try:
+            stack = _tracemalloc_stack()
+            current, peak = tracemalloc.get_traced_memory()
+            base, inner_peak, started = stack.pop()
+            peak = max(peak, inner_peak)
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            if started:
+                tracemalloc.stop()
+            return peak - base
+        finally:
+            _tracemalloc_lock.release()
+
+
+class rss_memory:
+    """Difference of the resident set size before and after the call
+    Requires psutil. This is noisy and also counts allocations made by other
+    threads, it is kept for comparison with the other backends.
+    """
+
+    name = "rss"
+
+    def __init__(self):
+        import os
+        import psutil
+
+        self.process = psutil.Process(os.getpid())
+
+    def start(self):
+        return self.process.memory_info().rss
+
+    def stop(self, token, res):
+        return self.process.memory_info().rss - token
+
+
+class sampled_memory:
+    """Only measure every Nth call with another backend"""
+
+    def __init__(self, backend, every=10):
+        self.backend = backend
+        self.every = every
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.name = backend.name
+
+    def start(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        if (calls - 1) % self.every:
+            return None
+        return (self.backend.start(),)
+
+    def stop(self, token, res):
+        if token is None:
+            return None
+        return self.backend.stop(token[0], res)
+
+
+memory_backends = {
+    "size": size_memory,
+    "tracemalloc": tracemalloc_memory,
+    "rss": rss_memory,
+}
+
+
+def make_memory_backend(backend=None, every=None):
+    """Build a memory backend from a name, a backend class, or an instance
+    If every is given only every Nth call is measured
+    """
+    if backend is None:
+        backend = "size"
+    if isinstance(backend, str):
+        if backend not in memory_backends:
+            raise ValueError(
+                "Unknown memory backend: " + backend + ", expected one of " + str(sorted(memory_backends.keys()))
+            )
+        backend = memory_backends[backend]()
+    elif isinstance(backend, type):
+        backend = backend()
+    if every is not None and every > 1:
+        backend = sampled_memory(backend, every)
+    return backend
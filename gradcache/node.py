@@ -14,6 +14,9 @@ except:
 class Node:
     """A node in a computation graph."""
 
+    # Make numpy defer to the Node operators instead of broadcasting over them
+    __array_ufunc__ = None
+
     def __init__(self, op, children, value=None):
         self.children = children
         self.op = op
@@ -101,7 +104,10 @@ def query_evaluate(x):
 
 
 def build_op(token, n, rev):
-    """Build an operator function that wraps the operands in Nodes and optionally evaluates the operation"""
+    """Build an operator function that wraps the operands in Nodes and optionally evaluates the operation
+    Evaluated nodes do not keep their operands, so intermediate values are freed
+    as soon as the function drops them and the operands can be used again
+    """
     if n == 2:
         op = str(token)
         if rev:
@@ -111,12 +117,9 @@ def build_op(token, n, rev):
                     sval = query_value(self)
                     oval = query_value(other)
                     res = ops[op].eval(oval, sval)
-                    for n in [self, other]:
-                        if type(n) is Node:
-                            n.reset()
                     if isinstance(self, Constant) and isinstance(other, Constant):
-                        return Constant(value)
-                    return Node(op, [other, self], value=res)
+                        return Constant(res)
+                    return Node(op, [], value=res)
                 else:
                     if not isinstance(other, Node):
                         other = Constant(other)
@@ -129,12 +132,9 @@ def build_op(token, n, rev):
                     sval = query_value(self)
                     oval = query_value(other)
                     res = ops[op].eval(sval, oval)
-                    for n in [self, other]:
-                        if type(n) is Node:
-                            n.reset()
                     if isinstance(self, Constant) and isinstance(other, Constant):
-                        return Constant(value)
-                    return Node(op, [self, other], value=res)
+                        return Constant(res)
+                    return Node(op, [], value=res)
                 else:
                     if not isinstance(other, Node):
                         other = Constant(other)
@@ -147,11 +147,9 @@ def build_op(token, n, rev):
             if query_evaluate(self):
                 sval = query_value(self)
                 res = ops[op].eval(sval)
-                if type(self) is Node:
-                    self.reset()
                 if isinstance(self, Constant):
-                    return Constant(value)
-                return Node(op, [self], value=res)
+                    return Constant(res)
+                return Node(op, [], value=res)
             else:
                 return Node(op, [self])
 
@@ -159,23 +157,25 @@ def build_op(token, n, rev):
 
 
 def name_nodes(root_name, dependents, f):
-    """Give names to the nodes in a computation graph"""
+    """Give names to the nodes in a computation graph
+    The function is called once with a symbolic Parameter for every dependent
+    """
     args = [Parameter(str(d)) for d in dependents]
-    root_node = entry.atomic_operation(*args)
+    root_node = f(*args)
+    if not isinstance(root_node, Node):
+        raise TypeError(str(root_name) + " does not return a computation graph")
     const_counter = 0
     node_counter = 0
     constants = dict()
     for node in toposort(root_node):
-        if type(node) is Constant:
+        if isinstance(node, Constant):
             name = "#" + root_name + ":const" + str(const_counter)
             const_counter += 1
             constants[name] = node.value
+            node.name = name
         elif type(node) is Node:
-            name = "#" + root_name + ":value" + str(node_counter)
+            node.name = "#" + root_name + ":value" + str(node_counter)
             node_counter += 1
-        else:
-            pass
-        node.name = name
     return root_node, constants
 
 
@@ -211,15 +211,19 @@ operators = [
     ("__rmul__", "mul", 2, True),
     ("__div__", "div", 2, False),
     ("__rdiv__", "div", 2, True),
+    ("__truediv__", "div", 2, False),
+    ("__rtruediv__", "div", 2, True),
     ("__pow__", "pow", 2, False),
     ("__rpow__", "pow", 2, True),
     ("__invert__", "inv", 1, False),
+    ("__neg__", "inv", 1, False),
     ("log", "log", 1, False),
     ("log10", "log10", 1, False),
     ("log2", "log2", 1, False),
     ("sqrt", "sqrt", 1, False),
     ("lgamma", "lgamma", 1, False),
     ("log1p", "log1p", 1, False),
+    ("sum", "sum", 1, False),
 ]
 
 # Register operators with the Node class
@@ -244,9 +248,23 @@ methods = [
 ]
 
 
+def dispatch_op(method, op):
+    """Defer to the method of objects that implement the operator themselves
+    (such as the nodes of a reverse mode tape), plain values are evaluated directly"""
+
+    def inner(x):
+        if not isinstance(x, Node):
+            if hasattr(x, method):
+                return getattr(x, method)()
+            return getattr(ad, method)(x)
+        return op(x)
+
+    return inner
+
+
 # Register the methods in this namespace
 for method in methods:
-    set_op(globals(), method, method, 1, False)
+    globals()[method] = dispatch_op(method, build_op(method, 1, False))
 
 
 if __name__ == "__main__":
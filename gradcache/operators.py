@@ -6,8 +6,10 @@ except:
 
 try:
     from .parameter_wrapper import parameter_wrapper, sift_parameters
+    from . import hessian
 except:
     from parameter_wrapper import parameter_wrapper, sift_parameters
+    import hessian
 
 def evaluate_grad_operator(op_grad, parameter_wrappers, ngrads=None, names=None, final_indices=None):
     if ngrads is None or names is None or final_indices is None:
@@ -20,6 +22,24 @@ def evaluate_grad_operator(op_grad, parameter_wrappers, ngrads=None, names=None,
     res, res_grad = op_grad(*args)
     return parameter_wrapper(None, res, grads=names, grad_values=res_grad)
 
+# The gradient layout of a result, (ngrads, names, final_indices), only depends
+# on the grads of the operands. It is remembered for every pair of grads met at
+# an operator site, so the layout of a fixed graph is resolved once instead of on
+# every evaluation. At most max_layouts pairs are kept per site.
+max_layouts = 64
+
+
+def sift_layout(layouts, param0, param1):
+    key = (param0.grads, param1.grads)
+    layout = layouts.get(key)
+    if layout is None:
+        if len(layouts) >= max_layouts:
+            layouts.clear()
+        layout = sift_parameters([param0, param1])
+        layouts[key] = layout
+    return layout
+
+
 class binary_operator:
     def __init__(self, name, op_base, op_10, op_01, op_grad):
         self.name = name
@@ -28,13 +48,19 @@ class binary_operator:
         self.op_01 = op_01
         self.op_grad = op_grad
         self.ops = [self.op_base, self.op_01, self.op_10, self.op_grad]
+        # The layouts met by eager evaluations, which share the operator
+        self.layouts = dict()
 
     def eval(self, param0, param1, ngrads=None, names=None, final_indices=None):
         if isinstance(param0, parameter_wrapper):
+            if param0.hessian_values is not None:
+                return hessian.binary(self.name, param0, param1)
             p0v, p0g = param0.value, param0.grad_values
         else:
             p0v, p0g = param0, None
         if isinstance(param1, parameter_wrapper):
+            if param1.hessian_values is not None:
+                return hessian.binary(self.name, param0, param1)
             p1v, p1g = param1.value, param1.grad_values
         else:
             p1v, p1g = param1, None
@@ -54,6 +80,8 @@ class binary_operator:
             res_value, res_grad = op((p0v, p0g), p1v)
             names = param0.grads
         elif b == 3:
+            if ngrads is None or names is None or final_indices is None:
+                ngrads, names, final_indices = sift_layout(self.layouts, param0, param1)
             res = evaluate_grad_operator(op, [param0, param1], ngrads=ngrads, names=names, final_indices=final_indices)
             return res
 
@@ -67,6 +95,8 @@ class unary_operator:
 
     def eval(self, param0, ngrads=None, names=None, final_indices=None):
         if isinstance(param0, parameter_wrapper):
+            if param0.hessian_values is not None:
+                return hessian.unary(self.name, param0)
             p0v, p0g = param0.value, param0.grad_values
         else:
             p0v, p0g = param0, None
@@ -111,6 +141,29 @@ class nary_operator:
             res = parameter_wrapper(None, res_value, grads=names, grad_values=res_grad)
         return res
 
+class operator_site:
+    """An operator at one step of a traced graph
+    Binary operators remember the gradient layouts met at this step
+    """
+
+    def __init__(self, op):
+        self.op = op
+        self.layouts = dict()
+
+    def __call__(self, *params):
+        if len(params) == 2:
+            param0, param1 = params
+            if (
+                isinstance(param0, parameter_wrapper)
+                and isinstance(param1, parameter_wrapper)
+                and param0.grads is not None
+                and param1.grads is not None
+            ):
+                ngrads, names, final_indices = sift_layout(self.layouts, param0, param1)
+                return self.op.eval(param0, param1, ngrads, names, final_indices)
+        return self.op.eval(*params)
+
+
 operators = {
         'plus': binary_operator('plus', ad.plus, ad.plus_10, ad.plus_01, ad.plus_grad),
         'minus': binary_operator('minus', ad.minus, ad.minus_10, ad.minus_01, ad.minus_grad),
@@ -123,6 +176,7 @@ operators = {
         'log10': unary_operator('log10', ad.log10, ad.log10_grad),
         'log2': unary_operator('log2', ad.log2, ad.log2_grad),
         'sqrt': unary_operator('sqrt', ad.sqrt, ad.sqrt_grad),
+        'log1p': unary_operator('log1p', ad.log1p, ad.log1p_grad),
         'sum': unary_operator('sum', ad.sum, ad.sum_grad),
         }
 
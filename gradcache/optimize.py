@@ -0,0 +1,113 @@
+import numpy as np
+
+try:
+    from .operators import operators as ops
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from operators import operators as ops
+    from parameter_wrapper import parameter_wrapper
+
+# This file defines the optimization passes run over traced prop functions.
+#
+# A pass takes the steps of a trace (name, op, operand names), its constants
+# (name -> value) and the name of its result, and returns the rewritten steps,
+# constants and result along with the number of nodes it removed:
+# - fold evaluates the steps whose operands are all constants
+# - cse reuses the first of several equal constants or of several steps
+#   applying the same operator to the same operands
+# - dead drops the steps and constants the result does not depend on
+#
+# The Node operators already fold operations between two constants while the
+# function is traced. The fold pass runs first and catches the steps whose
+# operands became constants after tracing, the arguments fixed by
+# trace.specialize. cse then merges the constants fold created with the others.
+
+
+def fold_constants(root, steps, constants, result):
+    """Evaluate the steps whose operands are all constants"""
+    rename = dict()
+    counter = len(constants)
+    new_steps = []
+    for name, op, operands in steps:
+        operands = [rename.get(o, o) for o in operands]
+        if all([o in constants for o in operands]):
+            value = ops[op].eval(*[constants[o] for o in operands])
+            if isinstance(value, parameter_wrapper):
+                value = value.value
+            const_name = "#" + str(root) + ":const" + str(counter)
+            while const_name in constants:
+                counter += 1
+                const_name = "#" + str(root) + ":const" + str(counter)
+            constants[const_name] = value
+            rename[name] = const_name
+        else:
+            new_steps.append((name, op, operands))
+    return new_steps, constants, rename.get(result, result), len(steps) - len(new_steps)
+
+
+def same_constant(x, y):
+    """Whether two constants can be merged without comparing array contents"""
+    if x is y:
+        return True
+    if np.ndim(x) != 0 or np.ndim(y) != 0 or np.asarray(x).dtype != np.asarray(y).dtype:
+        return False
+    return bool(x == y)
+
+
+def eliminate_common(root, steps, constants, result):
+    """Merge equal constants and steps computing the same value"""
+    alias = dict()
+    kept = dict()
+    for name, value in constants.items():
+        for other, other_value in kept.items():
+            if same_constant(value, other_value):
+                alias[name] = other
+                break
+        else:
+            kept[name] = value
+    seen = dict()
+    new_steps = []
+    for name, op, operands in steps:
+        operands = [alias.get(o, o) for o in operands]
+        key = (op, tuple(operands))
+        if key in seen:
+            alias[name] = seen[key]
+            continue
+        seen[key] = name
+        new_steps.append((name, op, operands))
+    removed = len(constants) - len(kept) + len(steps) - len(new_steps)
+    return new_steps, kept, alias.get(result, result), removed
+
+
+def eliminate_dead(root, steps, constants, result):
+    """Drop the steps and constants the result does not depend on"""
+    needed = set([result])
+    new_steps = []
+    for name, op, operands in reversed(steps):
+        if name in needed:
+            needed.update(operands)
+            new_steps.append((name, op, operands))
+    new_steps.reverse()
+    kept = dict([(name, value) for name, value in constants.items() if name in needed])
+    removed = len(constants) - len(kept) + len(steps) - len(new_steps)
+    return new_steps, kept, result, removed
+
+
+# The passes run by optimize, in order
+passes = [
+    ("fold", fold_constants),
+    ("cse", eliminate_common),
+    ("dead", eliminate_dead),
+]
+
+
+def optimize(root, steps, constants, result):
+    """Run all the passes, returns the optimized graph and the number of nodes
+    each pass removed
+    """
+    report = dict([("nodes", len(steps) + len(constants))])
+    for name, f in passes:
+        steps, constants, result, removed = f(root, list(steps), dict(constants), result)
+        report[name] = removed
+    report["remaining"] = len(steps) + len(constants)
+    return steps, constants, result, report
@@ -4,22 +4,32 @@ from operator import itemgetter
 
 class parameter_wrapper(tuple):
     __slots__ = []
-    def __new__(cls, name, value, grads=None, grad_values=None):
+    def __new__(cls, name, value, grads=None, grad_values=None, hessian_values=None):
         if grads is not None:
             grads = tuple(grads)
             if grad_values is None:
                 grad_values = tuple((None for _ in range(len(grads))))
-            else:
+            elif not isinstance(grad_values, np.ndarray):
+                # Arrays are kept as they are, splitting them into a tuple of
+                # rows would copy them on every operation
                 grad_values = tuple(grad_values)
         else:
             grads = None
             grad_values = None
-        return tuple.__new__(cls, (name, value, grads, grad_values))
+            hessian_values = None
+        return tuple.__new__(cls, (name, value, grads, grad_values, hessian_values))
+
+    def __getnewargs__(self):
+        # Needed to pickle results sent between processes
+        return tuple(self)
 
     name = property(itemgetter(0))
     value = property(itemgetter(1))
     grads = property(itemgetter(2))
     grad_values = property(itemgetter(3))
+    # Second derivatives with respect to every pair of grads, in second order
+    # mode only (see hessian.py)
+    hessian_values = property(itemgetter(4))
 
     def primitive(self):
         if self.grad_values is None:
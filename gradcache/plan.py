@@ -0,0 +1,256 @@
+import heapq
+import operator
+import numpy as np
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file compiles the props reachable from a root prop into a flat evaluation
+# plan. A plan holds the props in topological order (dependencies first) and
+# precomputed slot indices for extracting the parameters and argument values of
+# every prop, so that a request is served by two tight loops instead of a
+# recursive walk through function_context.
+#
+# All values of a request live in a single list of slots. The first slots hold
+# the physical parameters (in the order of plan.param_names) and the remaining
+# slots hold the result of each step.
+#
+# A request is evaluated in two passes
+#   1. From the root down, look up every step that is needed in its cache.
+#      A step is needed if it is the root or a dependency of a step that missed.
+#   2. From the leaves up, compute every step that missed.
+# so dependencies are only evaluated when a prop that needs them misses, exactly
+# as with the recursive evaluation.
+#
+# A batch of parameter points is evaluated the same way, the lookups of all the
+# points are made first and the misses are then computed step by step. Points
+# that share the key of a step (parameter-independent props) compute it once,
+# and batchable props compute all their missed points in a single call with a
+# leading batch axis on every argument. Batching is opt-in and value-only, the
+# operators do not propagate gradients along a batch axis, so a step with a
+# gradient argument computes its points one at a time.
+
+
+def tuple_getter(indices):
+    """Build a function that extracts a tuple of slots"""
+    indices = list(indices)
+    if len(indices) == 0:
+        return lambda slots: ()
+    elif len(indices) == 1:
+        i = indices[0]
+        return lambda slots: (slots[i],)
+    else:
+        return operator.itemgetter(*indices)
+
+
+class slot_getter:
+    """Extract the argument values of a step from the slots of a request
+    Mirrors context.value_getter so caches can inspect the parameters
+    """
+
+    __slots__ = ["values", "slots", "parameters"]
+
+    def __init__(self, values, slots, parameters):
+        self.values = values
+        self.slots = slots
+        self.parameters = parameters
+
+    def __call__(self):
+        return self.values(self.slots)
+
+
+class plan_step:
+    """One prop of an evaluation plan"""
+
+    __slots__ = ["name", "cache", "key_builder", "params", "values", "deps", "slot", "batchable"]
+
+    def __init__(self, name, cache, key_builder, params, values, deps, slot, batchable=False):
+        self.name = name
+        self.cache = cache
+        self.key_builder = key_builder
+        self.params = params
+        self.values = values
+        self.deps = deps
+        self.slot = slot
+        self.batchable = batchable
+
+
+class evaluation_plan:
+    """A flat, topologically ordered evaluation plan for a root prop"""
+
+    def __init__(self, the_store, root):
+        self.root = root
+        self.order = self.toposort(the_store, root)
+
+        # Physical parameters used anywhere in the plan
+        param_names = []
+        for name in self.order:
+            context = the_store.props[name].context
+            for p in context.physical_props + context.implicit_physical_props:
+                if p not in param_names:
+                    param_names.append(p)
+        self.param_names = param_names
+        self.nparams = len(param_names)
+
+        param_slots = dict([(p, i) for i, p in enumerate(param_names)])
+        step_slots = dict([(name, self.nparams + i) for i, name in enumerate(self.order)])
+        step_indices = dict([(name, i) for i, name in enumerate(self.order)])
+
+        self.steps = []
+        for name in self.order:
+            func_wrap = the_store.props[name]
+            context = func_wrap.context
+            key_params = context.physical_props + context.implicit_physical_props
+            value_slots = []
+            for dep in context.dependents:
+                if dep in step_slots:
+                    value_slots.append(step_slots[dep])
+                else:
+                    value_slots.append(param_slots[dep])
+            self.steps.append(
+                plan_step(
+                    name,
+                    func_wrap.cache,
+                    context.key_builder,
+                    tuple_getter([param_slots[p] for p in key_params]),
+                    tuple_getter(value_slots),
+                    [step_indices[dep] for dep in context.props],
+                    step_slots[name],
+                    # Results read from disk are keyed per point
+                    the_store.batchable_props.get(name, False) and func_wrap.disk is None,
+                )
+            )
+        self.nslots = self.nparams + len(self.steps)
+        self.param_getter = operator.itemgetter(*param_names) if len(param_names) else None
+
+    @staticmethod
+    def toposort(the_store, root):
+        """The props reachable from root, dependencies first"""
+        order = []
+        visited = set()
+        stack = [(root, False)]
+        while stack:
+            name, expanded = stack.pop()
+            if expanded:
+                order.append(name)
+                continue
+            if name in visited:
+                continue
+            visited.add(name)
+            stack.append((name, True))
+            for dep in reversed(the_store.props[name].context.props):
+                if dep not in visited:
+                    stack.append((dep, False))
+        return order
+
+    def extract_slots(self, physical_parameters):
+        slots = [None] * self.nslots
+        if self.nparams == 1:
+            slots[0] = self.param_getter(physical_parameters)
+        elif self.nparams > 1:
+            slots[: self.nparams] = self.param_getter(physical_parameters)
+        return slots
+
+    def lookup(self, slots):
+        """First pass: look up the needed steps, returns the steps that missed"""
+        steps = self.steps
+        # Needed steps are visited from the root down, a max-heap of step
+        # indices keeps the visit cost proportional to the needed steps only
+        heap = [-(len(steps) - 1)]
+        queued = set(heap)
+        missed = []
+        while heap:
+            step = steps[-heapq.heappop(heap)]
+            if slots[step.slot] is not None:
+                # Results given by the caller
+                continue
+            parameters = step.params(slots)
+            key = step.key_builder(parameters)
+            found, res = step.cache.lookup(key, parameters)
+            if found:
+                slots[step.slot] = res
+            else:
+                missed.append((step, key, parameters))
+                for j in step.deps:
+                    if -j not in queued:
+                        queued.add(-j)
+                        heapq.heappush(heap, -j)
+        return missed
+
+    def compute(self, slots, missed):
+        """Second pass: compute the steps that missed, dependencies first"""
+        for step, key, parameters in reversed(missed):
+            getter = slot_getter(step.values, slots, parameters)
+            slots[step.slot] = step.cache.fill(key, getter)
+
+    def __call__(self, physical_parameters):
+        slots = self.extract_slots(physical_parameters)
+        missed = self.lookup(slots)
+        if missed:
+            self.compute(slots, missed)
+        return slots[-1]
+
+    def batch(self, points):
+        """Evaluate the plan for a list of physical parameter dicts"""
+        requests = []
+        pending = dict()
+        for physical_parameters in points:
+            slots = self.extract_slots(physical_parameters)
+            missed = self.lookup(slots)
+            requests.append(slots)
+            for step, key, parameters in missed:
+                pending.setdefault(step.slot, []).append((slots, key, parameters))
+        for step in self.steps:
+            entries = pending.get(step.slot)
+            if not entries:
+                continue
+            # Points with the same key are computed once
+            groups = dict()
+            for slots, key, parameters in entries:
+                groups.setdefault(key, []).append((slots, parameters))
+            if not (step.batchable and len(groups) > 1 and self.compute_batch(step, groups)):
+                for key, group in groups.items():
+                    slots, parameters = group[0]
+                    ret = step.cache.fill(key, slot_getter(step.values, slots, parameters))
+                    for slots, _ in group:
+                        slots[step.slot] = ret
+        return [slots[-1] for slots in requests]
+
+    def compute_batch(self, step, groups):
+        """Compute the missed points of a batchable step in a single call
+        Returns False if the arguments can not be batched, which is the case of
+        every gradient request
+        """
+        groups = list(groups.items())
+        values = [step.values(group[0][0]) for key, group in groups]
+        for args in values:
+            for arg in args:
+                if isinstance(arg, parameter_wrapper):
+                    return False
+        n = len(groups)
+        batched = []
+        for column in zip(*values):
+            first = column[0]
+            if all([arg is first for arg in column]):
+                # Shared arguments are broadcast without copying
+                first = np.asarray(first)
+                batched.append(np.broadcast_to(first, (n,) + first.shape))
+            else:
+                batched.append(np.stack(column))
+        batched = tuple(batched)
+        ret, cost = step.cache.compute(None, lambda: batched)
+        if np.ndim(ret) == 0 or len(ret) != n:
+            raise ValueError(
+                "Batchable prop " + str(step.name) + " must return a leading batch axis of length " + str(n)
+            )
+        for i, (key, group) in enumerate(groups):
+            res = ret[i]
+            if isinstance(res, np.ndarray):
+                # Entries do not keep the whole batch alive
+                res = res.copy()
+            step.cache.commit(key, res, cost / n, group[0][1])
+            for slots, _ in group:
+                slots[step.slot] = res
+        return True
@@ -0,0 +1,200 @@
+import collections
+import heapq
+import itertools
+
+# This file defines the eviction policies available to the function caches
+# A policy only holds the bookkeeping required to pick the next key to evict,
+# the cached values themselves live in the cache
+# Every policy implements the same small interface:
+#   insert(key, cost, size) -- a new entry was stored
+#   hit(key)                -- an existing entry was accessed
+#   remove(key, evicted)    -- an entry left the cache, evicted is True
+#                              when the policy chose it as the victim
+#   victim()                -- the key that should be evicted next
+#   priority(key)           -- the current eviction priority of a key
+#                              (lower priorities are evicted first)
+#   clear()                 -- forget all entries
+# cost is the measured time needed to recompute the entry and size is the
+# number of bytes the entry occupies
+
+
+class fifo_policy:
+    """Evict the oldest entry regardless of how often it is used"""
+
+    name = "fifo"
+    needs_cost = False
+
+    def __init__(self):
+        self.order = collections.OrderedDict()
+        self.counter = itertools.count()
+
+    def insert(self, key, cost=None, size=None):
+        self.order[key] = next(self.counter)
+
+    def hit(self, key):
+        pass
+
+    def remove(self, key, evicted=False):
+        self.order.pop(key, None)
+
+    def victim(self):
+        return next(iter(self.order))
+
+    def priority(self, key):
+        return self.order[key]
+
+    def clear(self):
+        self.order.clear()
+
+    def __len__(self):
+        return len(self.order)
+
+
+class lru_policy(fifo_policy):
+    """Evict the least recently used entry"""
+
+    name = "lru"
+
+    def hit(self, key):
+        self.order[key] = next(self.counter)
+        self.order.move_to_end(key)
+
+
+class heap_policy:
+    """Base class for policies that evict the entry with the lowest priority
+    Stale heap items are skipped lazily when looking for a victim
+    """
+
+    name = None
+    needs_cost = False
+
+    def __init__(self):
+        self.heap = []
+        self.entries = dict()
+        self.counter = itertools.count()
+
+    def push(self, key, priority):
+        item = (priority, next(self.counter), key)
+        self.entries[key] = item
+        heapq.heappush(self.heap, item)
+        # Rebuild the heap once stale items dominate it
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+
+    def remove(self, key, evicted=False):
+        self.entries.pop(key, None)
+
+    def victim(self):
+        while self.heap:
+            item = self.heap[0]
+            if self.entries.get(item[2]) is item:
+                return item[2]
+            heapq.heappop(self.heap)
+        raise KeyError("victim(): policy is empty")
+
+    def priority(self, key):
+        return self.entries[key][0]
+
+    def clear(self):
+        self.heap = []
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class lfu_policy(heap_policy):
+    """Evict the least frequently used entry
+    Ties are broken by evicting the least recently used entry
+    """
+
+    name = "lfu"
+
+    def __init__(self):
+        heap_policy.__init__(self)
+        self.counts = dict()
+
+    def insert(self, key, cost=None, size=None):
+        self.counts[key] = 1
+        self.push(key, 1)
+
+    def hit(self, key):
+        if key in self.counts:
+            self.counts[key] += 1
+            self.push(key, self.counts[key])
+
+    def remove(self, key, evicted=False):
+        self.counts.pop(key, None)
+        heap_policy.remove(self, key)
+
+    def clear(self):
+        self.counts.clear()
+        heap_policy.clear(self)
+
+
+class greedy_dual_policy(heap_policy):
+    """GreedyDual-Size eviction
+    Each entry has priority H = L + cost / size where cost is the measured
+    recompute time and size is the number of bytes held by the entry.
+    L is raised to the priority of every evicted entry so that entries which
+    are not accessed age out relative to newly inserted ones.
+    Expensive and small entries stay resident while cheap and large entries
+    are evicted first.
+    """
+
+    name = "cost"
+    needs_cost = True
+
+    def __init__(self):
+        heap_policy.__init__(self)
+        self.inflation = 0.0
+        self.ratios = dict()
+
+    def insert(self, key, cost=None, size=None):
+        if cost is None:
+            cost = 0.0
+        if size is None or size <= 0:
+            size = 1
+        self.ratios[key] = float(cost) / float(size)
+        self.push(key, self.inflation + self.ratios[key])
+
+    def hit(self, key):
+        if key in self.ratios:
+            self.push(key, self.inflation + self.ratios[key])
+
+    def remove(self, key, evicted=False):
+        # Only evictions age the cache
+        if evicted and key in self.entries:
+            self.inflation = max(self.inflation, self.entries[key][0])
+        self.ratios.pop(key, None)
+        heap_policy.remove(self, key)
+
+    def clear(self):
+        self.inflation = 0.0
+        self.ratios.clear()
+        heap_policy.clear(self)
+
+
+policies = {
+    "fifo": fifo_policy,
+    "lru": lru_policy,
+    "lfu": lfu_policy,
+    "cost": greedy_dual_policy,
+    "greedy_dual": greedy_dual_policy,
+}
+
+
+def make_policy(policy=None):
+    """Build an eviction policy from a name, a policy class, or an instance"""
+    if policy is None:
+        policy = "lru"
+    if isinstance(policy, str):
+        if policy not in policies:
+            raise ValueError(
+                "Unknown cache policy: " + policy + ", expected one of " + str(sorted(policies.keys()))
+            )
+        return policies[policy]()
+    if isinstance(policy, type):
+        return policy()
+    return policy
@@ -0,0 +1,130 @@
+import collections
+import math
+import threading
+import weakref
+import numpy as np
+
+# This file defines a pool of preallocated arrays for the autodiff kernels.
+#
+# While a prop is evaluated with gradients, the kernels in autodiff.py write
+# their results into arrays drawn from the active pool (see autodiff.new and
+# autodiff.apply) instead of allocating new ones. The memory of an array goes
+# back to the pool as soon as the array and every view of it are garbage, so
+# the temporaries of one operator are reused by the next, and the next
+# evaluation of a static graph (the next optimizer iteration) finds every
+# buffer it needs already allocated. Results held by the caches are never
+# reused while they are referenced.
+#
+# Arrays are handed out as views of a flat array over a memoryview of the pooled
+# memory. numpy collapses the base of every further view onto that flat array,
+# which is the object whose lifetime is tracked.
+
+_local = threading.local()
+
+
+def active_pool():
+    """The pool of the evaluation running in this thread, or None"""
+    return getattr(_local, "pool", None)
+
+
+class pool_scope:
+    """Make a pool active in this thread"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(_local, "pool", None)
+        _local.pool = self.pool
+        return self.pool
+
+    def __exit__(self, *args):
+        _local.pool = self.previous
+
+
+class buffer_pool:
+    """Free memory blocks keyed by their size in bytes
+    Arrays smaller than min_nbytes are cheaper to allocate than to track and are
+    not pooled, at most max_nbytes of free memory is kept
+    """
+
+    def __init__(self, max_nbytes=None, min_nbytes=4096):
+        self.free = dict()
+        self.max_nbytes = max_nbytes
+        self.min_nbytes = min_nbytes
+        # The bytes held by the free lists
+        self.free_nbytes = 0
+        self.lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+        # The blocks of the arrays handed out, with a weak reference to each array
+        self.lent = dict()
+        # Blocks of arrays that became garbage, moved to the free lists by take.
+        # The weak reference callbacks may run during a garbage collection
+        # triggered while the lock is held, so they must not take it.
+        self.returns = collections.deque()
+
+    def take(self, shape, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        count = math.prod(shape)
+        nbytes = count * dtype.itemsize
+        if nbytes < self.min_nbytes:
+            return np.empty(shape, dtype=dtype)
+        with self.lock:
+            self.drain()
+            free = self.free.get(nbytes)
+            if free:
+                block = free.pop()
+                self.free_nbytes -= nbytes
+                self.reuses += 1
+            else:
+                block = None
+                self.allocations += 1
+        if block is None:
+            block = np.empty(nbytes, dtype=np.uint8)
+        flat = np.frombuffer(memoryview(block), dtype=dtype, count=count)
+        ref = weakref.ref(flat, self.returned)
+        self.lent[id(ref)] = (ref, block)
+        return flat.reshape(shape)
+
+    def returned(self, ref):
+        """Called when an array handed out and all its views are garbage"""
+        self.returns.append(self.lent.pop(id(ref))[1])
+
+    def give(self, block):
+        """Return a memory block to the pool"""
+        with self.lock:
+            self.keep(block)
+
+    def keep(self, block):
+        # Called with the lock held
+        if self.max_nbytes is not None and self.free_nbytes + block.nbytes > self.max_nbytes:
+            return
+        self.free.setdefault(block.nbytes, []).append(block)
+        self.free_nbytes += block.nbytes
+
+    def drain(self):
+        # Called with the lock held
+        while self.returns:
+            self.keep(self.returns.popleft())
+
+    @property
+    def nbytes(self):
+        """The bytes of free memory, including the blocks returned since the last take"""
+        with self.lock:
+            self.drain()
+            return self.free_nbytes
+
+    def clear(self):
+        with self.lock:
+            self.returns.clear()
+            self.free.clear()
+            self.free_nbytes = 0
+
+    def reset_counts(self):
+        self.allocations = 0
+        self.reuses = 0
+
+    def scope(self):
+        return pool_scope(self)
@@ -5,24 +5,328 @@ import numpy as np
 try:
     from .node import Node, Constant, Parameter, name_nodes, toposort
     from .wrapper import function_wrapper
+    from .budget import memory_budget
+    from .keys import default_key_builder
+    from .disk_cache import code_hash, combine_versions, disk_keys
+    from .stats import stats_row, stats_table
+    from .plan import evaluation_plan
+    from .columns import column
+    from .reverse import reverse_evaluator
+    from .sparse import prune_parameters, densify
+    from .executor import parallel_executor
+    from .parameter_wrapper import parameter_wrapper
+    from .pool import buffer_pool as new_buffer_pool
+    from .hessian import second_order
+    from .tangents import seed_tangents, tangent_order
+    from .registry import gradient_registry
 except:
     from node import Node, Constant, Parameter, name_nodes, toposort
     from wrapper import function_wrapper
+    from budget import memory_budget
+    from keys import default_key_builder
+    from disk_cache import code_hash, combine_versions, disk_keys
+    from stats import stats_row, stats_table
+    from plan import evaluation_plan
+    from columns import column
+    from reverse import reverse_evaluator
+    from sparse import prune_parameters, densify
+    from executor import parallel_executor
+    from parameter_wrapper import parameter_wrapper
+    from pool import buffer_pool as new_buffer_pool
+    from hessian import second_order
+    from tangents import seed_tangents, tangent_order
+    from registry import gradient_registry
 
 class store:
-    def __init__(self, default_cache_size=1, default_probe_func=True):
+    def __init__(
+        self,
+        default_cache_size=1,
+        default_probe_func=True,
+        default_cache_policy="lru",
+        memory_budget=None,
+        budget_policy="cost",
+        key_builder=None,
+        cache_dir=None,
+        memory_backend="size",
+        memory_sample_every=None,
+        compile_plans=True,
+        threads=None,
+        prune_seeds=True,
+        buffer_pool=False,
+        trace_functions=False,
+        hoist=False,
+    ):
         self.default_cache_size = default_cache_size
+        self.default_cache_policy = default_cache_policy
         self.props = dict()
+        # Props whose function accepts a leading batch axis on every argument
+        self.batchable_props = dict()
+        # Props that sum over the events of their inputs (see stream.py)
+        self.reduction_props = dict()
         self.cache_sizes = dict()
+        self.cache_policies = dict()
         self.initialized_props = dict()
         self.initialized_cache_props = dict()
         self.default_probe_func = default_probe_func
-
-    def get_prop(self, name, physical_parameters=None, *args, **kwargs):
+        # Builds the cache keys from the physical parameters of each prop
+        if key_builder is None:
+            key_builder = default_key_builder
+        self.key_builder = key_builder
+        # Props added with persist=True store their results under this directory
+        self.cache_dir = cache_dir
+        self.persistent_props = dict()
+        # How the memory cost of cache misses is measured (see memory.py)
+        self.memory_backend = memory_backend
+        self.memory_sample_every = memory_sample_every
+        # Event columns on disk supplied as physical parameters (see columns.py)
+        self.columns = dict()
+        self.prop_columns = dict()
+        # Flat evaluation plans compiled for every prop by initialize()
+        self.compile_plans = compile_plans
+        self.plans = dict()
+        self.reverse_evaluators = dict()
+        # Zero columns of the gradient seeds are dropped before evaluation (see sparse.py)
+        self.prune_seeds = prune_seeds
+        # The autodiff kernels draw their arrays from a shared pool (see pool.py)
+        self.buffer_pool = new_buffer_pool() if buffer_pool else None
+        # Prop functions are traced once and replayed for gradients (see trace.py)
+        self.trace_functions = trace_functions
+        # Props that do not depend on free parameters are computed once by
+        # initialize() and pinned in their caches
+        self.hoist = hoist
+        self.frozen = dict()
+        self.hoisted = dict()
+        # The gradient column of every physical parameter, set by initialize()
+        self.gradients = None
+        # Props that miss the cache are computed on a thread pool if threads is set
+        self.executor = None
+        if threads is not None:
+            self.set_threads(threads)
+        # A byte budget shared by the caches of all props
+        # Entries are evicted across props by the budget policy once it is exceeded
+        self.budget = None
+        if memory_budget is not None:
+            self.set_memory_budget(memory_budget, budget_policy)
+
+    def get_prop(self, name, physical_parameters=None, *args, mode="forward", order=1, tangents=None, **kwargs):
+        """Evaluate a prop
+        Gradients are computed in forward mode by default, mode="reverse" computes
+        the gradient of a scalar prop with one backward sweep (see reverse.py)
+        order=2 also computes the Hessian with respect to the gradient seeds, in
+        the hessian_values of the result (see hessian.py)
+        tangents is a list of K dicts of parameter directions, the gradient of the
+        result then holds the K directional derivatives (see tangents.py)
+        """
         if physical_parameters is None:
             physical_parameters = dict()
+        if self.frozen:
+            physical_parameters = self.with_frozen(physical_parameters)
+        if self.columns:
+            physical_parameters = self.with_columns(name, physical_parameters)
+        if tangents is not None:
+            if mode != "forward":
+                raise ValueError("Tangents are only propagated in forward mode")
+            physical_parameters = seed_tangents(physical_parameters, tangents)
+            res = self.get_prop(name, physical_parameters, *args, order=order, **kwargs)
+            return tangent_order(res, len(tangents))
+        if order == 2:
+            if mode != "forward":
+                raise ValueError("Second order derivatives are only computed in forward mode")
+            physical_parameters = dict([(k, second_order(v)) for k, v in physical_parameters.items()])
+            return self.evaluate(name, physical_parameters, *args, **kwargs)
+        elif order != 1:
+            raise ValueError("Unknown derivative order: " + str(order) + ", expected 1 or 2")
+        if mode == "reverse":
+            return self.reverse_evaluator(name)(physical_parameters)
+        elif mode != "forward":
+            raise ValueError("Unknown gradient mode: " + str(mode) + ", expected forward or reverse")
+        if self.prune_seeds:
+            physical_parameters, names = prune_parameters(physical_parameters)
+            if names is not None:
+                return densify(self.evaluate(name, physical_parameters, *args, **kwargs), names)
+        return self.evaluate(name, physical_parameters, *args, **kwargs)
+
+    def get_jac(self, name, physical_parameters, names=None):
+        """The value of a prop and its gradient over the columns of self.gradients
+        The parameters in names, all the fit parameters by default, are seeded
+        with their columns
+        """
+        res = self.get_prop(name, self.gradients.seed(physical_parameters, names))
+        return self.gradients.value(res), self.gradients.jac(res)
+
+    def evaluate(self, name, physical_parameters, *args, **kwargs):
+        plan = self.plans.get(name)
+        if plan is not None:
+            if self.executor is not None:
+                return self.executor(plan, physical_parameters)
+            return plan(physical_parameters)
         return self.props[name](physical_parameters, *args, **kwargs)
 
+    def reverse_evaluator(self, name):
+        if name not in self.reverse_evaluators:
+            plan = self.plans.get(name)
+            if plan is None:
+                plan = evaluation_plan(self, name)
+            self.reverse_evaluators[name] = reverse_evaluator(self, plan)
+        return self.reverse_evaluators[name]
+
+    def add_column(self, name, path, member=None):
+        """Supply a physical parameter from a .npy file or an uncompressed .npz member
+        The file is memory mapped when a prop that needs it is first used
+        """
+        if isinstance(path, column):
+            self.columns[name] = path
+        else:
+            self.columns[name] = column(path, member)
+
+    def add_columns(self, columns):
+        """Register a dict of columns, as built by columns.npz_columns"""
+        for name, col in columns.items():
+            self.add_column(name, col)
+
+    def with_columns(self, name, physical_parameters):
+        """Add the columns needed by a prop to the physical parameters
+        Parameters given explicitly take precedence over the columns
+        """
+        needed = self.prop_columns.get(name)
+        if needed is None:
+            return physical_parameters
+        missing = [c for c in needed if c not in physical_parameters]
+        if not missing:
+            return physical_parameters
+        physical_parameters = dict(physical_parameters)
+        for c in missing:
+            physical_parameters[c] = self.columns[c].open()
+        return physical_parameters
+
+    def with_frozen(self, physical_parameters):
+        """Add the frozen parameters missing from the physical parameters"""
+        missing = [k for k in self.frozen.keys() if k not in physical_parameters]
+        if not missing:
+            return physical_parameters
+        physical_parameters = dict(physical_parameters)
+        for k in missing:
+            physical_parameters[k] = self.frozen[k]
+        return physical_parameters
+
+    def freeze(self, parameters):
+        """Fix the values of physical parameters during a fit
+        Frozen parameters missing from get_prop calls are filled in, and the props
+        that only depend on frozen parameters and columns are computed once and
+        pinned in their caches (see hoist_invariants)
+        """
+        changed = []
+        for k, v in parameters.items():
+            if isinstance(v, parameter_wrapper):
+                v = v.value
+            if k not in self.frozen or self.frozen[k] is not v:
+                changed.append(k)
+            self.frozen[k] = v
+        self.invalidate(changed)
+        if self.initialized_props:
+            self.hoist_invariants()
+
+    def unfreeze(self, names=None):
+        """Free frozen parameters, the results pinned for them are dropped"""
+        if names is None:
+            names = list(self.frozen.keys())
+        for k in names:
+            self.frozen.pop(k, None)
+        self.invalidate(names)
+
+    def invalidate(self, names):
+        """Unpin the results of the props that depend on the given parameters"""
+        names = set(names)
+        if not names:
+            return
+        for prop, func_wrap in self.props.items():
+            context = func_wrap.context
+            if names.intersection(context.physical_props) or names.intersection(context.implicit_physical_props):
+                func_wrap.cache.unpin()
+                self.hoisted.pop(prop, None)
+                names.add(prop)
+        # The traces specialized on the dropped values
+        for func_wrap in self.props.values():
+            if names.intersection(func_wrap.arg_names):
+                func_wrap.grad.specialize(None)
+
+    def hoist_invariants(self):
+        """Compute and pin the props whose physical parameters are all frozen or
+        columns (or that have none), and specialize the traces of the props on
+        the pinned values of their arguments
+        """
+        fixed = dict(self.frozen)
+        for prop, func_wrap in self.props.items():
+            context = func_wrap.context
+            deps = context.physical_props + context.implicit_physical_props
+            if not all([d in self.frozen or d in self.columns for d in deps]):
+                continue
+            if prop not in self.hoisted:
+                physical_parameters = self.with_columns(prop, dict(self.frozen))
+                res = self.get_prop(prop, physical_parameters)
+                key = context.key_builder(context.extract_params(physical_parameters))
+                func_wrap.cache.pin(key, res)
+                self.hoisted[prop] = key
+            fixed[prop] = func_wrap.cache.pinned[self.hoisted[prop]]
+        for c, col in self.columns.items():
+            if col.is_open:
+                fixed[c] = col.array
+        if self.trace_functions:
+            for func_wrap in self.props.values():
+                if func_wrap.grad.specialized is not None:
+                    continue
+                values = dict([(a, fixed[a]) for a in func_wrap.arg_names if a in fixed])
+                if values and len(values) < len(func_wrap.arg_names):
+                    func_wrap.grad.specialize(values)
+
+    def initialize_columns(self, props=None):
+        """Find the columns reachable from every prop and open the ones needed
+        by the requested props, all the props by default
+        """
+        self.prop_columns = dict()
+        for prop, func_wrap in self.props.items():
+            context = func_wrap.context
+            needed = [
+                p for p in context.physical_props + context.implicit_physical_props if p in self.columns
+            ]
+            if needed:
+                self.prop_columns[prop] = needed
+        if props is None:
+            props = self.props.keys()
+        for prop in props:
+            for c in self.prop_columns.get(prop, ()):
+                self.columns[c].open()
+
+    def get_prop_batch(self, name, points, shared=None):
+        """Evaluate a prop at many parameter points, returns a list of results
+        points is a list of physical parameter dicts, or a dict of arrays stacked
+        along a leading batch axis. shared holds the parameters common to all points.
+        Every point populates the same cache entries as a call to get_prop.
+        Only the props added with batchable=True are computed in a single call for
+        all their missed points, and only when no argument carries a gradient.
+        Gradient requests and the other props are computed point by point, the
+        batch then only saves the lookups of the points that share a key.
+        """
+        if isinstance(points, dict):
+            lengths = set([len(v) for v in points.values()])
+            if len(lengths) > 1:
+                raise ValueError("Stacked parameters have different batch lengths: " + str(sorted(lengths)))
+            n = lengths.pop() if lengths else 0
+            points = [dict([(k, v[i]) for k, v in points.items()]) for i in range(n)]
+        if shared:
+            merged = []
+            for point in points:
+                p = dict(shared)
+                p.update(point)
+                merged.append(p)
+            points = merged
+        if self.columns:
+            points = [self.with_columns(name, point) for point in points]
+        plan = self.plans.get(name)
+        if plan is None:
+            plan = evaluation_plan(self, name)
+        return plan.batch(points)
+
     def expand_graph(self, entry):
         # Get the root node
         # This represents the return value of the function
@@ -64,7 +368,16 @@ class store:
             ##store_entry(node.name, dependents, atomic_operation, probe_func)
 
     def add_prop(
-        self, name, dependents, atomic_operation, cache_size=None, probe_func=None
+        self,
+        name,
+        dependents,
+        atomic_operation,
+        cache_size=None,
+        probe_func=None,
+        policy=None,
+        persist=False,
+        batchable=False,
+        reduction=None,
     ):
         if probe_func is None:
             probe_func = self.default_probe_func
@@ -73,6 +386,12 @@ class store:
         #    self.expand_graph(prop)
         self.props[name] = prop
         self.cache_sizes[name] = cache_size
+        self.cache_policies[name] = policy
+        self.persistent_props[name] = persist
+        self.batchable_props[name] = batchable
+        if reduction not in (None, "sum"):
+            raise ValueError("Unknown reduction: " + str(reduction) + ", only sum is supported")
+        self.reduction_props[name] = reduction
 
     def initialize_function_contexts(self):
         prop_dict = self.props
@@ -84,6 +403,10 @@ class store:
             func_wrap = prop_dict[prop]
             deps = func_wrap.arg_names
             func_wrap.context.set_store(self)
+            func_wrap.context.set_key_builder(self.key_builder)
+            func_wrap.grad.pool = self.buffer_pool
+            if func_wrap.grad.tracing != self.trace_functions:
+                func_wrap.grad.set_tracing(self.trace_functions)
             if deps is not None:
                 dependents.update(deps)
 
@@ -92,6 +415,7 @@ class store:
         # See which of the dependencies are not functions registered with the store
         # These are our physical parameters
         physical_props = dependents - props
+        self.gradients = gradient_registry(physical_props - set(self.columns))
 
         # For each entry we need to set the physical properties that it depends on
         for prop in props:
@@ -130,19 +454,151 @@ class store:
         props = prop_dict.keys()
 
         for prop in props:
-            prop_dict[prop].initialize_cache()
-
-    def initialize(self, keep_cache=False):
+            cache_size = self.cache_sizes[prop]
+            if cache_size is None:
+                cache_size = self.default_cache_size
+            policy = self.cache_policies[prop]
+            if policy is None:
+                policy = self.default_cache_policy
+            prop_dict[prop].initialize_cache(cache_size, policy)
+            prop_dict[prop].cache.set_memory_backend(
+                self.memory_backend, self.memory_sample_every
+            )
+            if self.budget is not None:
+                self.budget.attach(prop, prop_dict[prop].cache)
+
+    def initialize_disk_caches(self):
+        """Set up the on-disk tier of persistent props
+        The on-disk results of a prop are versioned by its code and the code of
+        every prop it depends on, so changing an upstream prop invalidates them
+        """
+        versions = dict()
+        # The on-disk keys digest large arrays, which the in-memory keys may
+        # identify by object instead
+        keys = disk_keys(self.key_builder)
+
+        def version(prop):
+            if prop not in versions:
+                func_wrap = self.props[prop]
+                persist = self.persistent_props[prop]
+                # persist may be a user supplied version string
+                user_version = None if isinstance(persist, bool) else persist
+                versions[prop] = combine_versions(
+                    code_hash(func_wrap.function, user_version),
+                    [version(p) for p in func_wrap.context.props],
+                )
+            return versions[prop]
+
+        for prop, func_wrap in self.props.items():
+            if self.persistent_props[prop]:
+                if self.cache_dir is None:
+                    raise ValueError(
+                        "Prop " + str(prop) + " is persistent but the store has no cache_dir"
+                    )
+                func_wrap.enable_disk_cache(self.cache_dir, version(prop), keys)
+            else:
+                func_wrap.disable_disk_cache()
+
+    def set_memory_budget(self, nbytes, policy=None):
+        """Share a byte budget between the caches of all props
+        The budget evicts by cost unless another policy is given, a policy given
+        for an existing budget replaces its policy
+        """
+        if self.budget is None:
+            self.budget = memory_budget(nbytes, "cost" if policy is None else policy)
+            for prop, func_wrap in self.props.items():
+                self.budget.attach(prop, func_wrap.cache)
+        else:
+            if policy is not None:
+                self.budget.set_policy(policy)
+            self.budget.set_limit(nbytes)
+
+    def set_threads(self, threads):
+        """Compute the props that miss the cache on a pool of threads
+        threads=None turns the executor off, 0 uses one thread per core
+        The computes measured with the tracemalloc memory backend still run one
+        at a time
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if threads is not None:
+            self.executor = parallel_executor(threads if threads > 0 else None)
+        if self.props and self.executor is not None and not self.plans:
+            self.initialize_plans()
+
+    def residency(self):
+        """The number of cached entries and bytes resident for each prop"""
+        return dict(
+            [
+                (prop, {"entries": len(func_wrap.cache), "nbytes": func_wrap.cache.nbytes})
+                for prop, func_wrap in self.props.items()
+            ]
+        )
+
+    def stats(self, since=None):
+        """A table of the cache statistics of every prop
+        Compute times include the time spent computing missed upstream props
+        If since is an earlier table only the activity after it is reported
+        """
+        rows = [
+            stats_row(prop, func_wrap.cache.stats, func_wrap.cache)
+            for prop, func_wrap in self.props.items()
+        ]
+        table = stats_table(rows)
+        if since is not None:
+            table = table - since
+        return table
+
+    def trace_report(self):
+        """The nodes removed by the optimization passes from each traced prop"""
+        return dict(
+            [
+                (prop, func_wrap.grad.trace.report)
+                for prop, func_wrap in self.props.items()
+                if func_wrap.grad.trace is not None
+            ]
+        )
+
+    def reset_stats(self):
+        for func_wrap in self.props.values():
+            func_wrap.cache.stats.reset()
+
+    def initialize(self, keep_cache=False, props=None, parameters=None):
+        """Set up the dependency graph, the caches and the evaluation plans
+        Only the columns reachable from props (all props by default) are opened
+        parameters names the fit parameters numbered by self.gradients, which
+        get_jac needs
+        """
         if keep_cache:
             old_caches = self.extract_caches()
 
         self.initialize_function_contexts()
+        if parameters is not None:
+            self.gradients.fix(parameters)
         self.add_implicit_physcial_dependencies()
         self.initialize_caches()
+        self.initialize_disk_caches()
+        self.initialize_columns(props)
 
         if keep_cache:
             self.set_caches(old_caches)
 
+        self.initialize_plans()
+        self.initialized_props = dict.fromkeys(self.props.keys())
+        if self.hoist or self.frozen:
+            self.hoist_invariants()
+
+    def initialize_plans(self):
+        """Compile a flat evaluation plan for every prop
+        The thread pool executor always needs the plans
+        """
+        self.plans = dict()
+        self.reverse_evaluators = dict()
+        if self.compile_plans or self.executor is not None:
+            for prop in self.props.keys():
+                self.plans[prop] = evaluation_plan(self, prop)
+
     def __getitem__(self, args):
         prop_name, parameters = args
         return self.get_prop(prop_name, parameters)
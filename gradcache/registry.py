@@ -0,0 +1,98 @@
+import numpy as np
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file assigns every fit parameter of a store a fixed gradient column.
+#
+# Gradients are usually seeded with the names of the parameters, and the
+# columns of a result are in the order the names were first met by the
+# operators. The registry built by store.initialize() numbers the fit
+# parameters once (in sorted order), and seeds each parameter with its column
+# number instead of its name. Integer labels hash and compare faster than names
+# when the operators align the columns of their operands, and the gradient of a
+# result is placed in the globally aligned layout of the registry with a single
+# index operation, ready to be used as the jac vector of an optimizer.
+#
+# Only the fit parameters get columns. They are named once, with
+# store.initialize(parameters=...), so every query of the store uses the same
+# layout.
+
+
+unnamed = "The fit parameters were not named, see store.initialize(parameters=...)"
+
+
+class gradient_registry:
+    """The gradient column of every fit parameter"""
+
+    def __init__(self, candidates, names=None):
+        self.candidates = set(candidates)
+        self.names = None
+        self.index = dict()
+        if names is not None:
+            self.fix(names)
+
+    def fix(self, names):
+        """Number the fit parameters"""
+        unknown = [k for k in names if k not in self.candidates]
+        if unknown:
+            raise ValueError("Not physical parameters of the store: " + ", ".join(sorted(unknown)))
+        self.names = sorted(names)
+        self.index = dict([(name, i) for i, name in enumerate(self.names)])
+
+    def __len__(self):
+        if self.names is None:
+            raise ValueError(unnamed)
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def seed(self, physical_parameters, names=None):
+        """Seed physical parameters with their columns
+        All the fit parameters are seeded by default, the gradients the
+        parameters already carry are dropped
+        """
+        if self.names is None:
+            raise ValueError(unnamed)
+        if names is None:
+            names = [k for k in self.names if k in physical_parameters]
+        unknown = [k for k in names if k not in self.index]
+        if unknown:
+            raise ValueError("Not fit parameters of the store: " + ", ".join(sorted(unknown)))
+        res = dict(physical_parameters)
+        for k in names:
+            value = self.value(physical_parameters[k])
+            grad_values = np.ones(np.shape(value) + (1,))
+            res[k] = parameter_wrapper(k, value, grads=[self.index[k]], grad_values=grad_values)
+        return res
+
+    @staticmethod
+    def value(p):
+        return p.value if isinstance(p, parameter_wrapper) else p
+
+    def columns(self, grads):
+        """The columns of gradient labels, column numbers or parameter names"""
+        return np.array([g if isinstance(g, (int, np.integer)) else self.index[g] for g in grads], dtype=int)
+
+    def jac(self, res):
+        """The gradient of a result over all the columns of the registry"""
+        value = self.value(res)
+        jac = np.zeros(np.shape(value) + (len(self),))
+        if isinstance(res, parameter_wrapper) and res.grads is not None:
+            columns = self.columns(res.grads)
+            jac[..., columns] = np.reshape(res.grad_values, jac.shape[:-1] + (len(columns),))
+        return jac
+
+    def hess(self, res):
+        """The Hessian of a second order result over all the columns of the registry"""
+        value = self.value(res)
+        n = len(self)
+        hess = np.zeros(np.shape(value) + (n, n))
+        if isinstance(res, parameter_wrapper) and res.hessian_values is not None:
+            columns = self.columns(res.grads)
+            k = len(columns)
+            hess[..., columns[:, None], columns[None, :]] = np.reshape(res.hessian_values, hess.shape[:-2] + (k, k))
+        return hess
@@ -0,0 +1,142 @@
+import numpy as np
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file lets a function cache answer requests from entries that were stored
+# for a different but compatible request. Entries computed with gradients are
+# indexed by the key their parameter values would have without gradients, so that
+#   - a value-only request is answered with the value of a gradient entry
+#   - a gradient request is answered by slicing the gradient columns of an entry
+#     that was computed for a superset of the requested gradients
+
+
+def value_key(key):
+    """The key of the same parameter values without gradients"""
+    return tuple(
+        [
+            k[1] if type(k) is tuple and len(k) in (4, 5) and k[0] is parameter_wrapper else k
+            for k in key
+        ]
+    )
+
+
+def seed_table(parameters):
+    """The gradient seeds of each parameter as a dict of name to seed"""
+    seeds = []
+    for p in parameters:
+        if isinstance(p, parameter_wrapper) and p.grads is not None:
+            grad_values = p.grad_values
+            if isinstance(grad_values, np.ndarray) and grad_values.ndim > 1:
+                columns = [grad_values[..., j] for j in range(len(p.grads))]
+            else:
+                columns = list(grad_values)
+            seeds.append(dict(zip(p.grads, columns)))
+        else:
+            seeds.append(dict())
+    return seeds
+
+
+def requested_names(seeds):
+    names = dict()
+    for s in seeds:
+        names.update(dict.fromkeys(s.keys()))
+    return names
+
+
+def compatible(seeds, candidate_seeds, names):
+    """Whether the requested gradients are a subset of the candidate's
+    Every parameter must be seeded identically for every requested name
+    """
+    for s, c in zip(seeds, candidate_seeds):
+        for name in names:
+            s_seed = s.get(name, 0)
+            c_seed = c.get(name, 0)
+            if s_seed is c_seed:
+                continue
+            if not np.array_equal(s_seed, c_seed):
+                return False
+    return True
+
+
+def slice_gradient(res, names):
+    """Keep only the gradient columns of a result that belong to names
+    Contiguous columns are sliced without copying, the Hessian of a second order
+    entry is dropped
+    """
+    if not isinstance(res, parameter_wrapper) or res.grads is None:
+        return res
+    cols = [j for j, n in enumerate(res.grads) if n in names]
+    if len(cols) == len(res.grads):
+        if res.hessian_values is not None:
+            return parameter_wrapper(res.name, res.value, grads=res.grads, grad_values=res.grad_values)
+        return res
+    grads = [res.grads[j] for j in cols]
+    grad_values = np.asarray(res.grad_values)
+    if len(cols) and cols[-1] - cols[0] + 1 == len(cols):
+        grad_values = grad_values[..., cols[0] : cols[-1] + 1]
+    else:
+        grad_values = grad_values[..., cols]
+    return parameter_wrapper(res.name, res.value, grads=grads, grad_values=grad_values)
+
+
+class gradient_reuse:
+    """Index of the gradient entries of a function cache by their parameter values"""
+
+    def __init__(self):
+        self.index = dict()
+        self.value_keys = dict()
+
+    def insert(self, key, parameters):
+        vkey = value_key(key)
+        if vkey == key:
+            return
+        self.value_keys[key] = vkey
+        self.index.setdefault(vkey, dict())[key] = seed_table(parameters)
+
+    def remove(self, key):
+        vkey = self.value_keys.pop(key, None)
+        if vkey is None:
+            return
+        entries = self.index[vkey]
+        del entries[key]
+        if not entries:
+            del self.index[vkey]
+
+    def clear(self):
+        self.index.clear()
+        self.value_keys.clear()
+
+    def lookup(self, key, parameters):
+        """Find an entry that can answer the request
+        Returns the key of the entry and how to transform its result, or None
+        """
+        vkey = value_key(key)
+        entries = self.index.get(vkey)
+        if not entries:
+            return None
+        if vkey == key:
+            # A value-only request, any gradient entry holds the value
+            return next(iter(entries)), None
+        if parameters is None:
+            return None
+        if any([isinstance(p, parameter_wrapper) and p.hessian_values is not None for p in parameters]):
+            # First order entries can not answer second order requests
+            return None
+        seeds = seed_table(parameters)
+        names = requested_names(seeds)
+        for full_key, candidate_seeds in entries.items():
+            if compatible(seeds, candidate_seeds, names):
+                return full_key, names
+        return None
+
+
+def derive_result(res, names):
+    """Build the result of a request from the result of a compatible entry"""
+    if names is None:
+        if isinstance(res, parameter_wrapper):
+            return res.value
+        return res
+    return slice_gradient(res, names)
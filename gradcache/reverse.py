@@ -0,0 +1,351 @@
+import math
+import numpy as np
+import scipy as sp
+import time
+
+try:
+    import gradcache.autodiff as ad
+    from .parameter_wrapper import parameter_wrapper
+except:
+    import autodiff as ad
+    from parameter_wrapper import parameter_wrapper
+
+# This file implements reverse mode (adjoint) differentiation of scalar props.
+#
+# In forward mode every operator carries the gradient of its result with respect
+# to every requested gradient, an extra trailing dimension on every intermediate.
+# In reverse mode the props are evaluated on plain values while every operator
+# is recorded on a tape, and a single backward sweep then propagates the adjoint
+# (the derivative of the scalar result with respect to each intermediate) from
+# the result back to the physical parameters. The gradients are finally
+# obtained by contracting the adjoints of the parameters with their seeds.
+#
+# Each prop records its own tape. The sweep runs over the props of the plan in
+# reverse topological order, the adjoints of the inputs of a prop become the
+# adjoints of the props it depends on.
+
+
+def value_of(x):
+    return x.value if isinstance(x, tape_node) else x
+
+
+def unbroadcast(g, shape):
+    """Sum an adjoint over the dimensions an operand was broadcast along"""
+    g = np.asarray(g)
+    if g.shape == tuple(shape):
+        return g
+    while g.ndim > len(shape):
+        g = g.sum(axis=0)
+    for i, n in enumerate(shape):
+        if n == 1 and g.shape[i] != 1:
+            g = g.sum(axis=i, keepdims=True)
+    return g
+
+
+# The adjoint rules of the operators
+# Each rule takes the adjoint of the result, the values of the operands, the
+# value of the result and which operands need an adjoint, and returns the
+# adjoints of the operands (None where not needed)
+
+
+def plus_adjoint(g, x, y, needed):
+    return g, g
+
+
+def minus_adjoint(g, x, y, needed):
+    return g, (-g if needed[1] else None)
+
+
+def mul_adjoint(g, x, y, needed):
+    return (g * x[1] if needed[0] else None), (g * x[0] if needed[1] else None)
+
+
+def div_adjoint(g, x, y, needed):
+    g0 = g / x[1]
+    return (g0 if needed[0] else None), (-g0 * y if needed[1] else None)
+
+
+def pow_adjoint(g, x, y, needed):
+    g0 = g * x[1] * x[0] ** (x[1] - 1) if needed[0] else None
+    g1 = g * y * np.log(x[0]) if needed[1] else None
+    return g0, g1
+
+
+def inv_adjoint(g, x, y, needed):
+    return (-g,)
+
+
+def log_adjoint(g, x, y, needed):
+    return (g / x[0],)
+
+
+def log10_adjoint(g, x, y, needed):
+    return (g / (x[0] * np.log(10.0)),)
+
+
+def log2_adjoint(g, x, y, needed):
+    return (g / (x[0] * np.log(2.0)),)
+
+
+def sqrt_adjoint(g, x, y, needed):
+    return (g / (2.0 * y),)
+
+
+def lgamma_adjoint(g, x, y, needed):
+    return (g * sp.special.digamma(x[0]),)
+
+
+def log1p_adjoint(g, x, y, needed):
+    return (g / (1.0 + x[0]),)
+
+
+def sum_adjoint(g, x, y, needed):
+    # ad.sum reduces the first axis
+    return (np.broadcast_to(g, np.shape(x[0])),)
+
+
+adjoint_rules = {
+    "plus": (ad.plus, plus_adjoint),
+    "minus": (ad.minus, minus_adjoint),
+    "mul": (ad.mul, mul_adjoint),
+    "div": (ad.div, div_adjoint),
+    "pow": (ad.pow, pow_adjoint),
+    "inv": (ad.inv, inv_adjoint),
+    "log": (ad.log, log_adjoint),
+    "log10": (ad.log10, log10_adjoint),
+    "log2": (ad.log2, log2_adjoint),
+    "sqrt": (ad.sqrt, sqrt_adjoint),
+    "lgamma": (ad.lgamma, lgamma_adjoint),
+    "log1p": (ad.log1p, log1p_adjoint),
+    "sum": (ad.sum, sum_adjoint),
+}
+
+
+def merge_grads(operands):
+    """The gradient names forward mode would give the result of an operator
+    The names of the first operand come first, like in sift_parameters
+    """
+    grads = None
+    for x in operands:
+        if isinstance(x, tape_node) and x.grads is not None:
+            grads = x.grads if grads is None else tuple(dict.fromkeys(grads + x.grads))
+    return grads
+
+
+class tape:
+    """The operators applied while evaluating one prop, in order"""
+
+    def __init__(self):
+        self.entries = []
+
+    def variable(self, value, tag=None, grads=None):
+        return tape_node(self, value, tag, grads)
+
+    def record(self, op, operands):
+        forward = adjoint_rules[op][0]
+        value = forward(*[value_of(x) for x in operands])
+        out = tape_node(self, value, grads=merge_grads(operands))
+        self.entries.append((op, operands, out))
+        return out
+
+    def backward(self, output, adjoint):
+        """Propagate the adjoint of the output to every node of the tape"""
+        output.adjoint = adjoint
+        for op, operands, out in reversed(self.entries):
+            if out.adjoint is None:
+                continue
+            needed = [isinstance(x, tape_node) for x in operands]
+            values = [value_of(x) for x in operands]
+            adjoints = adjoint_rules[op][1](out.adjoint, values, out.value, needed)
+            for x, g, n in zip(operands, adjoints, needed):
+                if n:
+                    x.accumulate(unbroadcast(g, np.shape(x.value)))
+            # Intermediate adjoints are not needed once propagated
+            out.adjoint = None
+        self.entries = []
+
+
+def _binary(op):
+    def method(self, other):
+        return self.tape.record(op, (self, other))
+
+    def rmethod(self, other):
+        return self.tape.record(op, (other, self))
+
+    return method, rmethod
+
+
+def _unary(op):
+    def method(self):
+        return self.tape.record(op, (self,))
+
+    return method
+
+
+class tape_node:
+    """A value recorded on a tape, supports the operators of Node"""
+
+    __slots__ = ["tape", "value", "adjoint", "tag", "grads"]
+
+    # Make numpy defer to the tape_node operators
+    __array_ufunc__ = None
+
+    def __init__(self, tape, value, tag=None, grads=None):
+        self.tape = tape
+        self.value = value
+        self.adjoint = None
+        self.tag = tag
+        # The order of the gradient columns of this value in forward mode
+        self.grads = grads
+
+    def accumulate(self, adjoint):
+        if self.adjoint is None:
+            self.adjoint = adjoint
+        else:
+            self.adjoint = self.adjoint + adjoint
+
+    __add__, __radd__ = _binary("plus")
+    __sub__, __rsub__ = _binary("minus")
+    __mul__, __rmul__ = _binary("mul")
+    __truediv__, __rtruediv__ = _binary("div")
+    __pow__, __rpow__ = _binary("pow")
+    __neg__ = _unary("inv")
+    __invert__ = _unary("inv")
+    log = _unary("log")
+    log10 = _unary("log10")
+    log2 = _unary("log2")
+    sqrt = _unary("sqrt")
+    lgamma = _unary("lgamma")
+    log1p = _unary("log1p")
+    sum = _unary("sum")
+
+    def __repr__(self):
+        return "tape_node(" + repr(self.value) + ")"
+
+
+def split_parameter(p):
+    """The value and the gradient seeds of a physical parameter"""
+    if isinstance(p, parameter_wrapper):
+        if p.grads is None:
+            return p.value, None
+        return p.value, p
+    return p, None
+
+
+def contract(adjoint, p):
+    """The gradient columns contributed by a seeded parameter"""
+    seeds = np.asarray(p.grad_values, dtype=float)
+    shape = np.shape(adjoint)
+    n = len(p.grads)
+    if seeds.size == math.prod(shape) * n:
+        seeds = seeds.reshape(shape + (n,))
+    else:
+        # A seed shared by every element of an array parameter
+        seeds = np.broadcast_to(seeds, shape + (n,))
+    return np.tensordot(adjoint, seeds, axes=len(shape))
+
+
+class reverse_evaluator:
+    """Evaluate a scalar prop and its gradient with one backward sweep"""
+
+    def __init__(self, the_store, plan):
+        self.the_store = the_store
+        self.plan = plan
+
+    def __call__(self, physical_parameters):
+        the_store = self.the_store
+        plan = self.plan
+
+        # The root result is cached under the same key as in forward mode
+        slots = plan.extract_slots(physical_parameters)
+        root = plan.steps[-1]
+        root_parameters = root.params(slots)
+        root_key = root.key_builder(root_parameters)
+        found, res = root.cache.lookup(root_key, root_parameters)
+        if found:
+            return res
+
+        tic = time.perf_counter()
+        values = dict()
+        seeded = dict()
+        for name in plan.param_names:
+            values[name], p = split_parameter(physical_parameters[name])
+            if p is not None:
+                seeded[name] = p
+        if not seeded:
+            return the_store.get_prop(plan.root, physical_parameters)
+
+        # Forward pass, props that do not depend on a seeded parameter are
+        # looked up as values, the others are recorded on a tape
+        active = dict()
+        records = dict()
+        grads = dict()
+        for name in plan.order:
+            context = the_store.props[name].context
+            is_active = any([p in seeded for p in context.physical_props]) or any(
+                [active[p] for p in context.props]
+            )
+            active[name] = is_active
+            if not is_active:
+                values[name] = the_store.get_prop(name, values)
+                continue
+            t = tape()
+            args = []
+            for dep in context.dependents:
+                if dep in seeded:
+                    args.append(t.variable(values[dep], tag=dep, grads=seeded[dep].grads))
+                elif active.get(dep, False):
+                    args.append(t.variable(values[dep], tag=dep, grads=grads[dep]))
+                else:
+                    args.append(values[dep])
+            out = the_store.props[name].function(*args)
+            if isinstance(out, tape_node) and out.tape is t:
+                values[name] = out.value
+                grads[name] = out.grads
+                records[name] = (t, args, out)
+            else:
+                # The result does not depend on the inputs
+                values[name] = value_of(out)
+                active[name] = False
+
+        value = values[plan.root]
+        if np.ndim(value) != 0:
+            raise ValueError(
+                "Reverse mode needs a scalar prop, " + str(plan.root) + " has shape " + str(np.shape(value))
+            )
+
+        # Backward sweep over the props, from the root to the parameters
+        adjoints = dict()
+        if plan.root in records:
+            adjoints[plan.root] = np.ones_like(value, dtype=float)
+        for name in reversed(plan.order):
+            if name not in records or name not in adjoints:
+                continue
+            t, args, out = records.pop(name)
+            t.backward(out, adjoints.pop(name))
+            for arg in args:
+                if isinstance(arg, tape_node) and arg.adjoint is not None:
+                    if arg.tag in adjoints:
+                        adjoints[arg.tag] = adjoints[arg.tag] + arg.adjoint
+                    else:
+                        adjoints[arg.tag] = arg.adjoint
+
+        # Contract the adjoints of the parameters with their seeds
+        # The columns are in the order of forward mode, which shares the cache
+        # entries, the names the result does not depend on come last
+        names = dict()
+        for g in grads.get(plan.root) or ():
+            names[g] = len(names)
+        for p in seeded.values():
+            for g in p.grads:
+                if g not in names:
+                    names[g] = len(names)
+        grad_values = np.zeros(len(names))
+        for name, p in seeded.items():
+            if name not in adjoints:
+                continue
+            columns = [names[g] for g in p.grads]
+            grad_values[columns] += contract(adjoints[name], p)
+        res = parameter_wrapper(None, value, grads=list(names.keys()), grad_values=grad_values)
+        toc = time.perf_counter()
+        return root.cache.commit(root_key, res, toc - tic, root_parameters)
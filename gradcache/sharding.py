@@ -0,0 +1,227 @@
+import numpy as np
+import multiprocessing
+import traceback
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file splits the evaluation of a store over worker processes by events.
+# The per-event inputs of the store (MC event arrays, per-event weights, ...) are
+# given once when the shards are created. Each worker process is forked from
+# the parent, keeps only its chunk of the events, and owns a private copy of the
+# store and of its function caches. On every call only the physical parameters
+# are sent to the workers, and the per-shard results are reduced in the parent:
+#   "sum"          -- likelihoods and other sums over events, the values and the
+#                     gradient columns of the shards are added up
+#   "concatenate"  -- per-event results, joined along the first axis
+#
+# Workers are started with the fork start method, so the props (and the
+# functions they close over) never need to be pickled.
+
+
+def shard_bounds(nevents, shards):
+    """The [start, stop) event range of every shard"""
+    edges = np.linspace(0, nevents, shards + 1).round().astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def shard_slice(value, start, stop):
+    """The events of one shard of a per-event input
+    Gradient seeds of wrapped inputs are sliced along with the value
+    """
+    if isinstance(value, parameter_wrapper):
+        grad_values = value.grad_values
+        if isinstance(grad_values, np.ndarray):
+            grad_values = grad_values[start:stop]
+        elif grad_values is not None:
+            grad_values = [g[start:stop] if np.ndim(g) else g for g in grad_values]
+        return parameter_wrapper(
+            value.name, value.value[start:stop], grads=value.grads, grad_values=grad_values
+        )
+    return value[start:stop]
+
+
+def aligned_gradient(res, names):
+    """The gradient of a result with one column per name, zero where missing"""
+    value = np.asarray(res.value if isinstance(res, parameter_wrapper) else res)
+    out = np.zeros(value.shape + (len(names),))
+    if isinstance(res, parameter_wrapper) and res.grads is not None:
+        grad_values = np.asarray(res.grad_values)
+        for j, name in enumerate(res.grads):
+            out[..., names[name]] = grad_values[..., j]
+    return out
+
+
+def aligned_hessian(res, names):
+    """The Hessian of a result over every pair of names, zero where missing"""
+    value = np.asarray(res.value if isinstance(res, parameter_wrapper) else res)
+    n = len(names)
+    out = np.zeros(value.shape + (n, n))
+    if isinstance(res, parameter_wrapper) and res.hessian_values is not None:
+        index = np.array([names[name] for name in res.grads], dtype=int)
+        out[..., index[:, None], index[None, :]] = np.asarray(res.hessian_values)
+    return out
+
+
+def reduce_results(results, reduce="sum"):
+    """Combine the results of the shards"""
+    grads = dict()
+    for res in results:
+        if isinstance(res, parameter_wrapper) and res.grads is not None:
+            for name in res.grads:
+                if name not in grads:
+                    grads[name] = len(grads)
+    values = [res.value if isinstance(res, parameter_wrapper) else res for res in results]
+    # Second order results carry their Hessians through the reduction
+    second_order = any([isinstance(res, parameter_wrapper) and res.hessian_values is not None for res in results])
+    hessian_values = None
+    if reduce == "sum":
+        value = values[0]
+        for v in values[1:]:
+            value = value + v
+        if not grads:
+            return value
+        grad_values = aligned_gradient(results[0], grads)
+        for res in results[1:]:
+            grad_values += aligned_gradient(res, grads)
+        if second_order:
+            hessian_values = aligned_hessian(results[0], grads)
+            for res in results[1:]:
+                hessian_values += aligned_hessian(res, grads)
+    elif reduce == "concatenate":
+        value = np.concatenate([np.atleast_1d(v) for v in values], axis=0)
+        if not grads:
+            return value
+        grad_values = np.concatenate([aligned_gradient(res, grads) for res in results], axis=0)
+        if second_order:
+            hessian_values = np.concatenate([aligned_hessian(res, grads) for res in results], axis=0)
+    else:
+        raise ValueError("Unknown reduction: " + str(reduce) + ", expected sum or concatenate")
+    return parameter_wrapper(
+        None, value, grads=list(grads.keys()), grad_values=grad_values, hessian_values=hessian_values
+    )
+
+
+def _worker(conn, the_store, events, start, stop):
+    """Serve requests for one shard until the parent closes the connection"""
+    # The forked copy of the store gets its own caches and runs serially
+    the_store.executor = None
+    for func_wrap in the_store.props.values():
+        func_wrap.cache.drop_entries()
+    local = dict([(name, shard_slice(value, start, stop)) for name, value in events.items()])
+    del events
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        name, physical_parameters = msg
+        physical_parameters = dict(physical_parameters)
+        physical_parameters.update(local)
+        try:
+            res = the_store.get_prop(name, physical_parameters)
+        except BaseException as e:
+            try:
+                conn.send(("error", e, traceback.format_exc()))
+            except Exception:
+                conn.send(("error", RuntimeError(repr(e)), traceback.format_exc()))
+            continue
+        conn.send(("ok", res, None))
+    conn.close()
+
+
+class sharded_store:
+    """Evaluate the props of an initialized store in worker processes, split by events
+
+    events is a dict of the per-event physical parameters, all split along their
+    first axis. The workers are persistent, so their caches survive between calls
+    and only the remaining physical parameters cross the process boundary.
+    """
+
+    def __init__(self, the_store, events, shards=None, reduce="sum"):
+        if shards is None:
+            shards = multiprocessing.cpu_count()
+        nevents = None
+        for name, value in events.items():
+            n = len(value.value if isinstance(value, parameter_wrapper) else value)
+            if nevents is None:
+                nevents = n
+            elif n != nevents:
+                raise ValueError(
+                    "Per-event parameter " + str(name) + " has " + str(n) + " events, expected " + str(nevents)
+                )
+        if nevents is None:
+            raise ValueError("sharded_store needs at least one per-event parameter")
+        self.the_store = the_store
+        self.event_names = set(events.keys())
+        self.nevents = nevents
+        self.reduce = reduce
+        self.bounds = shard_bounds(nevents, shards)
+        self.workers = []
+        self.connections = []
+
+        context = multiprocessing.get_context("fork")
+        for start, stop in self.bounds:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker, args=(child_conn, the_store, events, start, stop), daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self.workers.append(process)
+            self.connections.append(parent_conn)
+
+    @property
+    def shards(self):
+        return len(self.workers)
+
+    def get_prop(self, name, physical_parameters=None, reduce=None):
+        if not self.workers:
+            raise RuntimeError("The workers of this sharded_store were closed")
+        if reduce is None:
+            reduce = self.reduce
+        if physical_parameters is None:
+            physical_parameters = dict()
+        # The per-event inputs are already held by the workers
+        physical_parameters = dict(
+            [(k, v) for k, v in physical_parameters.items() if k not in self.event_names]
+        )
+        for conn in self.connections:
+            conn.send((name, physical_parameters))
+        replies = [conn.recv() for conn in self.connections]
+        for status, res, tb in replies:
+            if status == "error":
+                raise res from RuntimeError("In a worker process:\n" + tb)
+        return reduce_results([res for _, res, _ in replies], reduce)
+
+    def __getitem__(self, args):
+        prop_name, parameters = args
+        return self.get_prop(prop_name, parameters)
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self.workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "workers", None):
+            self.close()
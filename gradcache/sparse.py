@@ -0,0 +1,88 @@
+import numpy as np
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file keeps the forward mode gradients sparse by column.
+#
+# A parameter_wrapper only carries the gradient columns named in its grads, so
+# the gradient of every intermediate already holds only the columns of the
+# parameters it depends on. This is lost when the seeds themselves carry
+# structurally zero columns, for example when every parameter is seeded with a
+# row of the identity matrix over all the parameters of a fit. The zero columns
+# of the seeds are pruned before evaluation, and the requested columns are
+# materialized (as zeros) only in the final result.
+
+
+def prune_parameter(p):
+    """Drop the gradient columns of a seeded parameter that are all zero
+    Returns the pruned parameter and the names of all its columns
+    """
+    if not isinstance(p, parameter_wrapper) or p.grads is None:
+        return p, None
+    grad_values = p.grad_values
+    if isinstance(grad_values, np.ndarray):
+        if grad_values.ndim == 0:
+            return p, None
+        columns = grad_values.reshape(-1, grad_values.shape[-1])
+        keep = np.any(columns != 0, axis=0)
+    else:
+        keep = np.array([np.any(np.asarray(g) != 0) for g in grad_values], dtype=bool)
+    if np.all(keep):
+        return p, p.grads
+    grads = [g for g, k in zip(p.grads, keep) if k]
+    if isinstance(grad_values, np.ndarray):
+        grad_values = grad_values[..., keep]
+    else:
+        grad_values = [g for g, k in zip(grad_values, keep) if k]
+    if not grads:
+        return p.value, p.grads
+    return parameter_wrapper(p.name, p.value, grads=grads, grad_values=grad_values), p.grads
+
+
+def prune_parameters(physical_parameters):
+    """Prune the seeds of all the physical parameters
+    Returns the pruned parameters and the names of the requested gradients, or
+    None if nothing was pruned
+    """
+    pruned = None
+    names = None
+    for k, p in physical_parameters.items():
+        if type(p) is not parameter_wrapper or p.grads is None:
+            continue
+        q, grads = prune_parameter(p)
+        if names is None:
+            names = dict()
+        names.update(dict.fromkeys(grads))
+        if q is not p:
+            if pruned is None:
+                pruned = dict(physical_parameters)
+            pruned[k] = q
+    if pruned is None:
+        return physical_parameters, None
+    return pruned, list(names.keys())
+
+
+def densify(res, names):
+    """Lay out the gradient of a result over the requested names
+    The columns are in the order of names, like the result computed without
+    pruning, with zeros for the names the result does not depend on
+    """
+    if isinstance(res, parameter_wrapper) and res.grads is not None:
+        grads = list(res.grads)
+        grad_values = np.asarray(res.grad_values)
+    else:
+        value = res.value if isinstance(res, parameter_wrapper) else res
+        grads = []
+        grad_values = np.zeros(np.shape(value) + (0,))
+        res = parameter_wrapper(None, value)
+    if grads == list(names):
+        return res
+    # Columns outside the requested names, if any, are kept after them
+    order = list(names) + [g for g in grads if g not in set(names)]
+    index = dict([(g, i) for i, g in enumerate(order)])
+    out = np.zeros(grad_values.shape[:-1] + (len(order),), dtype=np.result_type(grad_values, float))
+    out[..., [index[g] for g in grads]] = grad_values
+    return parameter_wrapper(res.name, res.value, grads=order, grad_values=out)
@@ -0,0 +1,121 @@
+import bisect
+
+import numpy as np
+
+# Edges (in seconds) of the compute time histogram, one bin per decade
+# The first and last bins collect everything faster or slower than the edges
+time_bin_edges = np.logspace(-6, 2, 9)
+_time_bin_edges = time_bin_edges.tolist()
+
+counters = ["hits", "misses", "evictions", "value_calls", "grad_calls"]
+
+
+class cache_stats:
+    """Counters describing the use of a single function cache"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.value_calls = 0
+        self.grad_calls = 0
+        self.compute_time = 0.0
+        self.time_histogram = np.zeros(len(time_bin_edges) + 1, dtype=int)
+
+    def record_call(self, grad):
+        if grad:
+            self.grad_calls += 1
+        else:
+            self.value_calls += 1
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_miss(self, seconds=None):
+        self.misses += 1
+        if seconds is not None:
+            self.compute_time += seconds
+            self.time_histogram[bisect.bisect_left(_time_bin_edges, seconds)] += 1
+
+    def record_eviction(self):
+        self.evictions += 1
+
+
+def stats_row(name, stats, cache):
+    row = dict([(c, getattr(stats, c)) for c in counters])
+    row["prop"] = name
+    calls = stats.hits + stats.misses
+    row["hit_rate"] = stats.hits / calls if calls else np.nan
+    row["compute_time"] = stats.compute_time
+    row["mean_time"] = stats.compute_time / stats.misses if stats.misses else np.nan
+    row["time_histogram"] = stats.time_histogram.copy()
+    row["entries"] = len(cache)
+    row["nbytes"] = cache.nbytes
+    return row
+
+
+class stats_table:
+    """Per prop cache statistics, sorted by the total compute time"""
+
+    columns = [
+        "prop",
+        "hits",
+        "misses",
+        "hit_rate",
+        "evictions",
+        "value_calls",
+        "grad_calls",
+        "compute_time",
+        "mean_time",
+        "entries",
+        "nbytes",
+    ]
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: -r["compute_time"])
+
+    def __getitem__(self, prop):
+        for row in self.rows:
+            if row["prop"] == prop:
+                return row
+        raise KeyError(prop)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __sub__(self, other):
+        """The activity since an earlier table, resident sizes are not subtracted"""
+        rows = []
+        for row in self.rows:
+            row = dict(row)
+            try:
+                old = other[row["prop"]]
+            except KeyError:
+                rows.append(row)
+                continue
+            for c in counters + ["compute_time", "time_histogram"]:
+                row[c] = row[c] - old[c]
+            calls = row["hits"] + row["misses"]
+            row["hit_rate"] = row["hits"] / calls if calls else np.nan
+            row["mean_time"] = row["compute_time"] / row["misses"] if row["misses"] else np.nan
+            rows.append(row)
+        return stats_table(rows)
+
+    def __str__(self):
+        def fmt(v):
+            if isinstance(v, float):
+                return "%.4g" % v
+            return str(v)
+
+        cells = [self.columns] + [[fmt(row[c]) for c in self.columns] for row in self.rows]
+        widths = [max([len(r[i]) for r in cells]) for i in range(len(self.columns))]
+        lines = ["  ".join([c.rjust(w) for c, w in zip(r, widths)]) for r in cells]
+        return "\n".join(lines)
+
+    __repr__ = __str__
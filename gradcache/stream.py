@@ -0,0 +1,216 @@
+import time
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+    from .plan import evaluation_plan, slot_getter
+    from .sharding import shard_bounds, shard_slice, reduce_results
+except:
+    from parameter_wrapper import parameter_wrapper
+    from plan import evaluation_plan, slot_getter
+    from sharding import shard_bounds, shard_slice, reduce_results
+
+# This file evaluates the reductions over events of a store in chunks of events.
+# Props added with reduction="sum" compute a sum over the events of their
+# per-event inputs (typically with x.sum()), so their value for the whole sample
+# is the sum of their values for every chunk of events. Each reduction is
+# evaluated chunk by chunk and folded into a running sum, and the total is
+# stored in the cache of the reduction under the key of the whole sample. The
+# props downstream of the reductions are then evaluated as usual from the
+# totals, so no per-event intermediate is ever materialized for more than one
+# chunk of events at a time.
+#
+# The per-event results of a chunk are computed outside the in-memory caches
+# and dropped once they are folded, otherwise the caches would grow back to the
+# size of the whole sample. The memory held by a streamed evaluation is then
+# bounded by the per-event intermediates of one chunk plus the running totals,
+# and the caches only keep the totals and the results that do not depend on the
+# events. Repeated calls recompute the chunks that are needed, a disk tier
+# (see disk_cache.py) still stores the per-event results of every chunk.
+
+
+class streamed_store:
+    """Evaluate the props of an initialized store over events in chunks
+
+    events is a dict of the per-event physical parameters, all split along their
+    first axis into chunks of chunk_size events. The chunks are sliced once
+    and hold views of the events.
+    """
+
+    def __init__(self, the_store, events, chunk_size):
+        nevents = None
+        for name, value in events.items():
+            n = len(value.value if isinstance(value, parameter_wrapper) else value)
+            if nevents is None:
+                nevents = n
+            elif n != nevents:
+                raise ValueError(
+                    "Per-event parameter " + str(name) + " has " + str(n) + " events, expected " + str(nevents)
+                )
+        if nevents is None:
+            raise ValueError("streamed_store needs at least one per-event parameter")
+        self.the_store = the_store
+        self.events = dict(events)
+        self.nevents = nevents
+        self.chunk_size = chunk_size
+        nchunks = max(1, -(-nevents // chunk_size))
+        self.chunks = [
+            dict([(name, shard_slice(value, start, stop)) for name, value in events.items()])
+            for start, stop in shard_bounds(nevents, nchunks)
+        ]
+        self.plans = dict()
+        self.reductions = dict()
+        self.chunk_plans = dict()
+        # Whether each prop depends on the events through an unreduced input
+        self.per_event = dict()
+
+    def plan(self, name):
+        if name not in self.plans:
+            plan = self.the_store.plans.get(name)
+            if plan is None:
+                plan = evaluation_plan(self.the_store, name)
+            self.plans[name] = plan
+            self.reductions[name] = self.find_reductions(plan)
+        return self.plans[name]
+
+    def find_reductions(self, plan):
+        """The reduction steps of a plan that sum over the events
+        Every other step must either not depend on the events or only be
+        needed by the reductions
+        """
+        the_store = self.the_store
+        steps = dict([(step.name, step) for step in plan.steps])
+        per_event = dict()
+        for name in plan.order:
+            context = the_store.props[name].context
+            uses_events = any([p in self.events for p in context.physical_props])
+            for dep in context.props:
+                if per_event[dep] and not the_store.reduction_props.get(dep):
+                    uses_events = True
+            per_event[name] = uses_events
+        self.per_event.update(per_event)
+
+        reductions = []
+        visited = set()
+        stack = [plan.root]
+        while stack:
+            name = stack.pop()
+            if name in visited:
+                continue
+            visited.add(name)
+            if per_event[name] and the_store.reduction_props.get(name):
+                reductions.append(steps[name])
+                self.check_reduction(name, per_event)
+                continue
+            if per_event[name]:
+                raise ValueError(
+                    "Prop " + str(name) + " depends on the events but is not reduced, "
+                    "it can not be streamed"
+                )
+            stack.extend(the_store.props[name].context.props)
+        # Dependencies first
+        reductions.sort(key=lambda step: step.slot)
+        return reductions
+
+    def check_reduction(self, name, per_event):
+        the_store = self.the_store
+        stack = list(the_store.props[name].context.props)
+        while stack:
+            dep = stack.pop()
+            if the_store.reduction_props.get(dep) and per_event[dep]:
+                raise ValueError(
+                    "Reduction " + str(name) + " depends on the reduction " + str(dep)
+                    + ", nested reductions can not be streamed"
+                )
+            stack.extend(the_store.props[dep].context.props)
+
+    def chunk_plan(self, name):
+        if name not in self.chunk_plans:
+            plan = self.the_store.plans.get(name)
+            if plan is None:
+                plan = evaluation_plan(self.the_store, name)
+            self.chunk_plans[name] = plan
+        return self.chunk_plans[name]
+
+    def evaluate_chunk(self, plan, chunk_parameters):
+        """Evaluate a reduction over one chunk of events
+        The steps that depend on the events are computed without storing their
+        results in the caches, the other steps are looked up as usual
+        """
+        steps = plan.steps
+        slots = plan.extract_slots(chunk_parameters)
+        # Steps are in topological order, so the needed steps are found in
+        # one pass from the root down
+        needed = set([len(steps) - 1])
+        missed = []
+        for i in range(len(steps) - 1, -1, -1):
+            if i not in needed:
+                continue
+            step = steps[i]
+            parameters = step.params(slots)
+            key = step.key_builder(parameters)
+            if not self.per_event[step.name]:
+                found, res = step.cache.lookup(key, parameters)
+                if found:
+                    slots[step.slot] = res
+                    continue
+            missed.append((step, key, parameters))
+            needed.update(step.deps)
+        for step, key, parameters in reversed(missed):
+            getter = slot_getter(step.values, slots, parameters)
+            if self.per_event[step.name]:
+                slots[step.slot], _ = step.cache.compute(key, getter)
+            else:
+                slots[step.slot] = step.cache.fill(key, getter)
+        return slots[-1]
+
+    def stream(self, step, physical_parameters, key, parameters):
+        """Sum a reduction over the chunks and store the total in its cache"""
+        the_store = self.the_store
+        plan = self.chunk_plan(step.name)
+        tic = time.perf_counter()
+        total = None
+        for chunk in self.chunks:
+            chunk_parameters = dict(physical_parameters)
+            chunk_parameters.update(chunk)
+            if the_store.frozen:
+                chunk_parameters = the_store.with_frozen(chunk_parameters)
+            if the_store.columns:
+                chunk_parameters = the_store.with_columns(step.name, chunk_parameters)
+            res = self.evaluate_chunk(plan, chunk_parameters)
+            total = res if total is None else reduce_results([total, res], "sum")
+        toc = time.perf_counter()
+        return step.cache.commit(key, total, toc - tic, parameters)
+
+    def get_prop(self, name, physical_parameters=None):
+        if physical_parameters is None:
+            physical_parameters = dict()
+        physical_parameters = dict(
+            [(k, v) for k, v in physical_parameters.items() if k not in self.events]
+        )
+        full_parameters = dict(physical_parameters)
+        full_parameters.update(self.events)
+        if self.the_store.columns:
+            full_parameters = self.the_store.with_columns(name, full_parameters)
+        plan = self.plan(name)
+        slots = plan.extract_slots(full_parameters)
+        root = plan.steps[-1]
+        parameters = root.params(slots)
+        found, res = root.cache.lookup(root.key_builder(parameters), parameters)
+        if found:
+            return res
+        for step in self.reductions[name]:
+            parameters = step.params(slots)
+            key = step.key_builder(parameters)
+            found, res = step.cache.lookup(key, parameters)
+            if not found:
+                res = self.stream(step, physical_parameters, key, parameters)
+            slots[step.slot] = res
+        # The reductions are known, the lookup pass does not visit them again
+        missed = plan.lookup(slots)
+        if missed:
+            plan.compute(slots, missed)
+        return slots[-1]
+
+    def __getitem__(self, args):
+        prop_name, parameters = args
+        return self.get_prop(prop_name, parameters)
@@ -0,0 +1,73 @@
+import numpy as np
+
+try:
+    from .parameter_wrapper import parameter_wrapper
+except:
+    from parameter_wrapper import parameter_wrapper
+
+# This file seeds the forward mode with tangent directions (Jacobian-vector
+# products).
+#
+# The forward mode carries one gradient column per seed name, so seeding every
+# physical parameter with its own name costs one column per parameter. When only
+# directional derivatives are needed, the caller gives K tangent vectors over
+# the physical parameters instead, and every parameter is seeded with its
+# components along the K directions under the shared names #tangent0 ...
+# #tangentK-1. The operators then carry K columns whatever the number of
+# parameters, and column k of the result is the derivative along tangent k.
+
+prefix = "#tangent"
+
+
+def tangent_names(k):
+    return [prefix + str(i) for i in range(k)]
+
+
+def seed_tangents(physical_parameters, tangents):
+    """Seed the physical parameters with their components along the tangents
+    tangents is a list of dicts from parameter names to directions, a parameter
+    missing from a tangent has no component along it. Parameters in no tangent
+    are passed as values, the gradients the parameters already carry are dropped
+    """
+    names = tangent_names(len(tangents))
+    seeded = set()
+    for t in tangents:
+        seeded.update(t.keys())
+    unknown = [k for k in seeded if k not in physical_parameters]
+    if unknown:
+        raise ValueError("Tangent directions for unknown parameters: " + ", ".join(sorted(unknown)))
+    res = dict()
+    for k, p in physical_parameters.items():
+        value = p.value if isinstance(p, parameter_wrapper) else p
+        if k not in seeded:
+            res[k] = value
+            continue
+        shape = np.shape(value)
+        columns = [np.broadcast_to(np.asarray(t.get(k, 0.0), dtype=float), shape) for t in tangents]
+        res[k] = parameter_wrapper(k, value, grads=names, grad_values=np.stack(columns, axis=-1))
+    return res
+
+
+def tangent_order(res, k):
+    """Lay out the gradient of a result as the K tangent columns in order
+    Tangents the result does not depend on get zero columns
+    """
+    names = tangent_names(k)
+    if isinstance(res, parameter_wrapper):
+        value = res.value
+    else:
+        value = res
+        res = parameter_wrapper(None, value)
+    if res.grads is None:
+        grad = np.zeros(np.shape(value) + (k,))
+        return parameter_wrapper(res.name, value, grads=names, grad_values=grad)
+    index = np.array([int(g[len(prefix) :]) for g in res.grads], dtype=int)
+    grad_values = np.asarray(res.grad_values)
+    grad = np.zeros(grad_values.shape[:-1] + (k,))
+    grad[..., index] = grad_values
+    hess = None
+    if res.hessian_values is not None:
+        hessian_values = np.asarray(res.hessian_values)
+        hess = np.zeros(hessian_values.shape[:-2] + (k, k))
+        hess[..., index[:, None], index[None, :]] = hessian_values
+    return parameter_wrapper(res.name, value, grads=names, grad_values=grad, hessian_values=hess)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from context import gradcache
+
+# Stores shared by the test modules, this file holds no test cases
+
+store = gradcache.store
+
+
+def xs_store(parameters=None, **kwargs):
+    """A store of a cross section, per event log weights and their total
+    The physical parameters are energy (per event), scale, shift and norm,
+    parameters names the fit parameters of the store
+    """
+
+    def xs(energy, scale, shift):
+        return scale * energy ** 0.5 + shift
+
+    def weight(xs, norm):
+        return (norm * xs).log()
+
+    def total(weight):
+        return weight.sum()
+
+    the_store = store(default_cache_size=4, **kwargs)
+    the_store.add_prop("xs", ["energy", "scale", "shift"], xs)
+    the_store.add_prop("weight", ["xs", "norm"], weight)
+    the_store.add_prop("total", ["weight"], total)
+    the_store.initialize(parameters=parameters)
+    return the_store
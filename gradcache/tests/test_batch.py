@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class BatchTest(unittest.TestCase):
+    """Batched multi-point evaluation test cases."""
+
+    def build(self, batchable=True, cache_size=10):
+        calls = []
+        x = np.linspace(0.0, 1.0, 5)
+
+        def shape(t):
+            calls.append(("shape", np.shape(t)))
+            return x * x
+
+        def flux(shape, norm):
+            calls.append(("flux", np.shape(norm)))
+            if np.ndim(norm):
+                # Batched call, every argument has a leading batch axis
+                return shape * norm[:, None]
+            return shape * norm
+
+        def total(flux):
+            calls.append(("total", np.shape(flux)))
+            return 1.0 * flux
+
+        the_store = store(default_cache_size=cache_size)
+        the_store.add_prop("shape", ["t"], shape)
+        the_store.add_prop("flux", ["shape", "norm"], flux, batchable=batchable)
+        the_store.add_prop("total", ["flux"], total)
+        the_store.initialize()
+        return the_store, calls
+
+    def test_matches_get_prop(self):
+        the_store, calls = self.build()
+        reference, _ = self.build(batchable=False)
+        norms = [1.0, 2.0, 3.0]
+        res = the_store.get_prop_batch("total", [{"t": 0.5, "norm": n} for n in norms])
+        for n, r in zip(norms, res):
+            self.assertTrue(np.allclose(r, reference["total", {"t": 0.5, "norm": n}]))
+        # The shared prop is computed once and flux once for the whole batch
+        self.assertEqual(calls[0], ("shape", ()))
+        self.assertEqual([c for c in calls if c[0] == "flux"], [("flux", (3,))])
+        self.assertEqual(len([c for c in calls if c[0] == "total"]), 3)
+
+    def test_populates_cache(self):
+        the_store, calls = self.build()
+        the_store.get_prop_batch("total", {"norm": np.array([1.0, 2.0])}, shared={"t": 0.5})
+        del calls[:]
+        res = the_store["total", {"t": 0.5, "norm": 2.0}]
+        self.assertTrue(np.allclose(res, 2.0 * np.linspace(0.0, 1.0, 5) ** 2))
+        self.assertEqual(calls, [])
+        self.assertEqual(the_store.stats()["flux"]["misses"], 2)
+
+    def test_duplicate_points(self):
+        the_store, calls = self.build()
+        res = the_store.get_prop_batch("total", [{"t": 0.5, "norm": 1.0}] * 3)
+        self.assertEqual(len(res), 3)
+        self.assertEqual(len([c for c in calls if c[0] == "flux"]), 1)
+
+    def test_gradient_fallback(self):
+        the_store, calls = self.build()
+        points = [
+            {"t": 0.5, "norm": parameter_wrapper("norm", n, grads=["norm"], grad_values=[1.0])}
+            for n in [1.0, 2.0]
+        ]
+        res = the_store.get_prop_batch("total", points)
+        x = np.linspace(0.0, 1.0, 5)
+        for n, r in zip([1.0, 2.0], res):
+            self.assertTrue(np.allclose(r.value, n * x * x))
+        self.assertEqual([c for c in calls if c[0] == "flux"], [("flux", ()), ("flux", ())])
+
+    def test_batch_length(self):
+        the_store, _ = self.build()
+        with self.assertRaises(ValueError):
+            the_store.get_prop_batch("total", {"norm": np.ones(2), "t": np.ones(3)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+import tracemalloc
+import threading
+import time
+
+from gradcache.cache import function_cache
+from gradcache.policy import make_policy
+from gradcache.memory import make_memory_backend
+
+store = gradcache.store
+
+
+class counter:
+    def __init__(self, f):
+        self.f = f
+        self.calls = 0
+
+    def __call__(self, key, extra):
+        self.calls += 1
+        return self.f(key, extra)
+
+
+class PolicyTest(unittest.TestCase):
+    """Eviction policy test cases."""
+
+    def fill(self, policy, keys):
+        f = counter(lambda key, extra: np.zeros(key[1]))
+        cache = function_cache(f, maxsize=3, policy=policy, sample_mem=False)
+        for key in keys:
+            cache(key, None)
+        return cache, f
+
+    def test_fifo(self):
+        cache, f = self.fill("fifo", [(0, 1), (1, 1), (2, 1), (0, 1), (3, 1)])
+        self.assertEqual(list(cache.keys()), [(1, 1), (2, 1), (3, 1)])
+        self.assertEqual(f.calls, 4)
+
+    def test_lru(self):
+        cache, f = self.fill("lru", [(0, 1), (1, 1), (2, 1), (0, 1), (3, 1)])
+        self.assertEqual(set(cache.keys()), {(0, 1), (2, 1), (3, 1)})
+        self.assertEqual(f.calls, 4)
+
+    def test_lfu(self):
+        keys = [(0, 1), (0, 1), (1, 1), (1, 1), (2, 1), (3, 1)]
+        cache, f = self.fill("lfu", keys)
+        self.assertEqual(set(cache.keys()), {(0, 1), (1, 1), (3, 1)})
+
+    def test_greedy_dual(self):
+        policy = make_policy("cost")
+        policy.insert("cheap", cost=1.0, size=1000)
+        policy.insert("expensive", cost=10.0, size=1000)
+        policy.insert("small", cost=1.0, size=10)
+        self.assertEqual(policy.victim(), "cheap")
+        policy.remove("cheap", evicted=True)
+        self.assertEqual(policy.victim(), "expensive")
+        # Evictions age the remaining entries relative to new ones
+        policy.insert("new", cost=1.0, size=1000)
+        self.assertGreater(policy.priority("new"), 1.0 / 1000)
+
+    def test_greedy_dual_cache(self):
+        cache, f = self.fill("cost", [(0, 10), (1, 10), (2, 10), (3, 10)])
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(len(cache.policy), 3)
+
+    def test_resize(self):
+        cache, f = self.fill("lru", [(0, 1), (1, 1), (2, 1)])
+        cache.set_size(1)
+        self.assertEqual(list(cache.keys()), [(2, 1)])
+        cache.set_size(0)
+        self.assertEqual(len(cache), 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            make_policy("random")
+
+    def test_store_policy(self):
+        calls = []
+
+        def a(g):
+            calls.append(g)
+            return 2.0 * g
+
+        the_store = store(default_cache_size=1)
+        the_store.add_prop("a", ["g"], a, cache_size=2, policy="lru")
+        the_store.initialize()
+
+        for g in [1.0, 2.0, 1.0, 3.0, 1.0]:
+            self.assertEqual(the_store["a", {"g": g}], 2.0 * g)
+        self.assertEqual(calls, [1.0, 2.0, 3.0])
+        self.assertEqual(the_store.props["a"].cache.maxsize, 2)
+        self.assertEqual(the_store.props["a"].cache.policy.name, "lru")
+
+
+class BudgetTest(unittest.TestCase):
+    """Store-wide memory budget test cases."""
+
+    def build(self, budget, policy="lru"):
+        calls = []
+
+        def weights(g):
+            calls.append(("weights", g))
+            return np.full(100, g)
+
+        def flux(h):
+            calls.append(("flux", h))
+            return np.full(50, h)
+
+        the_store = store(
+            default_cache_size=None, memory_budget=budget, budget_policy=policy
+        )
+        the_store.add_prop("weights", ["g"], weights)
+        the_store.add_prop("flux", ["h"], flux)
+        the_store.initialize()
+        return the_store, calls
+
+    def test_residency(self):
+        the_store, calls = self.build(None)
+        the_store["weights", {"g": 1.0}]
+        the_store["weights", {"g": 2.0}]
+        the_store["flux", {"h": 1.0}]
+        residency = the_store.residency()
+        self.assertEqual(residency["weights"], {"entries": 2, "nbytes": 1600})
+        self.assertEqual(residency["flux"], {"entries": 1, "nbytes": 400})
+
+    def test_budget(self):
+        the_store, calls = self.build(2000)
+        for g in [1.0, 2.0, 3.0]:
+            the_store["weights", {"g": g}]
+        the_store["flux", {"h": 1.0}]
+        residency = the_store.residency()
+        total = sum([r["nbytes"] for r in residency.values()])
+        self.assertLessEqual(total, 2000)
+        self.assertEqual(total, the_store.budget.total)
+        # Entries are evicted across props, the newest entries stay resident
+        self.assertIn((3.0,), the_store.props["weights"].cache)
+        self.assertIn((1.0,), the_store.props["flux"].cache)
+        self.assertNotIn((1.0,), the_store.props["weights"].cache)
+
+    def test_oversized(self):
+        the_store, calls = self.build(500)
+        the_store["weights", {"g": 1.0}]
+        the_store["weights", {"g": 1.0}]
+        self.assertEqual(calls, [("weights", 1.0), ("weights", 1.0)])
+        self.assertEqual(the_store.budget.total, 0)
+
+    def test_shrink(self):
+        the_store, calls = self.build(None)
+        for g in [1.0, 2.0, 3.0]:
+            the_store["weights", {"g": g}]
+        the_store.set_memory_budget(1000, "lru")
+        self.assertLessEqual(the_store.budget.total, 1000)
+        self.assertEqual(len(the_store.props["weights"].cache), 1)
+
+    def test_replace_policy(self):
+        the_store, calls = self.build(None, policy="cost")
+        the_store.set_memory_budget(None, "lru")
+        self.assertEqual(the_store.budget.policy.name, "lru")
+        for g in [1.0, 2.0, 3.0]:
+            the_store["weights", {"g": g}]
+        the_store["weights", {"g": 1.0}]
+        the_store.set_memory_budget(1000, "fifo")
+        self.assertEqual(the_store.budget.policy.name, "fifo")
+        # The entries are kept in their insertion order, the newest stays
+        self.assertEqual(list(the_store.props["weights"].cache.keys()), [(3.0,)])
+        # No policy keeps the current one
+        the_store.set_memory_budget(2000)
+        self.assertEqual(the_store.budget.policy.name, "fifo")
+
+    def test_cost_policy(self):
+        the_store, calls = self.build(1000, policy="cost")
+        for g in [1.0, 2.0, 3.0]:
+            the_store["weights", {"g": g}]
+            the_store["flux", {"h": g}]
+        self.assertLessEqual(the_store.budget.total, 1000)
+        self.assertEqual(the_store.budget.total, sum(the_store.budget.resident.values()))
+
+
+class MemoryTest(unittest.TestCase):
+    """Memory measurement backend test cases."""
+
+    def test_size(self):
+        cache = function_cache(lambda key, extra: np.zeros(key[0]), maxsize=2)
+        cache((10,), None)
+        cache((20,), None)
+        self.assertEqual(cache.mem_samples, [80])
+        cache.track_mem = True
+        cache((30,), None)
+        self.assertEqual(cache.mem_samples, [80, 240])
+
+    def test_tracemalloc(self):
+        inner = function_cache(
+            lambda key, extra: np.ones(key[0]), memory_backend="tracemalloc"
+        )
+        outer = function_cache(
+            lambda key, extra: inner(key, extra).sum(), memory_backend="tracemalloc"
+        )
+        outer((100000,), None)
+        # Tracing started by the outer measurement ends with it
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreaterEqual(inner.mem_samples[0], 800000)
+        self.assertGreaterEqual(outer.mem_samples[0], 800000)
+        # Tracing started by the caller is left running
+        outer.track_mem = True
+        tracemalloc.start()
+        try:
+            outer((200000,), None)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+        self.assertGreaterEqual(outer.mem_samples[1], 1600000)
+
+    def test_tracemalloc_threads(self):
+        # Measurements of concurrent computes do not pop each other's frames
+        def compute(key, extra):
+            res = np.ones(key[0])
+            time.sleep(0.01)
+            return res
+
+        caches = [function_cache(compute, memory_backend="tracemalloc") for _ in range(4)]
+        for cache in caches:
+            cache.track_mem = True
+        sizes = [100000, 10000, 200000, 50000]
+        threads = [
+            threading.Thread(target=lambda c=c, n=n: [c((n, i), None) for i in range(3)])
+            for c, n in zip(caches, sizes)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertFalse(tracemalloc.is_tracing())
+        for cache, n in zip(caches, sizes):
+            self.assertEqual(len(cache.mem_samples), 3)
+            for m in cache.mem_samples:
+                self.assertGreaterEqual(m, 8 * n)
+                self.assertLess(m, 8 * n + 100000)
+
+    def test_sampled(self):
+        cache = function_cache(lambda key, extra: np.zeros(4), maxsize=0)
+        cache.set_memory_backend("size", every=3)
+        for i in range(7):
+            cache((i,), None)
+        self.assertEqual(cache.mem_samples, [32, 32, 32])
+
+    def test_sampled_threads(self):
+        # Misses computed concurrently are all counted and sampled once
+        cache = function_cache(lambda key, extra: np.zeros(4), maxsize=0, track_time=True)
+        cache.set_memory_backend("size", every=3)
+        threads = [
+            threading.Thread(target=lambda n=n: [cache.compute((n, i)) for i in range(300)])
+            for n in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(cache.time_samples), 1200)
+        self.assertEqual(cache.mem_samples, [32] * 400)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            make_memory_backend("heap")
+
+    def test_store_backend(self):
+        the_store = store(memory_backend="size", memory_sample_every=2)
+        the_store.add_prop("a", ["g"], lambda g: np.ones(3) * g)
+        the_store.initialize()
+        for g in range(4):
+            the_store["a", {"g": float(g)}]
+        self.assertEqual(the_store.props["a"].cache.mem_samples, [24, 24])
+
+
+if __name__ == "__main__":
+    unittest.main()
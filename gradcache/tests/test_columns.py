@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+columns = gradcache.columns
+
+
+class ColumnTest(unittest.TestCase):
+    """Memory mapped event column test cases."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.energy = np.linspace(1.0, 2.0, 11)
+        self.zenith = np.linspace(-1.0, 1.0, 11).astype(np.float32)
+        self.npy = os.path.join(self.directory, "energy.npy")
+        self.npz = os.path.join(self.directory, "events.npz")
+        np.save(self.npy, self.energy)
+        np.savez(self.npz, energy=self.energy, zenith=self.zenith)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_npy(self):
+        col = columns.column(self.npy)
+        array = col.open()
+        self.assertIsInstance(array, np.memmap)
+        self.assertFalse(array.flags.writeable)
+        self.assertTrue(np.array_equal(array, self.energy))
+        self.assertIs(col.open(), array)
+
+    def test_npz(self):
+        cols = columns.npz_columns(self.npz)
+        self.assertEqual(sorted(cols.keys()), ["energy", "zenith"])
+        zenith = cols["zenith"].open()
+        self.assertIsInstance(zenith, np.memmap)
+        self.assertEqual(zenith.dtype, np.float32)
+        self.assertTrue(np.array_equal(zenith, self.zenith))
+        self.assertTrue(np.array_equal(cols["energy"].open(), self.energy))
+
+    def test_compressed(self):
+        path = os.path.join(self.directory, "compressed.npz")
+        np.savez_compressed(path, energy=self.energy)
+        with self.assertRaises(ValueError):
+            columns.column(path, "energy").open()
+
+    def test_projection(self):
+        calls = []
+
+        def flux(energy, norm):
+            calls.append("flux")
+            return norm * energy
+
+        def angle(zenith):
+            calls.append("angle")
+            return 2.0 * zenith
+
+        the_store = store()
+        the_store.add_columns(columns.npz_columns(self.npz))
+        the_store.add_prop("flux", ["energy", "norm"], flux)
+        the_store.add_prop("angle", ["zenith"], angle)
+        the_store.initialize(props=["flux"])
+        self.assertTrue(the_store.columns["energy"].is_open)
+        self.assertFalse(the_store.columns["zenith"].is_open)
+
+        res = the_store["flux", {"norm": 2.0}]
+        self.assertTrue(np.allclose(res, 2.0 * self.energy))
+        the_store["flux", {"norm": 2.0}]
+        self.assertEqual(calls, ["flux"])
+
+        # Columns of other props are opened on first use
+        self.assertTrue(np.allclose(the_store["angle", {}], 2.0 * self.zenith))
+        self.assertTrue(the_store.columns["zenith"].is_open)
+
+        # Explicit parameters take precedence
+        res = the_store["flux", {"norm": 1.0, "energy": np.ones(3)}]
+        self.assertTrue(np.allclose(res, np.ones(3)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+import tempfile
+import shutil
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class DiskCacheTest(unittest.TestCase):
+    """On-disk memoization test cases."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, scale=2.0, persist=True):
+        calls = []
+
+        def flux(g):
+            calls.append(g)
+            return np.arange(10.0) * g
+
+        def weights(flux, h):
+            return flux * scale * h
+
+        the_store = store(cache_dir=self.directory)
+        the_store.add_prop("flux", ["g"], flux, persist=persist)
+        the_store.add_prop("weights", ["flux", "h"], weights, persist=persist)
+        the_store.initialize()
+        return the_store, calls
+
+    def test_warm_start(self):
+        the_store, calls = self.build()
+        res = the_store["weights", {"g": 1.0, "h": 3.0}]
+        self.assertEqual(calls, [1.0])
+
+        the_store, calls = self.build()
+        warm = the_store["weights", {"g": 1.0, "h": 3.0}]
+        self.assertEqual(calls, [])
+        self.assertIsInstance(warm, np.memmap)
+        self.assertTrue(np.all(warm == res))
+        self.assertEqual(the_store.props["weights"].disk.loads, 1)
+
+    def test_code_change(self):
+        the_store, calls = self.build(scale=2.0)
+        the_store["weights", {"g": 1.0, "h": 3.0}]
+        the_store, calls = self.build(scale=4.0)
+        res = the_store["weights", {"g": 1.0, "h": 3.0}]
+        self.assertTrue(np.all(res == np.arange(10.0) * 12.0))
+        # The upstream prop did not change
+        self.assertEqual(calls, [])
+
+    def test_gradient(self):
+        the_store, calls = self.build()
+        params = {
+            "g": parameter_wrapper("g", 1.0, grads=["g"], grad_values=[1.0]),
+            "h": 3.0,
+        }
+        res = the_store["flux", params]
+        the_store, calls = self.build()
+        warm = the_store["flux", params]
+        self.assertEqual(calls, [])
+        self.assertEqual(warm.grads, res.grads)
+        self.assertTrue(np.all(warm.grad_values == res.grad_values))
+
+    def test_second_order(self):
+        the_store, calls = self.build()
+        params = {
+            "g": parameter_wrapper("g", 1.0, grads=["g"], grad_values=[1.0]),
+            "h": parameter_wrapper("h", 3.0, grads=["h"], grad_values=[1.0]),
+        }
+        res = the_store.get_prop("weights", params, order=2)
+        self.assertIsNotNone(res.hessian_values)
+        the_store, calls = self.build()
+        warm = the_store.get_prop("weights", params, order=2)
+        self.assertEqual(calls, [])
+        self.assertEqual(warm.grads, res.grads)
+        self.assertTrue(np.all(warm.hessian_values == res.hessian_values))
+        # First order entries are stored separately
+        first = the_store.get_prop("weights", params)
+        self.assertIsNone(first.hessian_values)
+
+    def test_large_array(self):
+        # The default store keys large arrays by identity in memory
+        sample = np.linspace(0.0, 1.0, 1000)
+        calls = []
+
+        def build():
+            def weights(sample, g):
+                calls.append(g)
+                return sample * g
+
+            the_store = store(cache_dir=self.directory)
+            the_store.add_prop("weights", ["sample", "g"], weights, persist=True)
+            the_store.initialize()
+            return the_store
+
+        res = build()["weights", {"sample": sample, "g": 2.0}]
+        warm = build()["weights", {"sample": sample.copy(), "g": 2.0}]
+        self.assertEqual(calls, [2.0])
+        self.assertTrue(np.all(warm == res))
+        build()["weights", {"sample": sample + 1.0, "g": 2.0}]
+        self.assertEqual(calls, [2.0, 2.0])
+
+    def test_requires_directory(self):
+        the_store = store()
+        the_store.add_prop("flux", ["g"], lambda g: g, persist=True)
+        with self.assertRaises(ValueError):
+            the_store.initialize()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class ExecutorTest(unittest.TestCase):
+    """Thread pool evaluation test cases."""
+
+    def build(self, threads, sleep=0.0, barrier=None):
+        calls = []
+        lock = threading.Lock()
+
+        def record(name):
+            with lock:
+                calls.append(name)
+            if sleep:
+                time.sleep(sleep)
+
+        def a(g):
+            record("a")
+            if barrier is not None:
+                barrier.wait()
+            return 1.0 * g
+
+        def b(g):
+            record("b")
+            if barrier is not None:
+                barrier.wait()
+            return 2.0 * g
+
+        def c(a, h):
+            record("c")
+            return a * h
+
+        def f(a, b, c, h):
+            record("f")
+            return (a + b) * c + h
+
+        the_store = store(default_cache_size=2, threads=threads)
+        the_store.add_prop("f", ["a", "b", "c", "h"], f)
+        the_store.add_prop("a", ["g"], a)
+        the_store.add_prop("b", ["g"], b)
+        the_store.add_prop("c", ["a", "h"], c)
+        the_store.initialize()
+        return the_store, calls
+
+    def test_matches_serial(self):
+        parallel, parallel_calls = self.build(4)
+        serial, serial_calls = self.build(None)
+        for g, h in [(1.0, 2.0), (1.0, 3.0), (1.0, 2.0), (2.0, 3.0)]:
+            params = {"g": g, "h": h}
+            self.assertEqual(parallel["f", params], serial["f", params])
+        self.assertEqual(sorted(parallel_calls), sorted(serial_calls))
+        parallel.set_threads(None)
+
+    def test_gradients(self):
+        parallel, _ = self.build(4)
+        serial, _ = self.build(None)
+        params = {
+            "g": parameter_wrapper("g", np.arange(3.0), grads=["g"], grad_values=np.ones((3, 1))),
+            "h": parameter_wrapper("h", 2.0, grads=["h"], grad_values=[1.0]),
+        }
+        expected = serial["f", params]
+        res = parallel["f", params]
+        self.assertEqual(list(res.grads), list(expected.grads))
+        self.assertTrue(np.allclose(res.value, expected.value))
+        self.assertTrue(np.allclose(res.grad_values, expected.grad_values))
+        parallel.set_threads(None)
+
+    def test_siblings_concurrent(self):
+        # a and b only return once both are running
+        barrier = threading.Barrier(2, timeout=10)
+        the_store, calls = self.build(4, barrier=barrier)
+        self.assertEqual(the_store["f", {"g": 1.0, "h": 2.0}], (1.0 + 2.0) * 2.0 + 2.0)
+        self.assertEqual(calls[-1], "f")
+        the_store.set_threads(None)
+
+    def test_inflight_dedup(self):
+        the_store, calls = self.build(4, sleep=0.05)
+        results = []
+
+        def request():
+            results.append(the_store["f", {"g": 1.0, "h": 2.0}])
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [8.0] * 8)
+        self.assertEqual(sorted(calls), ["a", "b", "c", "f"])
+        the_store.set_threads(None)
+
+    def test_exception(self):
+        def a(g):
+            raise RuntimeError("a failed")
+
+        def b(g):
+            return 2.0 * g
+
+        def f(a, b):
+            return a + b
+
+        the_store = store(threads=2)
+        the_store.add_prop("f", ["a", "b"], f)
+        the_store.add_prop("a", ["g"], a)
+        the_store.add_prop("b", ["g"], b)
+        the_store.initialize()
+        with self.assertRaises(RuntimeError):
+            the_store["f", {"g": 1.0}]
+        self.assertEqual(the_store.executor.inflight, dict())
+        # The failure is not cached
+        with self.assertRaises(RuntimeError):
+            the_store["f", {"g": 1.0}]
+        the_store.set_threads(None)
+
+
+if __name__ == "__main__":
+    unittest.main()
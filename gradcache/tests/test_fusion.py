@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+parameter_wrapper = gradcache.parameter_wrapper
+trace = gradcache.trace
+fusion = gradcache.fusion
+
+rng = np.random.default_rng(3)
+flux = rng.uniform(0.5, 1.5, 1001)
+xs = rng.uniform(1.0, 2.0, 1001)
+
+
+def weight(norm, gamma, sys):
+    return norm * flux ** gamma * xs / (1.0 + sys)
+
+
+def llh(norm, gamma, sys):
+    w = weight(norm, gamma, sys)
+    # The sum ends the chain, the log is shared by two steps
+    lw = w.log()
+    return (lw * lw).sum() + lw.sum()
+
+
+def params():
+    return [
+        parameter_wrapper("norm", 2.0, grads=["norm"], grad_values=[1.0]),
+        parameter_wrapper("gamma", -1.5, grads=["gamma"], grad_values=[1.0]),
+        parameter_wrapper("sys", rng.uniform(0.0, 0.1, 1001), grads=["sys"], grad_values=np.ones((1001, 1))),
+    ]
+
+
+class FusionTest(unittest.TestCase):
+    """Fused elementwise chain test cases."""
+
+    def test_chains(self):
+        t = trace.trace_function("weight", ["norm", "gamma", "sys"], weight)
+        self.assertEqual([s[1] for s in t.steps], ["fused"])
+        chain = t.fused[t.steps[0][0]]
+        self.assertEqual(len(chain.steps), 5)
+        t = trace.trace_function("llh", ["norm", "gamma", "sys"], llh)
+        self.assertEqual([s[1] for s in t.steps], ["fused", "mul", "sum", "sum", "plus"])
+
+    def test_tiles(self):
+        args = params()
+        plain = trace.trace_function("llh", ["norm", "gamma", "sys"], llh, fuse_chains=False)
+        fused = trace.trace_function("llh", ["norm", "gamma", "sys"], llh)
+        for chain in fused.fused.values():
+            # Tiles of 100 events that do not divide the events
+            chain.tile_bytes = 100 * 8 * 2
+            self.assertEqual(chain.tiling(args), (1001, 100))
+        expected = plain(*args)
+        res = fused(*args)
+        self.assertEqual(list(res.grads), list(expected.grads))
+        self.assertTrue(np.allclose(res.value, expected.value))
+        self.assertTrue(np.allclose(res.grad_values, expected.grad_values))
+
+    def test_untiled(self):
+        t = trace.trace_function("weight", ["norm", "gamma", "sys"], weight)
+        chain = t.fused[t.steps[0][0]]
+        chain.tile_bytes = 64
+        # Scalar inputs only, and inputs of different lengths
+        self.assertIsNone(chain.tiling([1.0, 2.0, 3.0]))
+        self.assertIsNone(chain.tiling([np.ones(3), np.ones(4), 3.0]))
+        res = t(2.0, -1.5, 0.5)
+        self.assertTrue(np.allclose(res.value, 2.0 * flux ** -1.5 * xs / 1.5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+from fixtures import xs_store
+import unittest
+
+parameter_wrapper = gradcache.parameter_wrapper
+ops = gradcache.operators.operators
+second_order = gradcache.hessian.second_order
+
+energy = np.linspace(1.0, 4.0, 5)
+
+
+def seed(name, value, grads):
+    return second_order(parameter_wrapper(name, value, grads=grads, grad_values=[1.0] * len(grads)))
+
+
+def numeric_hessian(f, x, eps=1e-4):
+    """The Hessian of f at the point x by central differences"""
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    res = None
+    for i in range(n):
+        for j in range(n):
+            d = []
+            for si, sj in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+                y = x.copy()
+                y[i] += si * eps
+                y[j] += sj * eps
+                d.append(np.asarray(f(*y), dtype=float))
+            h = (d[0] - d[1] - d[2] + d[3]) / (4 * eps * eps)
+            if res is None:
+                res = np.zeros(np.shape(h) + (n, n))
+            res[..., i, j] = h
+    return res
+
+
+class HessianTest(unittest.TestCase):
+    """Second order forward mode test cases."""
+
+    def test_binary(self):
+        funcs = {
+            "plus": lambda a, b: a + b,
+            "minus": lambda a, b: a - b,
+            "mul": lambda a, b: a * b,
+            "div": lambda a, b: a / b,
+            "pow": lambda a, b: a ** b,
+        }
+        for name, f in funcs.items():
+            res = ops[name].eval(seed("a", 1.3, ["a"]), seed("b", 0.7, ["b"]))
+            self.assertEqual(list(res.grads), ["a", "b"])
+            h = numeric_hessian(lambda a, b: f(a * energy, b), [1.3, 0.7])
+            res = ops[name].eval(
+                parameter_wrapper(None, 1.3 * energy, grads=["a"], grad_values=energy[:, None], hessian_values=np.zeros((5, 1, 1))),
+                seed("b", 0.7, ["b"]),
+            )
+            np.testing.assert_allclose(res.value, f(1.3 * energy, 0.7))
+            np.testing.assert_allclose(res.hessian_values, h, rtol=1e-4, atol=1e-6, err_msg=name)
+
+    def test_pow_constant_exponent(self):
+        for x in [0.0, np.float64(0.0), -1.5]:
+            with np.errstate(all="raise"):
+                res = ops["pow"].eval(seed("x", x, ["x"]), 2.0)
+            self.assertAlmostEqual(float(np.reshape(res.grad_values, -1)[0]), 2.0 * x)
+            self.assertAlmostEqual(float(np.reshape(res.hessian_values, -1)[0]), 2.0)
+        with np.errstate(all="raise"):
+            res = ops["pow"].eval(seed("x", -1.5, ["x"]), 3.0)
+        self.assertAlmostEqual(float(np.reshape(res.hessian_values, -1)[0]), -9.0)
+
+    def test_broadcast_seed(self):
+        # A scalar seed of an array parameter is shared by all its elements
+        x = seed("x", energy, ["x"])
+        self.assertEqual(np.shape(x.grad_values), (5, 1))
+        res = ops["mul"].eval(x, x)
+        np.testing.assert_allclose(np.reshape(res.grad_values, -1), 2.0 * energy)
+        np.testing.assert_allclose(np.reshape(res.hessian_values, -1), 2.0)
+        the_store = xs_store()
+        params = {
+            "energy": parameter_wrapper("energy", energy, grads=["e"], grad_values=[1.0]),
+            "scale": 2.0,
+            "shift": 0.5,
+            "norm": 3.0,
+        }
+        res = the_store.get_prop("weight", params, order=2)
+        first = the_store.get_prop("weight", params)
+        np.testing.assert_allclose(np.reshape(res.grad_values, -1), np.reshape(first.grad_values, -1))
+
+    def test_unary(self):
+        funcs = {
+            "inv": lambda a: -a,
+            "log": np.log,
+            "log10": np.log10,
+            "log2": np.log2,
+            "sqrt": np.sqrt,
+            "lgamma": gradcache.autodiff.lgamma,
+            "log1p": np.log1p,
+        }
+        for name, f in funcs.items():
+            x = ops["mul"].eval(ops["mul"].eval(seed("a", 1.3, ["a"]), seed("b", 0.7, ["b"])), energy)
+            res = ops[name].eval(x)
+            h = numeric_hessian(lambda a, b: f(a * b * energy), [1.3, 0.7])
+            np.testing.assert_allclose(res.hessian_values, h, rtol=1e-4, atol=1e-6, err_msg=name)
+
+    def test_sum(self):
+        x = ops["pow"].eval(ops["mul"].eval(seed("a", 1.3, ["a"]), energy), 3.0)
+        res = ops["sum"].eval(x)
+        np.testing.assert_allclose(res.hessian_values, [[6 * 1.3 * (energy ** 3).sum()]])
+
+    def expected(self, scale, shift, norm):
+        def total(scale, shift, norm):
+            return np.log(norm * (scale * energy ** 0.5 + shift)).sum()
+
+        return total(scale, shift, norm), numeric_hessian(total, [scale, shift, norm])
+
+    def test_store(self):
+        names = ["scale", "shift", "norm"]
+        for kwargs in [dict(), dict(trace_functions=True)]:
+            the_store = xs_store(**kwargs)
+            params = {"energy": energy}
+            for k, v in zip(names, [2.0, 0.5, 3.0]):
+                params[k] = parameter_wrapper(k, v, grads=[k], grad_values=[1.0])
+            first = the_store.get_prop("total", params)
+            self.assertIsNone(first.hessian_values)
+            res = the_store.get_prop("total", params, order=2)
+            value, h = self.expected(2.0, 0.5, 3.0)
+            self.assertEqual(sorted(res.grads), sorted(names))
+            order = [names.index(g) for g in res.grads]
+            h = h[np.ix_(order, order)]
+            np.testing.assert_allclose(res.value, value)
+            np.testing.assert_allclose(np.reshape(res.grad_values, -1), np.reshape(first.grad_values, -1))
+            np.testing.assert_allclose(np.reshape(res.hessian_values, (3, 3)), h, rtol=1e-4, atol=1e-6)
+            # The first order result is still cached under its own key
+            again = the_store.get_prop("total", params)
+            self.assertIsNone(again.hessian_values)
+
+    def test_invalid(self):
+        the_store = xs_store()
+        params = {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0}
+        with self.assertRaises(ValueError):
+            the_store.get_prop("weight", params, order=3)
+        with self.assertRaises(ValueError):
+            the_store.get_prop("weight", params, mode="reverse", order=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+energy = np.linspace(1.0, 10.0, 20)
+
+
+class HoistTest(unittest.TestCase):
+    """Hoisted invariant prop test cases."""
+
+    def build(self, **kwargs):
+        calls = {"xs": 0, "norm_table": 0}
+
+        def xs(energy, scale):
+            calls["xs"] += 1
+            return scale * energy ** 0.5
+
+        def norm_table():
+            calls["norm_table"] += 1
+            return np.arange(3.0)
+
+        def weight(xs, norm, norm_table):
+            return norm * xs * (xs + 1.0) + norm_table.sum()
+
+        the_store = store(default_cache_size=1, hoist=True, **kwargs)
+        the_store.add_prop("xs", ["energy", "scale"], xs)
+        the_store.add_prop("norm_table", [], norm_table)
+        the_store.add_prop("weight", ["xs", "norm", "norm_table"], weight)
+        return the_store, calls
+
+    def norm(self, x):
+        return parameter_wrapper("norm", x, grads=["norm"], grad_values=[1.0])
+
+    def test_constant_prop(self):
+        the_store, calls = self.build()
+        the_store.initialize()
+        self.assertEqual(calls["norm_table"], 1)
+        self.assertEqual(list(the_store.hoisted.keys()), ["norm_table"])
+        for k in range(3):
+            the_store.get_prop("weight", {"energy": energy, "scale": 2.0, "norm": self.norm(k)})
+        self.assertEqual(calls["norm_table"], 1)
+        self.assertEqual(len(the_store.props["norm_table"].cache), 0)
+
+    def test_freeze(self):
+        the_store, calls = self.build()
+        the_store.initialize()
+        the_store.freeze({"energy": energy, "scale": 2.0})
+        self.assertEqual(calls["xs"], 1)
+        for k in range(3):
+            res = the_store.get_prop("weight", {"norm": self.norm(k)})
+            # Evicting the other entries does not drop the pinned result
+            the_store.get_prop("xs", {"energy": energy, "scale": 3.0 + k})
+        self.assertEqual(calls["xs"], 4)
+        expected = 2.0 * energy ** 0.5
+        self.assertTrue(np.allclose(res.value, 2.0 * expected * (expected + 1.0) + 3.0))
+
+        # Unfreezing drops the pinned result
+        the_store.unfreeze(["scale"])
+        self.assertEqual(the_store.props["xs"].cache.pinned, dict())
+        with self.assertRaises(KeyError):
+            the_store.get_prop("weight", {"norm": self.norm(1.0)})
+        the_store.freeze({"scale": 5.0})
+        res = the_store.get_prop("weight", {"norm": self.norm(1.0)})
+        expected = 5.0 * energy ** 0.5
+        self.assertTrue(np.allclose(res.value, expected * (expected + 1.0) + 3.0))
+
+    def test_specialized_trace(self):
+        the_store, calls = self.build(trace_functions=True)
+        the_store.initialize()
+        the_store.freeze({"energy": energy, "scale": 2.0})
+        grad = the_store.props["weight"].grad
+        self.assertIsNotNone(grad.specialized)
+        # xs * (xs + 1.0) and the sum of the table are computed once
+        self.assertLess(len(grad.specialized), len(grad.trace))
+        res = the_store.get_prop("weight", {"norm": self.norm(2.0)})
+        expected = 2.0 * energy ** 0.5
+        self.assertTrue(np.allclose(res.value, 2.0 * expected * (expected + 1.0) + 3.0))
+        self.assertTrue(np.allclose(res.grad_values[:, 0], expected * (expected + 1.0)))
+        # Other values of the frozen parameters use the general trace
+        res = the_store.get_prop("weight", {"norm": self.norm(2.0), "scale": 1.0})
+        expected = energy ** 0.5
+        self.assertTrue(np.allclose(res.value, 2.0 * expected * (expected + 1.0) + 3.0))
+        the_store.unfreeze()
+        self.assertIsNone(grad.specialized)
+
+
+if __name__ == "__main__":
+    unittest.main()
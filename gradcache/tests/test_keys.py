@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+from gradcache.keys import mark_modified
+
+store = gradcache.store
+key_builder = gradcache.key_builder
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class KeyTest(unittest.TestCase):
+    """Cache key construction test cases."""
+
+    def test_floats(self):
+        keys = key_builder()
+        self.assertEqual(keys((1.0, 2)), (1.0, 2))
+        self.assertEqual(keys((np.float64(1.5),)), (1.5,))
+        self.assertEqual(hash(keys((0.0,))), hash(keys((-0.0,))))
+
+    def test_quantization(self):
+        keys = key_builder(float_bits=40)
+        self.assertEqual(keys((0.1 + 0.2,)), keys((0.3,)))
+        self.assertNotEqual(keys((0.3,)), keys((0.3001,)))
+        self.assertNotEqual(key_builder()((0.1 + 0.2,)), key_builder()((0.3,)))
+
+    def test_small_arrays(self):
+        keys = key_builder()
+        a = np.arange(4.0)
+        b = np.arange(4.0)
+        self.assertEqual(keys((a,)), keys((b,)))
+        hash(keys((a,)))
+        self.assertNotEqual(keys((a,)), keys((a.astype(np.float32),)))
+        self.assertNotEqual(keys((a,)), keys((a.reshape(2, 2),)))
+
+    def test_large_arrays(self):
+        keys = key_builder(small_array_size=8)
+        a = np.arange(100.0)
+        b = np.arange(100.0)
+        self.assertEqual(keys((a,)), keys((a,)))
+        self.assertNotEqual(keys((a,)), keys((b,)))
+        key = keys((a,))
+        a[0] = 5.0
+        mark_modified(a)
+        self.assertNotEqual(keys((a,)), key)
+
+    def test_digest(self):
+        keys = key_builder(small_array_size=8, array_mode="digest")
+        a = np.arange(100.0)
+        b = np.arange(100.0)
+        b.flags.writeable = False
+        self.assertEqual(keys((a,)), keys((b,)))
+        self.assertEqual(keys((b,)), keys((b,)))
+        self.assertNotEqual(keys((a,)), keys((a + 1,)))
+
+    def test_parameter_wrapper(self):
+        keys = key_builder()
+        p0 = parameter_wrapper("g", 1.0, grads=["g"], grad_values=np.array([1.0]))
+        p1 = parameter_wrapper("g", 1.0, grads=["g"], grad_values=np.array([1.0]))
+        p2 = parameter_wrapper("g", 1.0, grads=["g"], grad_values=np.array([2.0]))
+        self.assertEqual(keys((p0,)), keys((p1,)))
+        self.assertNotEqual(keys((p0,)), keys((p2,)))
+        self.assertNotEqual(keys((p0,)), keys((1.0,)))
+        self.assertEqual(keys((parameter_wrapper("g", 1.0),)), keys((1.0,)))
+
+    def test_store(self):
+        calls = []
+
+        def scaled(scales):
+            calls.append(1)
+            return 2.0 * scales
+
+        the_store = store(key_builder=key_builder(small_array_size=4))
+        the_store.add_prop("scaled", ["scales"], scaled)
+        the_store.initialize()
+
+        scales = np.ones(10)
+        the_store["scaled", {"scales": scales}]
+        the_store["scaled", {"scales": scales}]
+        self.assertEqual(len(calls), 1)
+        the_store["scaled", {"scales": np.ones(2)}]
+        the_store["scaled", {"scales": np.ones(2)}]
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class PlanTest(unittest.TestCase):
+    """Compiled evaluation plan test cases."""
+
+    def build(self, compile_plans):
+        calls = []
+
+        def a(g):
+            calls.append("a")
+            return 1.0 * g
+
+        def b(g):
+            calls.append("b")
+            return 2.0 * g
+
+        def c(a, h):
+            calls.append("c")
+            return a * h
+
+        def f(a, b, c, h):
+            calls.append("f")
+            return (a + b) * c + h
+
+        the_store = store(default_cache_size=2, compile_plans=compile_plans)
+        the_store.add_prop("f", ["a", "b", "c", "h"], f)
+        the_store.add_prop("a", ["g"], a)
+        the_store.add_prop("b", ["g"], b)
+        the_store.add_prop("c", ["a", "h"], c)
+        the_store.initialize()
+        return the_store, calls
+
+    def test_plan(self):
+        the_store, calls = self.build(True)
+        plan = the_store.plans["f"]
+        self.assertEqual(plan.order[-1], "f")
+        self.assertLess(plan.order.index("a"), plan.order.index("c"))
+        self.assertEqual(sorted(plan.param_names), ["g", "h"])
+
+    def test_matches_recursive(self):
+        compiled, compiled_calls = self.build(True)
+        recursive, recursive_calls = self.build(False)
+        for g, h in [(1.0, 2.0), (1.0, 3.0), (1.0, 2.0), (2.0, 3.0)]:
+            params = {"g": g, "h": h}
+            self.assertEqual(compiled["f", params], recursive["f", params])
+        self.assertEqual(compiled_calls, recursive_calls)
+        # Shared dependencies are only looked up once per request
+        self.assertLess(compiled.stats()["a"]["hits"], recursive.stats()["a"]["hits"])
+
+    def test_lazy(self):
+        the_store, calls = self.build(True)
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        self.assertEqual(calls, ["a", "b", "c", "f"])
+        del calls[:]
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        self.assertEqual(calls, [])
+        self.assertEqual(the_store.stats()["f"]["hits"], 1)
+        self.assertEqual(the_store.stats()["a"]["hits"], 0)
+        # Only the props that depend on h are recomputed
+        the_store["f", {"g": 1.0, "h": 3.0}]
+        self.assertEqual(calls, ["c", "f"])
+
+    def test_gradient(self):
+        compiled, calls = self.build(True)
+        recursive, calls = self.build(False)
+        params = {
+            "g": parameter_wrapper("g", 1.0, grads=["g"], grad_values=[1.0]),
+            "h": parameter_wrapper("h", 2.0, grads=["h"], grad_values=[1.0]),
+        }
+        res0 = compiled["f", params]
+        res1 = recursive["f", params]
+        self.assertEqual(res0.grads, res1.grads)
+        self.assertTrue(np.allclose(res0.grad_values, res1.grad_values))
+
+    def test_missing_parameter(self):
+        the_store, calls = self.build(True)
+        with self.assertRaises(KeyError):
+            the_store["f", {"g": 1.0}]
+
+
+if __name__ == "__main__":
+    unittest.main()
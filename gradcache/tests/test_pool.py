@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+ad = gradcache.autodiff
+pool = gradcache.pool
+
+
+def build(buffer_pool):
+    e = np.linspace(1.0, 2.0, 50)
+
+    def weight(a, b):
+        return a * e + b / e
+
+    def llh(weight, a):
+        r = weight - a
+        return (r * r).sum() + a ** 2
+
+    the_store = store(buffer_pool=buffer_pool)
+    if buffer_pool:
+        the_store.buffer_pool.min_nbytes = 0
+    the_store.add_prop("weight", ["a", "b"], weight)
+    the_store.add_prop("llh", ["weight", "a"], llh)
+    the_store.initialize()
+    return the_store
+
+
+def seeds(k):
+    return {
+        "a": parameter_wrapper("a", 0.5 + k, grads=["a", "b"], grad_values=[1.0, 0.0]),
+        "b": parameter_wrapper("b", 1.5 - k, grads=["a", "b"], grad_values=[0.0, 1.0]),
+    }
+
+
+class PoolTest(unittest.TestCase):
+    """Buffer pool test cases."""
+
+    def test_reuse(self):
+        p = pool.buffer_pool(min_nbytes=0)
+        a = p.take((3, 2))
+        block = a.base.base.obj
+        del a
+        self.assertEqual(p.nbytes, 48)
+        # Blocks are reused across shapes of the same size
+        b = p.take((6,))
+        self.assertIs(b.base.base.obj, block)
+        self.assertEqual((p.allocations, p.reuses), (1, 1))
+
+    def test_returned_under_lock(self):
+        # An array can become garbage while its pool is locked, for example in a
+        # garbage collection triggered by the pool itself
+        p = pool.buffer_pool(min_nbytes=0)
+        a = p.take((3, 2))
+        with p.lock:
+            del a
+        self.assertEqual(p.nbytes, 48)
+        p.take((6,))
+        self.assertEqual((p.allocations, p.reuses), (1, 1))
+
+    def test_views_keep_buffer(self):
+        p = pool.buffer_pool(min_nbytes=0)
+        with p.scope():
+            x = ad.apply(np.add, np.ones(4), np.ones(4))
+            y = x[1:].reshape(3, 1)
+            del x
+            self.assertEqual(p.nbytes, 0)
+            z = ad.apply(np.add, np.zeros(4), 5.0)
+        self.assertTrue(np.array_equal(y, np.full((3, 1), 2.0)))
+        del y
+        self.assertEqual(p.nbytes, 32)
+
+    def test_no_pool(self):
+        self.assertIsNone(pool.active_pool())
+        x = np.ones(3)
+        self.assertTrue(np.array_equal(ad.apply(np.add, x, x), 2 * x))
+
+    def test_store(self):
+        plain = build(False)
+        pooled = build(True)
+        for k in range(4):
+            expected = plain.get_prop("llh", seeds(0.1 * k))
+            res = pooled.get_prop("llh", seeds(0.1 * k))
+            self.assertTrue(np.allclose(res.value, expected.value))
+            self.assertTrue(np.allclose(res.grad_values, expected.grad_values))
+        # Cached results are not overwritten by later evaluations
+        first = pooled.get_prop("weight", seeds(0.0))
+        value = np.array(first.value)
+        pooled.get_prop("weight", seeds(1.0))
+        self.assertTrue(np.array_equal(first.value, value))
+
+    def test_steady_state(self):
+        the_store = build(True)
+        p = the_store.buffer_pool
+        the_store.get_prop("llh", seeds(0.0))
+        p.reset_counts()
+        the_store.get_prop("llh", seeds(0.2))
+        # Only the arrays of the results held by the caches are new
+        self.assertGreater(p.reuses, 0)
+        self.assertLessEqual(p.allocations, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
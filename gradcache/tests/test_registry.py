@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+from fixtures import xs_store
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+energy = np.linspace(1.0, 4.0, 5)
+fit = ["shift", "norm", "scale"]
+
+
+class RegistryTest(unittest.TestCase):
+    """Gradient column registry test cases."""
+
+    def test_columns(self):
+        the_store = xs_store(parameters=fit)
+        self.assertEqual(the_store.gradients.names, ["norm", "scale", "shift"])
+        self.assertEqual(the_store.gradients.index["scale"], 1)
+        self.assertEqual(list(the_store.gradients.columns(["shift", 1])), [2, 1])
+        # The layout is not inferred from a query
+        the_store = xs_store()
+        with self.assertRaises(ValueError):
+            the_store.get_jac("total", {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0})
+        self.assertIsNone(the_store.gradients.names)
+
+    def test_named(self):
+        the_store = store()
+        the_store.add_prop("xs", ["energy", "scale", "shift"], lambda energy, scale, shift: scale * energy + shift)
+        the_store.initialize(parameters=["shift", "scale"])
+        self.assertEqual(the_store.gradients.names, ["scale", "shift"])
+        value, jac = the_store.get_jac("xs", {"energy": energy, "scale": 2.0, "shift": 0.5})
+        self.assertEqual(jac.shape, (5, 2))
+        np.testing.assert_allclose(jac, np.stack([energy, np.ones(5)], axis=-1))
+        the_store = store()
+        the_store.add_prop("xs", ["energy", "scale"], lambda energy, scale: scale * energy)
+        with self.assertRaises(ValueError):
+            the_store.initialize(parameters=["missing"])
+
+    def test_jac(self):
+        for kwargs in [dict(), dict(trace_functions=True)]:
+            the_store = xs_store(parameters=fit, **kwargs)
+            params = {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0}
+            value, jac = the_store.get_jac("total", params)
+            xs = 2.0 * energy ** 0.5 + 0.5
+            self.assertAlmostEqual(value, np.log(3.0 * xs).sum())
+            self.assertEqual(jac.shape, (3,))
+            np.testing.assert_allclose(jac, [5.0 / 3.0, (energy ** 0.5 / xs).sum(), (1.0 / xs).sum()])
+            # The same gradient seeded by name
+            named = dict(params)
+            for k in ["scale", "shift", "norm"]:
+                named[k] = parameter_wrapper(k, params[k], grads=[k], grad_values=[1.0])
+            res = the_store.get_prop("total", named)
+            np.testing.assert_allclose(the_store.gradients.jac(res), jac)
+
+    def test_subset(self):
+        the_store = xs_store(parameters=fit)
+        params = {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0}
+        value, jac = the_store.get_jac("weight", params, names=["norm"])
+        self.assertEqual(jac.shape, (5, 3))
+        np.testing.assert_allclose(jac[:, 0], 1.0 / 3.0)
+        self.assertTrue(np.all(jac[:, [1, 2]] == 0))
+        with self.assertRaises(ValueError):
+            the_store.get_jac("weight", params, names=["missing"])
+
+    def test_hess(self):
+        the_store = xs_store(parameters=fit)
+        params = the_store.gradients.seed({"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0})
+        res = the_store.get_prop("total", params, order=2)
+        hess = the_store.gradients.hess(res)
+        self.assertEqual(hess.shape, (3, 3))
+        self.assertAlmostEqual(hess[0, 0], -5.0 / 9.0)
+        self.assertTrue(np.allclose(hess, hess.T))
+        # The log separates norm from the other parameters
+        self.assertAlmostEqual(hess[0, 1], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
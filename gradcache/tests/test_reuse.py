@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+def seeded(name, value):
+    return parameter_wrapper(name, value, grads=[name], grad_values=[1.0])
+
+
+class ReuseTest(unittest.TestCase):
+    """Reuse of gradient entries test cases."""
+
+    def build(self):
+        calls = []
+
+        def a(g):
+            calls.append("a")
+            return np.arange(1.0, 4.0) * g
+
+        def b(h):
+            calls.append("b")
+            return np.arange(1.0, 4.0) + h
+
+        def f(a, b, k):
+            calls.append("f")
+            return a * b * k
+
+        the_store = store(default_cache_size=4)
+        the_store.add_prop("a", ["g"], a)
+        the_store.add_prop("b", ["h"], b)
+        the_store.add_prop("f", ["a", "b", "k"], f)
+        the_store.initialize()
+        return the_store, calls
+
+    def test_value_from_gradient(self):
+        the_store, calls = self.build()
+        params = {"g": seeded("g", 2.0), "h": seeded("h", 1.0), "k": 3.0}
+        res = the_store["f", params]
+        del calls[:]
+        value = the_store["f", {"g": 2.0, "h": 1.0, "k": 3.0}]
+        self.assertEqual(calls, [])
+        self.assertTrue(np.allclose(value, res.value))
+        self.assertEqual(the_store.stats()["f"]["hits"], 1)
+
+    def test_gradient_reuses_upstream(self):
+        the_store, calls = self.build()
+        the_store["f", {"g": 2.0, "h": 1.0, "k": 3.0}]
+        del calls[:]
+        the_store["f", {"g": seeded("g", 2.0), "h": 1.0, "k": 3.0}]
+        self.assertEqual(calls, ["a", "f"])
+
+    def test_gradient_subset(self):
+        the_store, calls = self.build()
+        full = the_store["f", {"g": seeded("g", 2.0), "h": seeded("h", 1.0), "k": 3.0}]
+        del calls[:]
+        sub = the_store["f", {"g": seeded("g", 2.0), "h": 1.0, "k": 3.0}]
+        self.assertEqual(calls, [])
+        self.assertEqual(sub.grads, ("g",))
+        self.assertTrue(np.may_share_memory(sub.grad_values, full.grad_values))
+
+        fresh, calls = self.build()
+        direct = fresh["f", {"g": seeded("g", 2.0), "h": 1.0, "k": 3.0}]
+        self.assertTrue(np.allclose(sub.value, direct.value))
+        self.assertTrue(np.allclose(sub.grad_values, direct.grad_values))
+
+    def test_incompatible_seeds(self):
+        the_store, calls = self.build()
+        the_store["f", {"g": seeded("g", 2.0), "h": seeded("h", 1.0), "k": 3.0}]
+        del calls[:]
+        g = parameter_wrapper("g", 2.0, grads=["g"], grad_values=[2.0])
+        the_store["f", {"g": g, "h": 1.0, "k": 3.0}]
+        self.assertIn("f", calls)
+
+    def test_eviction(self):
+        the_store, calls = self.build()
+        the_store["f", {"g": seeded("g", 2.0), "h": 1.0, "k": 3.0}]
+        the_store.props["f"].clear_cache()
+        self.assertEqual(the_store.props["f"].cache.reuse.index, {})
+        del calls[:]
+        the_store["f", {"g": 2.0, "h": 1.0, "k": 3.0}]
+        self.assertEqual(calls, ["f"])
+
+
+if __name__ == "__main__":
+    unittest.main()
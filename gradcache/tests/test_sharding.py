@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+sharded_store = gradcache.sharded_store
+parameter_wrapper = gradcache.parameter_wrapper
+sharding = gradcache.sharding
+
+
+def build():
+    def weight(energy, norm):
+        return norm * energy
+
+    def llh(weight, data):
+        return np.sum((weight - data) ** 2)
+
+    the_store = store()
+    the_store.add_prop("weight", ["energy", "norm"], weight)
+    the_store.add_prop("llh", ["weight", "data"], llh)
+    the_store.initialize()
+    return the_store
+
+
+class ShardingTest(unittest.TestCase):
+    """Event sharded evaluation test cases."""
+
+    def setUp(self):
+        self.energy = np.linspace(1.0, 2.0, 101)
+        self.data = np.linspace(0.5, 3.0, 101)
+
+    def test_bounds(self):
+        bounds = sharding.shard_bounds(10, 3)
+        self.assertEqual(bounds[0][0], 0)
+        self.assertEqual(bounds[-1][1], 10)
+        self.assertEqual(sum([b - a for a, b in bounds]), 10)
+
+    def test_sum(self):
+        the_store = build()
+        events = {"energy": self.energy, "data": self.data}
+        with sharded_store(build(), events, shards=3) as sharded:
+            for norm in [1.0, 1.5, 1.0]:
+                params = {"energy": self.energy, "data": self.data, "norm": norm}
+                self.assertTrue(np.isclose(sharded["llh", {"norm": norm}], the_store["llh", params]))
+
+    def test_concatenate_gradient(self):
+        the_store = build()
+        events = {"energy": self.energy}
+        norm = parameter_wrapper("norm", 1.5, grads=["norm"], grad_values=[1.0])
+        expected = the_store["weight", {"energy": self.energy, "norm": norm}]
+        with sharded_store(build(), events, shards=4, reduce="concatenate") as sharded:
+            res = sharded["weight", {"norm": norm}]
+        self.assertEqual(list(res.grads), ["norm"])
+        self.assertTrue(np.allclose(res.value, expected.value))
+        self.assertTrue(np.allclose(res.grad_values, np.asarray(expected.grad_values).reshape(res.grad_values.shape)))
+
+    def test_reduce_gradient(self):
+        a = parameter_wrapper(None, 1.0, grads=["x", "y"], grad_values=np.array([1.0, 2.0]))
+        b = parameter_wrapper(None, 2.0, grads=["y"], grad_values=np.array([3.0]))
+        res = sharding.reduce_results([a, b])
+        self.assertEqual(res.value, 3.0)
+        self.assertEqual(list(res.grads), ["x", "y"])
+        self.assertTrue(np.allclose(res.grad_values, [1.0, 5.0]))
+
+    def test_reduce_hessian(self):
+        a = parameter_wrapper(
+            None, 1.0, grads=["x", "y"], grad_values=np.array([1.0, 2.0]), hessian_values=np.array([[1.0, 2.0], [2.0, 3.0]])
+        )
+        b = parameter_wrapper(None, 2.0, grads=["y"], grad_values=np.array([3.0]), hessian_values=np.array([[4.0]]))
+        res = sharding.reduce_results([a, b])
+        self.assertTrue(np.allclose(res.hessian_values, [[1.0, 2.0], [2.0, 7.0]]))
+        a = parameter_wrapper(None, np.ones(2), grads=["x"], grad_values=np.ones((2, 1)), hessian_values=np.ones((2, 1, 1)))
+        b = parameter_wrapper(None, np.ones(1), grads=["y"], grad_values=np.ones((1, 1)), hessian_values=np.ones((1, 1, 1)))
+        res = sharding.reduce_results([a, b], "concatenate")
+        self.assertEqual(np.shape(res.hessian_values), (3, 2, 2))
+        self.assertTrue(np.allclose(res.hessian_values[:, 0, 0], [1.0, 1.0, 0.0]))
+        self.assertTrue(np.allclose(res.hessian_values[:, 1, 1], [0.0, 0.0, 1.0]))
+
+    def test_error(self):
+        events = {"energy": self.energy, "data": self.data}
+        with sharded_store(build(), events, shards=2) as sharded:
+            with self.assertRaises(KeyError):
+                sharded["llh", {}]
+            # The workers survive the error
+            self.assertTrue(np.isfinite(sharded["llh", {"norm": 1.0}]))
+
+
+if __name__ == "__main__":
+    unittest.main()
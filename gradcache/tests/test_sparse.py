@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+ad = gradcache.autodiff
+sparse = gradcache.sparse
+
+
+class SparseTest(unittest.TestCase):
+    """Sparse gradient column test cases."""
+
+    def test_combine_layouts(self):
+        val = np.ones(3)
+        t0 = np.arange(6.0).reshape(3, 2)
+        t1 = np.ones((3, 2))
+        # Aligned, disjoint and overlapping columns
+        for resdim0, resdim1, nres in [
+            ([0, 1], [0, 1], 2),
+            ([0, 1], [2, 3], 4),
+            ([0, 2], [1, 3], 4),
+            ([0, 1], [1, 2], 3),
+            ([1, 0], [0, 1], 2),
+        ]:
+            expected = np.zeros((3, nres))
+            expected[..., resdim0] = t0
+            expected[..., resdim1] += t1
+            res = ad.combine_grad(val, nres, np.array(resdim0), t0, np.array(resdim1), t1)
+            self.assertTrue(np.array_equal(res, expected), (resdim0, resdim1))
+
+    def test_combine_broadcast(self):
+        # A scalar operand gradient broadcast against an array value
+        res = ad.combine_grad(np.ones(3), 1, np.array([0]), np.array([2.0]), np.array([0]), np.ones((3, 1)))
+        self.assertTrue(np.array_equal(res, np.full((3, 1), 3.0)))
+
+    def test_prune(self):
+        p = parameter_wrapper("a", 1.0, grads=["a", "b", "c"], grad_values=[1.0, 0.0, 0.0])
+        q, names = sparse.prune_parameter(p)
+        self.assertEqual(list(q.grads), ["a"])
+        self.assertEqual(list(names), ["a", "b", "c"])
+        p = parameter_wrapper("a", np.ones(2), grads=["a", "b"], grad_values=np.array([[0.0, 1.0], [0.0, 2.0]]))
+        q, _ = sparse.prune_parameter(p)
+        self.assertEqual(list(q.grads), ["b"])
+        self.assertEqual(q.grad_values.shape, (2, 1))
+
+    def build(self, prune_seeds):
+        def flux(a, e):
+            return a * e
+
+        def other(b, e):
+            return b + e
+
+        def total(flux, other):
+            return flux * other
+
+        the_store = store(prune_seeds=prune_seeds)
+        the_store.add_prop("flux", ["a", "e"], flux)
+        the_store.add_prop("other", ["b", "e"], other)
+        the_store.add_prop("total", ["flux", "other"], total)
+        the_store.initialize()
+        return the_store
+
+    def test_store(self):
+        names = ["a", "b", "c", "d"]
+        params = {
+            "a": parameter_wrapper("a", 2.0, grads=names, grad_values=[1.0, 0.0, 0.0, 0.0]),
+            "b": parameter_wrapper("b", 3.0, grads=names, grad_values=[0.0, 1.0, 0.0, 0.0]),
+            "e": np.linspace(1.0, 2.0, 5),
+        }
+        expected = self.build(False)["total", params]
+        res = self.build(True)["total", params]
+        self.assertEqual(sorted(res.grads), names)
+        self.assertTrue(np.allclose(res.value, expected.value))
+        for j, n in enumerate(expected.grads):
+            self.assertTrue(np.allclose(res.grad_values[..., list(res.grads).index(n)], expected.grad_values[..., j]))
+
+    def test_column_order(self):
+        # Pruning does not reorder the gradient columns
+        def f(a, b, c):
+            return 2.0 * b + c * a
+
+        names = ["a", "b", "c"]
+        params = dict(
+            [(n, parameter_wrapper(n, 1.0, grads=names, grad_values=np.eye(3)[i])) for i, n in enumerate(names)]
+        )
+        results = []
+        for prune_seeds in [False, True]:
+            the_store = store(prune_seeds=prune_seeds)
+            the_store.add_prop("f", ["a", "b", "c"], f)
+            the_store.initialize()
+            results.append(the_store["f", params])
+        expected, res = results
+        self.assertEqual(list(res.grads), list(expected.grads))
+        self.assertTrue(np.allclose(np.ravel(res.grad_values), np.ravel(expected.grad_values)))
+        self.assertTrue(np.allclose(np.ravel(res.grad_values), [1.0, 2.0, 1.0]))
+        # Names the result does not depend on are zero columns in their place
+        res = sparse.densify(parameter_wrapper(None, 1.0, grads=["c", "a"], grad_values=[3.0, 4.0]), names)
+        self.assertEqual(list(res.grads), names)
+        self.assertTrue(np.allclose(res.grad_values, [4.0, 0.0, 3.0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
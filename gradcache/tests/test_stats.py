@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class StatsTest(unittest.TestCase):
+    """Cache statistics test cases."""
+
+    def build(self):
+        def a(g):
+            return np.ones(4) * g
+
+        def f(a, h):
+            return a * h
+
+        the_store = store(default_cache_size=2)
+        the_store.add_prop("a", ["g"], a)
+        the_store.add_prop("f", ["a", "h"], f)
+        the_store.initialize()
+        return the_store
+
+    def test_counters(self):
+        the_store = self.build()
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        the_store["f", {"g": 1.0, "h": 3.0}]
+        the_store["f", {"g": 2.0, "h": 3.0}]
+        stats = the_store.stats()
+        self.assertEqual(stats["f"]["hits"], 1)
+        self.assertEqual(stats["f"]["misses"], 3)
+        self.assertEqual(stats["f"]["evictions"], 1)
+        self.assertEqual(stats["a"]["hits"], 1)
+        self.assertEqual(stats["a"]["misses"], 2)
+        self.assertEqual(stats["a"]["nbytes"], 64)
+        self.assertEqual(stats["f"]["time_histogram"].sum(), 3)
+        self.assertEqual(len(str(stats).splitlines()), 3)
+
+    def test_gradient_calls(self):
+        the_store = self.build()
+        g = parameter_wrapper("g", 1.0, grads=["g"], grad_values=[1.0])
+        the_store["f", {"g": g, "h": 2.0}]
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        stats = the_store.stats()
+        self.assertEqual(stats["f"]["grad_calls"], 1)
+        self.assertEqual(stats["f"]["value_calls"], 1)
+
+    def test_since_and_reset(self):
+        the_store = self.build()
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        before = the_store.stats()
+        the_store["f", {"g": 1.0, "h": 2.0}]
+        delta = the_store.stats(since=before)
+        self.assertEqual(delta["f"]["hits"], 1)
+        self.assertEqual(delta["f"]["misses"], 0)
+        self.assertTrue(np.isnan(delta["f"]["mean_time"]))
+        the_store.reset_stats()
+        self.assertEqual(the_store.stats()["f"]["hits"], 0)
+        self.assertEqual(the_store.stats()["f"]["entries"], 1)
+
+    def test_empty_state(self):
+        the_store = self.build()
+        state = the_store.props["f"].get_cache_state()
+        self.assertEqual(state[0], 0)
+        self.assertTrue(np.isnan(state[2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
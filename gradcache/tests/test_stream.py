@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+streamed_store = gradcache.streamed_store
+parameter_wrapper = gradcache.parameter_wrapper
+
+
+class StreamTest(unittest.TestCase):
+    """Chunked streaming evaluation test cases."""
+
+    def setUp(self):
+        self.energy = np.linspace(1.0, 2.0, 103)
+        self.data = np.linspace(0.5, 3.0, 103)
+
+    def build(self, **kwargs):
+        sizes = []
+
+        def weight(energy, norm):
+            if isinstance(energy, np.ndarray):
+                sizes.append(len(energy))
+            return norm * energy
+
+        def chi2(weight, data):
+            r = weight - data
+            return (r * r).sum()
+
+        def llh(chi2, norm):
+            r = norm - 1.0
+            return chi2 + r * r
+
+        the_store = store(**kwargs)
+        the_store.add_prop("weight", ["energy", "norm"], weight)
+        the_store.add_prop("chi2", ["weight", "data"], chi2, reduction="sum")
+        the_store.add_prop("llh", ["chi2", "norm"], llh)
+        the_store.initialize()
+        return the_store, sizes
+
+    def test_value(self):
+        reference, _ = self.build()
+        the_store, sizes = self.build()
+        streamed = streamed_store(the_store, {"energy": self.energy, "data": self.data}, chunk_size=10)
+        for norm in [1.0, 1.5, 1.5]:
+            expected = reference["llh", {"energy": self.energy, "data": self.data, "norm": norm}]
+            self.assertTrue(np.isclose(streamed["llh", {"norm": norm}], expected))
+        # Per-event props only ever see a chunk, the repeated point is a hit
+        self.assertEqual(max(sizes), 10)
+        self.assertEqual(len(sizes), 2 * 11)
+
+    def test_memory_bound(self):
+        the_store, sizes = self.build(default_cache_size=100)
+        streamed = streamed_store(the_store, {"energy": self.energy, "data": self.data}, chunk_size=10)
+        for norm in [1.0, 1.5, 2.0]:
+            streamed["llh", {"norm": norm}]
+        # Only the totals are cached, the per-event results of the chunks are dropped
+        self.assertEqual(len(the_store.props["weight"].cache), 0)
+        self.assertEqual(the_store.props["weight"].cache.nbytes, 0)
+        self.assertEqual(len(the_store.props["chi2"].cache), 3)
+        self.assertLess(the_store.props["chi2"].cache.nbytes, self.energy.nbytes)
+        # A point that is not cached any more streams the chunks again
+        the_store.props["llh"].cache.clear()
+        the_store.props["chi2"].cache.clear()
+        streamed["llh", {"norm": 1.0}]
+        self.assertEqual(len(sizes), 4 * 11)
+        self.assertEqual(max(sizes), 10)
+
+    def test_gradient(self):
+        reference, _ = self.build()
+        the_store, _ = self.build()
+        streamed = streamed_store(the_store, {"energy": self.energy, "data": self.data}, chunk_size=25)
+        norm = parameter_wrapper("norm", 1.3, grads=["norm"], grad_values=[1.0])
+        expected = reference["llh", {"energy": self.energy, "data": self.data, "norm": norm}]
+        res = streamed["llh", {"norm": norm}]
+        self.assertEqual(list(res.grads), list(expected.grads))
+        self.assertTrue(np.isclose(res.value, expected.value))
+        self.assertTrue(np.allclose(np.ravel(res.grad_values), np.ravel(expected.grad_values)))
+
+    def test_unreduced(self):
+        the_store, _ = self.build()
+        streamed = streamed_store(the_store, {"energy": self.energy, "data": self.data}, chunk_size=10)
+        with self.assertRaises(ValueError):
+            streamed["weight", {"norm": 1.0}]
+
+
+if __name__ == "__main__":
+    unittest.main()
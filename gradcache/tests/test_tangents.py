@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+from fixtures import xs_store
+import unittest
+
+parameter_wrapper = gradcache.parameter_wrapper
+
+energy = np.linspace(1.0, 4.0, 5)
+
+
+class TangentsTest(unittest.TestCase):
+    """Jacobian-vector product test cases."""
+
+    def seeded(self):
+        names = ["scale", "shift", "norm"]
+        values = [2.0, 0.5, 3.0]
+        params = {"energy": energy}
+        for i, (k, v) in enumerate(zip(names, values)):
+            params[k] = parameter_wrapper(k, v, grads=names, grad_values=np.eye(3)[i])
+        return params
+
+    def full_gradient(self, the_store, name):
+        res = the_store.get_prop(name, self.seeded())
+        order = [list(res.grads).index(k) for k in ["scale", "shift", "norm"]]
+        return np.asarray(res.grad_values)[..., order]
+
+    def test_directions(self):
+        for kwargs in [dict(), dict(trace_functions=True)]:
+            the_store = xs_store(**kwargs)
+            tangents = [{"scale": 1.0, "norm": -2.0}, {"shift": 0.5}, {"scale": 0.0}]
+            directions = np.array([[1.0, 0.0, -2.0], [0.0, 0.5, 0.0], [0.0, 0.0, 0.0]]).T
+            for name in ["weight", "total"]:
+                res = the_store.get_prop(name, self.seeded(), tangents=tangents)
+                self.assertEqual(list(res.grads), ["#tangent0", "#tangent1", "#tangent2"])
+                expected = self.full_gradient(the_store, name) @ directions
+                np.testing.assert_allclose(np.asarray(res.grad_values), expected)
+
+    def test_array_direction(self):
+        the_store = xs_store()
+        params = {"energy": energy, "scale": 2.0, "shift": np.zeros(5), "norm": 3.0}
+        direction = np.arange(5.0)
+        res = the_store.get_prop("total", params, tangents=[{"shift": direction}])
+        xs = 2.0 * energy ** 0.5
+        np.testing.assert_allclose(np.reshape(res.grad_values, -1), [(direction / xs).sum()])
+
+    def test_independent(self):
+        the_store = xs_store()
+        params = {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0}
+        res = the_store.get_prop("xs", params, tangents=[{"norm": 1.0}])
+        self.assertEqual(np.shape(res.grad_values), (5, 1))
+        self.assertTrue(np.all(np.asarray(res.grad_values) == 0))
+
+    def test_second_order(self):
+        the_store = xs_store()
+        params = {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0}
+        res = the_store.get_prop("total", params, tangents=[{"norm": 1.0}, {"scale": 1.0}], order=2)
+        hess = np.reshape(res.hessian_values, (2, 2))
+        # log(norm xs) has a curvature of -1 / norm ** 2 along norm
+        self.assertAlmostEqual(hess[0, 0], -5.0 / 9.0)
+        self.assertAlmostEqual(hess[0, 1], 0.0)
+
+    def test_invalid(self):
+        the_store = xs_store()
+        params = {"energy": energy, "scale": 2.0, "shift": 0.5, "norm": 3.0}
+        with self.assertRaises(ValueError):
+            the_store.get_prop("total", params, tangents=[{"missing": 1.0}])
+        with self.assertRaises(ValueError):
+            the_store.get_prop("total", params, tangents=[{"norm": 1.0}], mode="reverse")
+
+
+if __name__ == "__main__":
+    unittest.main()
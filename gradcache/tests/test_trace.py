@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from context import gradcache
+import unittest
+
+store = gradcache.store
+parameter_wrapper = gradcache.parameter_wrapper
+trace = gradcache.trace
+node = gradcache.node
+optimize = gradcache.optimize
+
+e = np.linspace(1.0, 2.0, 5)
+
+
+def weight(a, b):
+    x = a * e + 2.0
+    return node.log(x * x) + b / x - a
+
+
+def llh(weight, b):
+    return ((weight - b) ** 2).sum()
+
+
+def repeated(x, mu):
+    # The normal log pdf with the repeated subexpressions of autodiff.normal_log_pdf
+    return -0.5 * node.log(2.0 * np.pi) - ((x - mu) * (x - mu)) / (2.0 * 1.5 ** 2) + (x - mu) * 0.0
+
+
+def untraceable(a, b):
+    # Symbolic parameters do not have values
+    return a * float(np.size(a.value.value)) + b
+
+
+class TraceTest(unittest.TestCase):
+    """Traced function test cases."""
+
+    def test_names(self):
+        t = trace.trace_function("weight", ["a", "b"], weight, fuse_chains=False)
+        self.assertEqual(len(t), 7)
+        self.assertEqual(sorted(t.constants.keys()), ["#weight:const0", "#weight:const1"])
+        self.assertTrue(t.result.startswith("#weight:value"))
+        self.assertIsNone(trace.trace_function("f", ["a", "b"], untraceable))
+
+    def test_passes(self):
+        steps = [
+            ("#f:value0", "plus", ["#f:const0", "#f:const1"]),
+            ("#f:value1", "mul", ["a", "#f:value0"]),
+            ("#f:value2", "mul", ["a", "#f:const2"]),
+            ("#f:value3", "minus", ["#f:value1", "#f:value2"]),
+            ("#f:value4", "log", ["a"]),
+        ]
+        constants = {"#f:const0": 1.0, "#f:const1": 2.0, "#f:const2": 3.0}
+        steps, constants, result, report = optimize.optimize("f", steps, constants, "#f:value3")
+        # 1 + 2 is folded into a constant equal to 3, a * 3 is then computed once
+        self.assertEqual(report, {"nodes": 8, "fold": 1, "cse": 2, "dead": 3, "remaining": 3})
+        self.assertEqual([s[1] for s in steps], ["mul", "minus"])
+        self.assertEqual(steps[1][2], [steps[0][0], steps[0][0]])
+        self.assertEqual(list(constants.values()), [3.0])
+
+    def test_common_subexpressions(self):
+        t = trace.trace_function("llh", ["x", "mu"], repeated, fuse_chains=False)
+        self.assertGreater(t.report["cse"], 0)
+        plain = trace.trace_function("llh", ["x", "mu"], repeated, optimize_graph=False, fuse_chains=False)
+        self.assertLess(len(t), len(plain))
+        x = parameter_wrapper("x", np.linspace(0.0, 1.0, 4), grads=["x"], grad_values=np.ones((4, 1)))
+        mu = parameter_wrapper("mu", 0.3, grads=["mu"], grad_values=[1.0])
+        res = t(x, mu)
+        expected = plain(x, mu)
+        self.assertTrue(np.allclose(res.value, expected.value))
+        self.assertTrue(np.allclose(res.grad_values, expected.grad_values))
+
+    def test_replay(self):
+        t = trace.trace_function("weight", ["a", "b"], weight)
+        a = parameter_wrapper("a", 0.5, grads=["a"], grad_values=[1.0])
+        b = parameter_wrapper("b", np.ones(5), grads=["b"], grad_values=np.ones((5, 1)))
+        expected = weight(node.Parameter("a", a), node.Parameter("b", b)).value
+        for _ in range(2):
+            res = t(a, b)
+            self.assertEqual(list(res.grads), list(expected.grads))
+            self.assertTrue(np.allclose(res.value, expected.value))
+            self.assertTrue(np.allclose(res.grad_values, expected.grad_values))
+
+    def test_layouts(self):
+        t = trace.trace_function("weight", ["a", "b"], weight, fuse_chains=False)
+        a = parameter_wrapper("a", 0.5, grads=["a"], grad_values=[1.0])
+        b = parameter_wrapper("b", np.ones(5), grads=["b"], grad_values=np.ones((5, 1)))
+        sift = gradcache.operators.sift_parameters
+        calls = []
+
+        def counted(params):
+            calls.append(1)
+            return sift(params)
+
+        gradcache.operators.sift_parameters = counted
+        try:
+            first = t(a, b)
+            n = len(calls)
+            self.assertTrue(n > 0)
+            res = t(a, b)
+            # The layouts of every step are resolved by the first evaluation
+            self.assertEqual(len(calls), n)
+            c = parameter_wrapper("c", 0.5, grads=["c"], grad_values=[1.0])
+            t(c, b)
+            self.assertTrue(len(calls) > n)
+        finally:
+            gradcache.operators.sift_parameters = sift
+        self.assertEqual(list(res.grads), list(first.grads))
+        self.assertTrue(np.allclose(res.grad_values, first.grad_values))
+
+    def build(self, trace_functions):
+        the_store = store(trace_functions=trace_functions)
+        the_store.add_prop("weight", ["a", "b"], weight)
+        the_store.add_prop("llh", ["weight", "b"], llh)
+        the_store.add_prop("other", ["a", "b"], untraceable)
+        the_store.initialize()
+        return the_store
+
+    def test_store(self):
+        plain = self.build(False)
+        traced = self.build(True)
+        for k in range(3):
+            params = {
+                "a": parameter_wrapper("a", 0.5 + k, grads=["a"], grad_values=[1.0]),
+                "b": parameter_wrapper("b", 1.5, grads=["b"], grad_values=[1.0]),
+            }
+            for prop in ["llh", "other"]:
+                expected = plain.get_prop(prop, params)
+                res = traced.get_prop(prop, params)
+                self.assertTrue(np.allclose(res.value, expected.value))
+                self.assertTrue(np.allclose(res.grad_values, expected.grad_values))
+        self.assertIsNotNone(traced.props["llh"].grad.trace)
+        self.assertIsNone(traced.props["other"].grad.trace)
+        self.assertEqual(sorted(traced.trace_report().keys()), ["llh", "weight"])
+        # Plain values do not trace
+        self.assertFalse(plain.props["llh"].grad.explored)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+try:
+    from .node import Node, name_nodes, toposort
+    from .operators import operators as ops, operator_site
+    from .optimize import optimize
+    from .fusion import fuse
+except:
+    from node import Node, name_nodes, toposort
+    from operators import operators as ops, operator_site
+    from optimize import optimize
+    from fusion import fuse
+
+# This file compiles prop functions into flat lists of operators.
+#
+# In the default (eager) mode the function of a prop is executed on every
+# gradient evaluation: the arguments are wrapped in Nodes and every operator
+# goes through the Python dispatch of node.build_op. A traced function is
+# instead executed once with symbolic Parameter nodes, which records the
+# computation graph. The graph is named (#root:constN for the constants,
+# #root:valueN for the intermediate values), sorted topologically, simplified
+# by the passes of optimize.py, its elementwise chains are fused (fusion.py),
+# and later evaluations replay the operators directly on the arguments.
+#
+# Tracing assumes the function is a fixed composition of the Node operators.
+# Functions that inspect their arguments (shapes, comparisons, indexing, numpy
+# functions other than the Node methods) fail to trace and are evaluated
+# eagerly instead.
+
+
+class trace:
+    """A prop function recorded as a topologically sorted list of operators
+    steps holds (name, op, operand names) in evaluation order, the operands are
+    the arguments, the constants or the names of earlier steps
+    """
+
+    def __init__(self, root, arg_names, steps, constants, result, report=None, fused=None, source=None):
+        self.root = root
+        self.arg_names = list(arg_names)
+        self.steps = steps
+        self.constants = constants
+        self.result = result
+        # The number of nodes removed by each optimization pass
+        self.report = report
+        # The fused_chain of every step with the op "fused"
+        self.fused = dict() if fused is None else fused
+        self.fuse_chains = fused is not None
+        # The steps, constants and result before fusion
+        self.source = (steps, constants, result) if source is None else source
+        self.compile()
+
+    def compile(self):
+        """Assign a slot to every value and find where each slot is last used"""
+        slots = dict()
+        for i, name in enumerate(self.arg_names):
+            slots[name] = i
+        # Constants take precedence over arguments of the same name (see specialize)
+        offset = len(self.arg_names)
+        for i, name in enumerate(self.constants.keys()):
+            slots[name] = offset + i
+        offset += len(self.constants)
+        for i, (name, op, operands) in enumerate(self.steps):
+            slots[name] = offset + i
+        self.initial = [None] * len(self.arg_names) + list(self.constants.values())
+        self.initial += [None] * len(self.steps)
+
+        # Intermediate values are dropped after their last use, so their memory
+        # is freed as early as in eager mode
+        last_use = dict()
+        for i, (name, op, operands) in enumerate(self.steps):
+            for operand in operands:
+                last_use[operand] = i
+        frees = [[] for _ in self.steps]
+        for name, i in last_use.items():
+            if name != self.result and name not in self.constants:
+                frees[i].append(slots[name])
+
+        self.program = [
+            (self.operator(name, op), slots[name], tuple([slots[o] for o in operands]), tuple(free))
+            for (name, op, operands), free in zip(self.steps, frees)
+        ]
+        self.result_slot = slots[self.result]
+
+    def operator(self, name, op):
+        if op == "fused":
+            return self.fused[name]
+        return operator_site(ops[op])
+
+    def __call__(self, *args):
+        values = list(self.initial)
+        values[: len(args)] = args
+        for f, out, operands, frees in self.program:
+            if len(operands) == 2:
+                values[out] = f(values[operands[0]], values[operands[1]])
+            else:
+                values[out] = f(*[values[i] for i in operands])
+            for i in frees:
+                values[i] = None
+        return values[self.result_slot]
+
+    def specialize(self, values):
+        """A trace with some arguments fixed to the given values
+        The steps that only depend on constants and fixed arguments are computed
+        once, the trace must only be called with the same values for them
+        """
+        steps, constants, result = self.source
+        constants = dict(constants)
+        constants.update([(k, v) for k, v in values.items() if k in self.arg_names])
+        return compile_trace(self.root, self.arg_names, steps, constants, result, self.fuse_chains)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __repr__(self):
+        lines = [str(self.root) + "(" + ", ".join(self.arg_names) + ")"]
+        for name, op, operands in self.steps:
+            lines.append("    " + name + " = " + op + "(" + ", ".join(operands) + ")")
+        lines.append("    return " + self.result)
+        return "\n".join(lines)
+
+
+def trace_function(root_name, arg_names, function, optimize_graph=True, fuse_chains=True):
+    """Trace a function with symbolic parameters, None if it can not be traced"""
+    try:
+        root_node, constants = name_nodes(root_name, arg_names, function)
+    except Exception:
+        return None
+    steps = []
+    for node in reversed(list(toposort(root_node))):
+        if type(node) is Node:
+            steps.append((node.name, node.op, [c.name for c in node.children]))
+    if not optimize_graph:
+        return compile_trace(root_name, arg_names, steps, constants, root_node.name, fuse_chains, False)
+    return compile_trace(root_name, arg_names, steps, constants, root_node.name, fuse_chains)
+
+
+def compile_trace(root_name, arg_names, steps, constants, result, fuse_chains=True, optimize_graph=True):
+    """Optimize and fuse the steps of a traced function"""
+    report = None
+    if optimize_graph:
+        steps, constants, result, report = optimize(root_name, steps, constants, result)
+    source = (steps, constants, result)
+    fused = None
+    if fuse_chains:
+        steps, fused = fuse(steps, result)
+    return trace(root_name, arg_names, steps, constants, result, report, fused, source)
@@ -6,12 +6,14 @@ try:
     from .cache import function_cache
     from .context import function_context, unpacker
     from .gradient import function_gradient
+    from .disk_cache import disk_cache
 except:
     from node import Node
     from parameter_wrapper import parameter_wrapper, sift_parameters
     from cache import function_cache
     from context import function_context, unpacker
     from gradient import function_gradient
+    from disk_cache import disk_cache
 
 
 class function_base:
@@ -27,7 +29,9 @@ class function_wrapper:
     def __init__(self, name, arg_names, function):
         self.fbase = function_base(name, arg_names, function)
         self.grad = function_gradient(self.fbase, callback=function)
-        self.cache = function_cache(unpacker(self.grad), 1)
+        self.compute = unpacker(self.grad)
+        self.disk = None
+        self.cache = function_cache(self.compute, 1)
         self.context = function_context(name, dependents=arg_names)
         self.context.set_callback(self.cache)
 
@@ -56,14 +60,29 @@ class function_wrapper:
     def set_cache_size(self, size):
         self.cache.set_size(size)
 
+    def set_cache_policy(self, policy):
+        self.cache.set_policy(policy)
+
+    def enable_disk_cache(self, directory, version, keys=None):
+        """Persist results on disk behind the in-memory cache"""
+        self.disk = disk_cache(directory, self.name, version, f=self.compute, keys=keys)
+        self.cache.f = self.disk
+
+    def disable_disk_cache(self):
+        self.disk = None
+        self.cache.f = self.compute
+
     def set_context(self, context):
         self.context = context
 
     def set_cache(self, cache):
         self.cache = cache
+        self.context.set_callback(cache)
 
-    def initialize_cache(self):
-        self.cache
+    def initialize_cache(self, cache_size=None, policy=None):
+        self.set_cache_size(cache_size)
+        if policy is not None:
+            self.set_cache_policy(policy)
 
     def determine_context_callback(self,):
         cache_enabled = self.cache.enabled